@@ -1,33 +1,70 @@
 from __future__ import annotations
+import re
 from typing import Optional, Dict, Any, List
+import numpy as np
 from app.blackboard import Blackboard
 from app.logging_setup import get_logger
-from app.models.openai_llm import call_llm, LLMUsage
+from app.models.openai_llm import acall_llm, LLMUsage
 from app.caching.llm_cache import LLMCache
+from app.models.embeddings import embed_array
 from app.config import settings
+from app.utils.hashing import stable_hash
+from app.utils.executor import run_blocking
+
+_shared_caches: Dict[str, LLMCache] = {}
+
+def shared_llm_cache() -> LLMCache:
+    """
+    LLMCache del proceso por `base_dir` efectivo; todos los agentes comparten su pool SQLite.
+    Las claves incluyen el modelo, así que overlays con modelos distintos no se mezclan.
+    """
+    path = settings.base_dir / ".llm_cache.sqlite"
+    cache = _shared_caches.get(str(path))
+    if cache is None:
+        cache = _shared_caches[str(path)] = LLMCache(path)
+    return cache
 
 class BaseAgent:
     name: str = "base"
+    model_setting: Optional[str] = None  # campo de settings con el modelo del agente (p.ej. "model_summary")
 
     def __init__(self, bb: Blackboard, cache: Optional[LLMCache] = None):
         self.bb = bb
         self.log = get_logger(self.name)
-        self.cache = cache or LLMCache(settings.base_dir / ".llm_cache.sqlite")
+        self.cache = cache or shared_llm_cache()
 
     # --- helpers ---
     async def _record_usage(self, usage: LLMUsage):
-        key = "usage_log"
-        log = await self.bb.get(key) or []
-        log.append(usage.model + f"|in={usage.input_tokens}|out={usage.output_tokens}|${usage.cost_usd:.6f}")
-        await self.bb.set(key, log)
+        # append atómico: agentes en paralelo no pisan las entradas de otros
+        await self.bb.append("usage_log", usage.log_line())
 
-    def _cache_get(self, model: str, messages: List[Dict[str, str]], extra: Dict[str, Any] | None = None):
+    async def _cache_get(self, model: str, messages: List[Dict[str, str]], extra: Dict[str, Any] | None = None):
         k = self.cache.key(model, messages, extra)
-        return self.cache.get(k)
+        return await self.cache.aget(k)
 
-    def _cache_set(self, model: str, messages: List[Dict[str, str]], value: Any, extra: Dict[str, Any] | None = None, ttl: int = 3600):
+    async def _cache_set(self, model: str, messages: List[Dict[str, str]], value: Any, extra: Dict[str, Any] | None = None, ttl: int = 3600):
         k = self.cache.key(model, messages, extra)
-        self.cache.set(k, value, ttl)
+        await self.cache.aset(k, value, ttl)
+
+    async def _query_vector(self) -> Optional[np.ndarray]:
+        """Embedding de la query de entrada, calculado una vez y compartido vía blackboard."""
+        vec = await self.bb.get("input_embedding")
+        if vec is None:
+            query = await self.bb.get("input") or ""
+            if not query.strip():
+                return None
+            try:
+                vec = (await run_blocking(embed_array, [query]))[0]
+            except Exception as e:
+                self.log.warning(f"Embedding de la query falló: {e}")
+                return None
+            await self.bb.set("input_embedding", vec)
+        return vec
+
+    @staticmethod
+    def _query_key(query: str, **extra: Any) -> str:
+        """Clave exacta de una query: insensible a mayúsculas y espacios."""
+        return stable_hash({"q": re.sub(r"\s+", " ", query.strip().lower()), **extra})
 
     # --- interface ---
     async def act(self) -> None:
@@ -35,6 +72,9 @@ class BaseAgent:
 
     # --- policy ---
     def choose_model(self, importance: str = "medium", default: Optional[str] = None) -> str:
+        if self.model_setting:
+            # leído en cada llamada: respeta el overlay de settings de la query en curso
+            return getattr(settings, self.model_setting)
         if default:
             return default
         if importance == "high":
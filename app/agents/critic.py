@@ -2,8 +2,10 @@ from __future__ import annotations
 from typing import List, Dict, Any
 from pydantic import ValidationError
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
 from app.guardrails.schemas import CriticVerdict, CriticIssue
+from app.utils.token_budget import fit_sections
+from app.config import settings
 
 SYS = (
     "You are an adversarial critic. Check for: missing citations, contradictions, math errors, and format errors. "
@@ -23,6 +25,7 @@ Evidence:
 
 class CriticAgent(BaseAgent):
     name = "critic"
+    model_setting = "model_critic_first"
 
     async def act(self):
         query = await self.bb.get("input") or ""
@@ -31,12 +34,14 @@ class CriticAgent(BaseAgent):
         web = await self.bb.get("web_snippets") or []
         web_urls = [w.get("url","") for w in web]
 
+        model = self.choose_model(importance="medium", default="gpt-5-mini")
+        ev = fit_sections([("answer", str(draft)), ("rag", str(rag)), ("web_urls", str(web_urls))],
+                          settings.evidence_token_budget, model)
         msgs = [
             {"role": "system", "content": SYS},
-            {"role": "user", "content": TEMPLATE.format(query=query, answer=draft, rag=rag, web_urls=web_urls)},
+            {"role": "user", "content": TEMPLATE.format(query=query, **ev)},
         ]
-        model = self.choose_model(importance="medium", default="gpt-5-mini")
-        text, usage = call_llm(model, msgs, json_object=True, temperature=0.0, max_tokens=600)
+        text, usage = await acall_llm(model, msgs, json_object=True, temperature=0.0, max_tokens=600)
         await self._record_usage(usage)
         try:
             verdict = CriticVerdict.model_validate_json(text)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 from typing import List, Dict, Any
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
+from app.utils.token_budget import fit_sections
+from app.config import settings
 
 SYS = (
     "You are a careful quantitative analyst. If given tables/numbers, compute and check. "
@@ -10,17 +12,21 @@ SYS = (
 
 class DataAnalysisAgent(BaseAgent):
     name = "data"
+    model_setting = "model_data"
 
     async def act(self):
         query = await self.bb.get("input") or ""
         web = await self.bb.get("web_snippets") or []
         rag = await self.bb.get("rag_context") or {}
         vision = await self.bb.get("vision_struct") or {}
+        model = self.choose_model(importance="high", default="gpt-5")
+        ev = fit_sections([("rag", str(rag)), ("web", str(web)), ("vision", str(vision))],
+                          settings.evidence_token_budget, model)
         msgs = [
             {"role": "system", "content": SYS},
-            {"role": "user", "content": f"Question:\n{query}\n\nEvidence:web={web}\nrag={rag}\nvision={vision}\n"}
+            {"role": "user", "content": f"Question:\n{query}\n\nEvidence:web={ev['web']}\nrag={ev['rag']}\nvision={ev['vision']}\n"}
         ]
-        text, usage = call_llm(self.choose_model(importance="high", default="gpt-5"), msgs, json_object=True, temperature=0.0, max_tokens=1000)
+        text, usage = await acall_llm(model, msgs, json_object=True, temperature=0.0, max_tokens=1000)
         await self._record_usage(usage)
         try:
             obj = eval(text) if text.strip().startswith("{") else {"analysis": text, "key_numbers": [], "assumptions": []}
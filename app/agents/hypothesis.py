@@ -1,7 +1,7 @@
 from __future__ import annotations
 from typing import List, Dict, Any
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
 
 SYS = (
     "Generate possible hypotheses or sub-questions as a JSON list of strings. "
@@ -17,7 +17,7 @@ class HypothesisAgent(BaseAgent):
             {"role": "system", "content": SYS},
             {"role": "user", "content": f"Query: {query}\nOutput just a JSON list of short hypotheses."},
         ]
-        text, usage = call_llm(self.choose_model("low"), msgs, json_object=True, temperature=0.4, max_tokens=200)
+        text, usage = await acall_llm(self.choose_model("low"), msgs, json_object=True, temperature=0.4, max_tokens=200)
         await self._record_usage(usage)
         try:
             items = eval(text) if text.strip().startswith("[") else []
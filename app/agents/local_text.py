@@ -1,14 +1,18 @@
 from __future__ import annotations
 from app.agents.base import BaseAgent
-from app.models.local_llm import local_generate
+from app.models.local_llm import build_prompt, get_engine
 
 class LocalTextAgent(BaseAgent):
     name = "local_text"
 
     async def act(self):
         query = await self.bb.get("input") or ""
+        stream = get_engine().stream(build_prompt(query))
         try:
-            out = local_generate(f"Answer briefly and helpfully:\n\n{query}\n")
+            async for _ in stream:
+                pass
+            out = stream.text
+            await self.bb.update("metrics", lambda m: {**(m or {}), "local_llm_ttft_s": stream.ttft})
         except Exception:
             out = "Local model not available."
         await self.bb.set("local_text_result", out.strip())
@@ -5,6 +5,7 @@ from pathlib import Path
 import orjson
 from datetime import datetime
 from app.config import settings
+from app.utils.executor import run_blocking
 
 class MemoryAgent(BaseAgent):
     name = "memory"
@@ -19,5 +20,10 @@ class MemoryAgent(BaseAgent):
         query = await self.bb.get("input") or ""
         answer = await self.bb.get("final_answer") or (await self.bb.get("draft_answer")) or {}
         rec = {"ts": datetime.utcnow().isoformat(), "q": query, "a": answer}
-        self.append(rec)
+        route = await self.bb.get("router_output")
+        if route:
+            # etiqueta para entrenar el router local (ver app.models.local_router)
+            rec["domain"] = route.get("domain")
+            rec["route_source"] = await self.bb.get("router_source") or "llm"
+        await run_blocking(self.append, rec)
         await self.bb.set("memory_last", rec)
@@ -2,8 +2,10 @@ from __future__ import annotations
 from typing import Dict, List
 from pydantic import ValidationError
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
 from app.guardrails.schemas import PlanOutput, PlanStep
+from app.caching.semantic_cache import get_semantic_cache
+from app.config import settings
 
 SYS = (
     "You design multi-agent plans as a DAG. Output strictly JSON matching PlanOutput schema. "
@@ -16,38 +18,72 @@ TEMPLATE = """User query:
 
 Domain: {domain}
 
-Agents available: vision, rag, web_search, data, critic, summary, hypothesis, memory, local_text
+Agents available: {agents}
 
-Design a plan with steps and parallel groups. Include prerequisites in 'requires'."""
+Design a plan with steps and parallel groups. Include prerequisites in 'requires' (names of earlier steps)."""
+
+AGENTS = ["vision", "rag", "web_search", "data", "critic", "summary", "hypothesis", "memory", "local_text"]
 
 class PlannerAgent(BaseAgent):
     name = "planner"
+    model_setting = "model_planner"
+
+    def __init__(self, bb, cache=None, agents: List[str] | None = None):
+        super().__init__(bb, cache)
+        self.agents = list(agents or AGENTS)
 
     async def act(self):
         ro = await self.bb.get("router_output") or {"domain":"general"}
         user_query = await self.bb.get("input") or ""
-        content = TEMPLATE.format(query=user_query, domain=ro.get("domain","general"))
+        domain = ro.get("domain", "general")
+        model = self.choose_model(importance="high", default="gpt-5")
+
+        # Caché de planes: exacta por query y, si no, por similitud. El scope (dominio, agentes,
+        # modelo y prompt) separa los planes de configuraciones distintas (tenants, brazos A/B).
+        plans = get_semantic_cache("planner")
+        scope = self._query_key(SYS + TEMPLATE, domain=domain, agents=self.agents, model=model)
+        key = self._query_key(user_query, scope=scope)
+        vec = await self._query_vector()
+        hit = plans.get(key, vec, scope=scope, threshold=settings.semantic_cache_threshold)
+        if hit:
+            self.log.info(f"Plan desde caché (sim={hit[1]:.3f}).")
+            plan = PlanOutput.model_validate(hit[0])
+        else:
+            plan = await self._plan(user_query, domain, model)
+            if plan is not None:
+                plans.put(key, plan.model_dump(), vec, scope=scope)
+            else:
+                plan = self._fallback_plan()
+        await self.bb.set("plan", plan.model_dump())
+        await self.bb.set("plan_layers", self._layers(plan))
+
+    async def _plan(self, user_query: str, domain: str, model: str) -> PlanOutput | None:
+        content = TEMPLATE.format(query=user_query, domain=domain, agents=", ".join(self.agents))
         msgs = [
             {"role": "system", "content": SYS},
             {"role": "user", "content": content},
         ]
-        model = self.choose_model(importance="high", default="gpt-5")
-        text, usage = call_llm(model, msgs, json_object=True, temperature=0.2, max_tokens=900)
+        text, usage = await acall_llm(model, msgs, json_object=True, temperature=0.2, max_tokens=900)
         await self._record_usage(usage)
         try:
-            plan = PlanOutput.model_validate_json(text)
+            return PlanOutput.model_validate_json(text)
         except ValidationError:
-            # Fallback determinista
-            steps = [
-                PlanStep(name="gather", agents=["rag","web_search"], requires=[]).model_dump(),
-                PlanStep(name="analyze", agents=["data"], requires=["gather"]).model_dump(),
-                PlanStep(name="draft", agents=["summary"], requires=["gather","analyze"]).model_dump(),
-                PlanStep(name="critique", agents=["critic"], requires=["draft"]).model_dump(),
-                PlanStep(name="finalize", agents=["summary"], requires=["critique"]).model_dump(),
-            ]
-            plan = PlanOutput(steps=[PlanStep(**s) for s in steps], stop_condition="final_answer")
-        await self.bb.set("plan", plan.model_dump())
+            return None
+
+    @staticmethod
+    def _fallback_plan() -> PlanOutput:
+        # Fallback determinista
+        steps = [
+            PlanStep(name="gather", agents=["rag","web_search"], requires=[]).model_dump(),
+            PlanStep(name="analyze", agents=["data"], requires=["gather"]).model_dump(),
+            PlanStep(name="draft", agents=["summary"], requires=["gather","analyze"]).model_dump(),
+            PlanStep(name="critique", agents=["critic"], requires=["draft"]).model_dump(),
+            PlanStep(name="finalize", agents=["summary"], requires=["critique"]).model_dump(),
+        ]
+        return PlanOutput(steps=[PlanStep(**s) for s in steps], stop_condition="final_answer")
 
+    @staticmethod
+    def _layers(plan: PlanOutput) -> List[List[str]]:
         # Derivar "plan_layers" (lista de capas paralelas por parallel_group o por orden)
         layers: List[List[str]] = []
         # Construcción simple: si parallel_group existe, agrupa por ese nombre en orden de aparición
@@ -61,4 +97,4 @@ class PlannerAgent(BaseAgent):
             groups[pg].extend(s.agents)
         for g in order:
             layers.append(groups[g])
-        await self.bb.set("plan_layers", layers)
+        return layers
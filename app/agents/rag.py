@@ -4,8 +4,12 @@ from pydantic import ValidationError
 from app.agents.base import BaseAgent
 from app.guardrails.schemas import RAGPassage, RAGOutput
 from app.rag.vectorstore import SimpleFAISS
-from app.rag.chunking import chunk_text
+from app.rag.ingest import sync_directory
+from app.rag.index_service import get_index_service
+from app.rag.hybrid import retrieve
+from app.rag.rerank import merge_adjacent, mmr
 from app.config import settings
+from app.utils.executor import run_blocking
 from pathlib import Path
 import orjson
 
@@ -14,40 +18,61 @@ class RAGAgent(BaseAgent):
 
     def __init__(self, bb, cache=None, corpus_dir: Path | None = None):
         super().__init__(bb, cache)
-        self.vs = SimpleFAISS(settings.vectorstore_dir)
         self.corpus_dir = corpus_dir or (settings.base_dir / "corpus")
-        # Lazy load if exists
-        try:
-            self.vs.load("default")
-        except Exception:
-            pass
-
-    def ingest_directory(self):
-        if not self.corpus_dir.exists():
-            return
-        texts, metas = [], []
-        for p in self.corpus_dir.rglob("*"):
-            if p.suffix.lower() not in {".txt", ".md"}:
-                continue
-            txt = p.read_text(encoding="utf-8", errors="ignore")
-            for ch in chunk_text(txt, target_tokens=1200):
-                texts.append(ch)
-                metas.append({"source": str(p)})
-        if texts:
-            self.vs.add_texts(texts, metas)
-            self.vs.save("default")
+        # índice compartido del proceso: sin recarga desde disco por query
+        self.index_service = get_index_service("default")
+
+    @property
+    def vs(self) -> SimpleFAISS | None:
+        return self.index_service.get()
+
+    def ingest_directory(self, full: bool = False):
+        """Ingesta incremental: solo re-embebe ficheros nuevos/modificados (ver app.rag.ingest)."""
+        with self.index_service.build_lock:
+            # copia escribible (la del servicio está mapeada en solo lectura)
+            vs = SimpleFAISS(self.index_service.persist_dir)
+            try:
+                vs.load("default")
+            except Exception:
+                # sin índice legible: sync_directory ignora el manifest y reconstruye
+                vs = SimpleFAISS(self.index_service.persist_dir)
+            stats = sync_directory(vs, self.corpus_dir, name="default", full=full)
+        self.index_service.invalidate()
+        return stats
+
+    async def _rerank(self, vs: SimpleFAISS, hits: List[Tuple[int, float]]) -> List[Tuple[str, dict, float]]:
+        """
+        MMR sobre los vectores guardados en el índice (sin llamadas de red) para no gastar el
+        presupuesto de evidencia en casi-duplicados; después une los chunks contiguos de una fuente.
+        """
+        cands = hits[:settings.rag_rerank_candidates]
+        k = settings.rag_top_k
+        vecs = None
+        if settings.rag_mmr_lambda < 1 and len(cands) > k:
+            vecs = await run_blocking(vs.vectors, [i for i, _ in cands], pool="cpu")
+        if vecs is not None:
+            picked = [cands[j] for j in mmr([s for _, s in cands], vecs, k, settings.rag_mmr_lambda)]
+        else:
+            picked = cands[:k]
+        return merge_adjacent(vs.fetch(picked))
 
     async def act(self):
+        vs = await run_blocking(self.index_service.get)  # carga/recarga del índice: E/S de disco
         # build if empty
-        if self.vs.index is None:
-            self.ingest_directory()
+        if vs is None:
+            # incremental y serializado: si otra query ya lo construyó, no re-embebe nada
+            await run_blocking(self.ingest_directory)
+            vs = await run_blocking(self.index_service.get)
 
         query = await self.bb.get("input") or ""
-        results = self.vs.search(query, k=20) if self.vs.index else []
-        # Simple rerank by score (already IP), keep top 5
-        top = results[:5]
+        hits = []
+        if vs is not None and vs.index is not None and query.strip():
+            mode = settings.rag_retrieval
+            vec = await self._query_vector() if mode != "sparse" else None
+            hits = await retrieve(vs, query, settings.rag_candidates, mode, vec, settings.rag_rrf_k)
+        top = await self._rerank(vs, hits) if hits else []
         passages = [
-            RAGPassage(source=m.get("source","unknown"), text=t) for (t, m, _d) in top
+            RAGPassage(source=m.get("source","unknown"), span=m.get("span"), text=t) for (t, m, _d) in top
         ]
         out = RAGOutput(passages=passages)
         await self.bb.set("rag_context", out.model_dump())
@@ -1,17 +1,24 @@
 from __future__ import annotations
-from typing import Dict, List
+from typing import Dict, List, get_args
 from pydantic import ValidationError
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
 from app.guardrails.schemas import RouterOutput
+from app.caching.semantic_cache import get_semantic_cache
+from app.models.local_router import get_local_router
+from app.config import settings
+from app.utils.executor import run_blocking
 
 SYS = (
     "You are a routing expert. Classify the user's query into a domain and suggest agents. "
     "Always output a strict JSON object matching the RouterOutput schema."
 )
 
+DOMAINS = get_args(RouterOutput.model_fields["domain"].annotation)
+
 class RouterAgent(BaseAgent):
     name = "router"
+    model_setting = "model_router"
 
     async def act(self):
         user_query = await self.bb.get("input") or ""
@@ -20,12 +27,30 @@ class RouterAgent(BaseAgent):
             {"role": "user", "content": f"Query:\n{user_query}\n\nOutput fields: domain, confidence, suggested_agents"},
         ]
         model = self.choose_model(importance="low", default="gpt-5-nano")
-        cached = self._cache_get(model, msgs)
+        cached = await self._cache_get(model, msgs)
         if cached:
             await self.bb.set("router_output", cached[0])
+            await self.bb.set("router_source", "cache")
+            return
+        # queries casi idénticas se enrutan igual: acierto por similitud en memoria (por modelo y prompt)
+        semantic = get_semantic_cache("router")
+        scope = self._query_key(SYS, model=model)
+        key = self._query_key(user_query, scope=scope)
+        vec = await self._query_vector()
+        hit = semantic.get(key, vec, scope=scope, threshold=settings.semantic_cache_threshold)
+        if hit:
+            self.log.info(f"Router desde caché semántica (sim={hit[1]:.3f}).")
+            await self.bb.set("router_output", hit[0])
+            await self.bb.set("router_source", "cache")
             return
+        if settings.router_mode == "local":
+            local = await self._classify_local(user_query, vec)
+            if local is not None:
+                await self.bb.set("router_output", local.model_dump())
+                await self.bb.set("router_source", "local")
+                return
 
-        text, usage = call_llm(model, msgs, json_object=True, temperature=0.1, max_tokens=300)
+        text, usage = await acall_llm(model, msgs, json_object=True, temperature=0.1, max_tokens=300)
         try:
             out = RouterOutput.model_validate_json(text)
         except ValidationError:
@@ -33,4 +58,23 @@ class RouterAgent(BaseAgent):
             out = RouterOutput(domain="general", confidence=0.6, suggested_agents=["planner"])
         await self._record_usage(usage)
         await self.bb.set("router_output", out.model_dump())
-        self._cache_set(model, msgs, out.model_dump(), ttl=1800)
+        await self.bb.set("router_source", "llm")
+        await self._cache_set(model, msgs, out.model_dump(), ttl=1800)
+        semantic.put(key, out.model_dump(), vec, scope=scope)
+
+    async def _classify_local(self, query: str, vec) -> RouterOutput | None:
+        """Dominio por el clasificador local; None (escalar al LLM) si no hay modelo o duda."""
+        try:
+            clf = await run_blocking(get_local_router)
+            pred = await run_blocking(clf.predict, query, vec, pool="cpu")
+        except Exception as e:
+            self.log.warning(f"Router local falló: {e}")
+            return None
+        if pred is None:
+            return None
+        domain, conf = pred
+        if conf < settings.router_local_threshold or domain not in DOMAINS:
+            self.log.info(f"Router local dudoso ({domain}, conf={conf:.2f}); escalando al LLM.")
+            return None
+        self.log.info(f"Router local: {domain} (conf={conf:.2f}).")
+        return RouterOutput(domain=domain, confidence=conf, suggested_agents=["planner"])
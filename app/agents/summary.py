@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Tuple
 from pydantic import ValidationError
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm, astream_llm, LLMUsage
 from app.guardrails.schemas import SummaryOutput
 from app.logging_setup import get_logger
+from app.utils.token_budget import fit_sections
+from app.config import settings
 
 log = get_logger("summary")
 
@@ -15,8 +18,76 @@ SYS = (
 
 TEMPLATE = """Question:\n{query}\n\nEvidence (trimmed):\nRAG snippets: {rag}\nWeb snippets: {web}\nVision: {vision}\nAnalysis: {analysis}\n\nInstructions:\n- Provide a concise but complete answer.\n- Cite up to 5 supporting sources (filenames or URLs).\n- If evidence insufficient, state limitations.\n"""
 
+# Respuesta de relleno cuando el modelo no devuelve nada (no se guarda en la caché de respuestas)
+NO_ANSWER = "No answer generated."
+
+_ANSWER_FIELD = re.compile(r'"final_answer"\s*:\s*"')
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+class _AnswerDeltas:
+    """
+    Convierte los deltas crudos del modelo en texto visible: si la salida es JSON, emite solo
+    el contenido de `final_answer` (desescapado) a medida que llega; si no, pasa el texto tal cual.
+    """
+    def __init__(self):
+        self.buf = ""
+        self.i = 0
+        self.mode = ""  # "" indeciso | raw | seek | in | done
+
+    def feed(self, delta: str) -> str:
+        self.buf += delta
+        if not self.mode:
+            head = self.buf.lstrip()
+            if not head:
+                return ""
+            self.mode = "seek" if head.startswith("{") else "raw"
+            if self.mode == "raw":
+                return self.buf
+        if self.mode == "raw":
+            return delta
+        if self.mode == "seek":
+            m = _ANSWER_FIELD.search(self.buf, self.i)
+            if not m:
+                return ""
+            self.i, self.mode = m.end(), "in"
+        if self.mode != "in":
+            return ""
+        out: List[str] = []
+        buf, j = self.buf, self.i
+        while j < len(buf):
+            c = buf[j]
+            if c == '"':
+                self.mode = "done"
+                j += 1
+                break
+            if c != "\\":
+                out.append(c)
+                j += 1
+                continue
+            if j + 1 >= len(buf):
+                break  # escape partido entre deltas
+            e = buf[j + 1]
+            if e != "u":
+                out.append(_ESCAPES.get(e, e))
+                j += 2
+                continue
+            if j + 6 > len(buf):
+                break
+            cp = int(buf[j + 2:j + 6], 16)
+            if 0xD800 <= cp < 0xDC00:  # par sustituto (emoji, etc.)
+                if j + 12 > len(buf):
+                    break
+                low = int(buf[j + 8:j + 12], 16)
+                cp = 0x10000 + ((cp - 0xD800) << 10) + (low - 0xDC00)
+                j += 6
+            out.append(chr(cp))
+            j += 6
+        self.i = j
+        return "".join(out)
+
 class SummaryAgent(BaseAgent):
     name = "summary"
+    model_setting = "model_summary"
 
     async def act(self):
         query = await self.bb.get("input") or ""
@@ -32,13 +103,15 @@ class SummaryAgent(BaseAgent):
         web_trim = [{"url": w.get("url",""), "summary": (w.get("summary") or "")[:220]} for w in web[:5]]
         vision = await self.bb.get("vision_struct") or {}
         analysis = await self.bb.get("analysis_numeric") or {}
+        model = self.choose_model(importance="medium", default="gpt-5-mini")
+        ev = fit_sections([("rag", str(rag_trim)), ("web", str(web_trim)), ("vision", str(vision)), ("analysis", str(analysis))],
+                          settings.evidence_token_budget, model)
         msgs = [
             {"role": "system", "content": SYS},
-            {"role": "user", "content": TEMPLATE.format(query=query, rag=rag_trim, web=web_trim, vision=vision, analysis=analysis)},
+            {"role": "user", "content": TEMPLATE.format(query=query, **ev)},
         ]
-        model = self.choose_model(importance="medium", default="gpt-5-mini")
         # Avoid json_object True (was causing empty responses); let model free-form.
-        text, usage = call_llm(model, msgs, json_object=False, temperature=0.2, max_tokens=400)
+        text, usage = await self._complete(model, msgs)
         await self._record_usage(usage)
 
         parsed: SummaryOutput | None = None
@@ -50,12 +123,11 @@ class SummaryAgent(BaseAgent):
                 except ValidationError as e:
                     log.warning(f"JSON validation failed; using raw text. Error: {e}")
         else:
-            raw = "No answer generated."
+            raw = NO_ANSWER
 
         if parsed is None:
             # Extract citations heuristically (URLs or filenames inside parentheses / after http)
             cands: List[str] = []
-            import re
             for m in re.findall(r"https?://\S+", raw):
                 cands.append(m.rstrip(').,;'))
             if not cands:
@@ -68,3 +140,38 @@ class SummaryAgent(BaseAgent):
             current_final = await self.bb.get("final_answer")
             if not current_final or not str(current_final).strip():
                 await self.bb.set("final_answer", parsed.final_answer.strip())
+
+    async def _complete(self, model: str, msgs: List[Dict[str, str]]) -> Tuple[str, LLMUsage]:
+        """
+        Si esta pasada va a producir la respuesta final, la genera en streaming y publica los
+        deltas visibles como `answer_delta` en el blackboard. Ante error o salida vacía, vuelve
+        a la llamada completa (los consumidores reciben igualmente la respuesta definitiva); el
+        usage del stream descartado se anota igualmente. Si ya había texto publicado, se publica
+        `answer_reset` para que los clientes lo descarten.
+        """
+        if settings.summary_stream and not await self.bb.get("final_answer"):
+            stream = astream_llm(model, msgs, temperature=0.2, max_tokens=400)
+            visible = _AnswerDeltas()
+            published = False
+            try:
+                async for delta in stream:
+                    shown = visible.feed(delta)
+                    if shown:
+                        self.bb.publish("answer_delta", shown)
+                        published = True
+            except Exception as e:
+                log.warning(f"Streaming falló ({e}); usando llamada completa.")
+                if stream.usage is not None:
+                    await self.bb.append("usage_log", stream.usage.log_line() + "|failed")
+                if published:
+                    self.bb.publish("answer_reset", "stream_failed")
+            else:
+                if stream.text.strip():
+                    await self.bb.update("metrics", lambda m: {**(m or {}), "summary_llm_ttft_s": stream.ttft})
+                    return stream.text, stream.usage
+                log.warning("Streaming sin texto; usando llamada completa.")
+                if stream.usage is not None:  # la entrada se pagó igualmente
+                    await self.bb.append("usage_log", stream.usage.log_line() + "|empty")
+                if published:
+                    self.bb.publish("answer_reset", "stream_empty")
+        return await acall_llm(model, msgs, json_object=False, temperature=0.2, max_tokens=400)
@@ -2,10 +2,10 @@ from __future__ import annotations
 from typing import Dict, Any, List
 from pydantic import ValidationError
 from app.agents.base import BaseAgent
-from app.models.openai_llm import call_llm_mm
+from app.models.openai_llm import acall_llm_mm
 from app.guardrails.schemas import VisionStruct
 from app.config import settings
-from app.models.openai_llm import call_llm
+from app.models.openai_llm import acall_llm
 
 SYS = (
     "You analyze an image and return a strict JSON with fields: contains_chart, contains_text, any_numbers, "
@@ -33,7 +33,7 @@ class VisionAgent(BaseAgent):
         # try gpt-5 vision → fallback gpt-4o
         for model in (settings.model_vision, settings.model_vision_fallback):
             try:
-                text, usage = call_llm_mm(model, parts, json_object=True, temperature=0.1, max_tokens=500)
+                text, usage = await acall_llm_mm(model, parts, json_object=True, temperature=0.1, max_tokens=500)
                 self.log.info(f"Vision via {model}")
                 await self._record_usage(usage)
                 out = VisionStruct.model_validate_json(text)
@@ -48,7 +48,7 @@ class VisionAgent(BaseAgent):
             {"role": "system", "content": SYS},
             {"role": "user", "content": "No vision available; reply with contains_text=false unless certain."},
         ]
-        text, usage = call_llm(settings.model_local_fallback, msgs, json_object=True)
+        text, usage = await acall_llm(settings.model_local_fallback, msgs, json_object=True)
         await self._record_usage(usage)
         try:
             out = VisionStruct.model_validate_json(text)
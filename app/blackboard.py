@@ -1,24 +1,92 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 import asyncio
+from app.logging_setup import get_logger
+
+log = get_logger("blackboard")
+
+Subscriber = Callable[[str, Any, int], None]
 
 class Blackboard:
-    """Thread-safe / async-safe store."""
+    """
+    Store compartido por los agentes de una query, versionado por clave.
+    Pensado para un único event loop: ninguna operación tiene puntos de `await` internos,
+    así que cada una es atómica sin locks (incluidos `append`/`update`, que son read-modify-write).
+    `wait_for` / `subscribe` permiten reaccionar en el momento en que se escribe una clave.
+    """
     def __init__(self):
         self._store: Dict[str, Any] = {}
-        self._lock = asyncio.Lock()
+        self._versions: Dict[str, int] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._subs: Dict[str, List[Subscriber]] = {}
+
+    def _notify(self, key: str, value: Any, version: int) -> None:
+        for cb in list(self._subs.get(key, [])):
+            try:
+                cb(key, value, version)
+            except Exception as e:
+                log.warning(f"Subscriber for '{key}' failed: {e}")
 
-    async def set(self, key: str, value: Any) -> None:
-        async with self._lock:
-            self._store[key] = value
+    def _bump(self, key: str, value: Any) -> int:
+        self._store[key] = value
+        v = self._versions.get(key, 0) + 1
+        self._versions[key] = v
+        for fut in self._waiters.pop(key, []):
+            if not fut.done():
+                fut.set_result(value)
+        self._notify(key, value, v)
+        return v
+
+    async def set(self, key: str, value: Any) -> int:
+        """Escribe y devuelve la nueva versión de la clave."""
+        return self._bump(key, value)
 
     async def get(self, key: str) -> Optional[Any]:
-        async with self._lock:
-            return self._store.get(key)
+        return self._store.get(key)
 
     async def exists(self, key: str) -> bool:
-        async with self._lock:
-            return key in self._store
+        return key in self._store
 
     async def dump(self) -> Dict[str, Any]:
-        async with self._lock:
-            return dict(self._store)
+        return dict(self._store)
+
+    def version(self, key: str) -> int:
+        """0 si la clave nunca se escribió."""
+        return self._versions.get(key, 0)
+
+    async def append(self, key: str, item: Any) -> int:
+        """Añade a la lista de `key` (la crea si no existe) sin perder escrituras concurrentes."""
+        current = self._store.get(key)
+        return self._bump(key, (list(current) if current else []) + [item])
+
+    async def update(self, key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+        """Read-modify-write atómico: `fn(valor_actual)` (síncrona) produce el nuevo valor."""
+        value = fn(self._store.get(key, default))
+        self._bump(key, value)
+        return value
+
+    async def wait_for(self, key: str, timeout: Optional[float] = None) -> Any:
+        """Devuelve el valor en cuanto la clave exista (inmediato si ya existe)."""
+        if key in self._store:
+            return self._store[key]
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+
+    def publish(self, key: str, value: Any) -> None:
+        """Evento efímero (p.ej. deltas de la respuesta): avisa a los suscriptores sin guardar ni versionar."""
+        self._notify(key, value, 0)
+
+    def subscribe(self, key: str, callback: Subscriber) -> Callable[[], None]:
+        """`callback(key, value, version)` en cada escritura de `key`. Devuelve la función para desuscribirse."""
+        self._subs.setdefault(key, []).append(callback)
+
+        def unsubscribe():
+            subs = self._subs.get(key, [])
+            if callback in subs:
+                subs.remove(callback)
+        return unsubscribe
@@ -1,7 +1,10 @@
 from pathlib import Path
+from typing import Dict, List
+import numpy as np
 from .sqlite_kv import SQLiteKV
 
 class EmbeddingsCache:
+    """Caché por texto: un vector float32 por clave, guardado como blob binario."""
     def __init__(self, path: Path):
         self.db = SQLiteKV(path)
 
@@ -10,3 +13,17 @@ class EmbeddingsCache:
 
     def set(self, k: str, v, ttl: int = 365*24*3600):
         self.db.set(k, v, ttl)
+
+    async def aget(self, k: str):
+        return await self.db.aget(k)
+
+    async def aset(self, k: str, v, ttl: int = 365*24*3600):
+        await self.db.aset(k, v, ttl)
+
+    def get_vectors(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        blobs = self.db.get_many_raw(keys)
+        return {k: np.frombuffer(b, dtype=np.float32) for k, b in blobs.items()}
+
+    def set_vectors(self, vecs: Dict[str, np.ndarray], ttl: int = 365*24*3600):
+        for k, v in vecs.items():
+            self.db.set_raw(k, np.asarray(v, dtype=np.float32).tobytes(), ttl)
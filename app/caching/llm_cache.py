@@ -15,3 +15,9 @@ class LLMCache:
 
     def set(self, k: str, v: Any, ttl: int = 3600):
         self.db.set(k, v, ttl)
+
+    async def aget(self, k: str):
+        return await self.db.aget(k)
+
+    async def aset(self, k: str, v: Any, ttl: int = 3600):
+        await self.db.aset(k, v, ttl)
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from app.config import settings
+
+class SemanticCache:
+    """
+    Caché en memoria de resultados por query, con LRU (`max_entries`) y TTL.
+    Busca primero por clave exacta y, si falla y hay vector, por similitud coseno del embedding
+    de la query contra las entradas del mismo `scope` (≥ `threshold`). Lo que hace incompatibles
+    dos resultados (modelo, prompt, lista de agentes, overrides) va en el `scope`, no en un
+    estado global: queries concurrentes con configuraciones distintas no se pisan.
+    """
+    def __init__(self, max_entries: int = 512, ttl: float = 86400, threshold: float = 0.92,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._clock = clock
+        # clave → (scope, vector normalizado o None, valor, expira)
+        self._entries: "OrderedDict[str, Tuple[str, Optional[np.ndarray], Any, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @staticmethod
+    def _unit(vec: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if vec is None:
+            return None
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        n = float(np.linalg.norm(v))
+        return v / n if n else None
+
+    def _purge(self, now: float) -> None:
+        for k in [k for k, e in self._entries.items() if e[3] <= now]:
+            del self._entries[k]
+
+    def get(self, key: str, vec: Optional[np.ndarray] = None, scope: str = "",
+            threshold: Optional[float] = None) -> Optional[Tuple[Any, float]]:
+        """(valor, similitud) o None. Un acierto exacto tiene similitud 1.0."""
+        threshold = self.threshold if threshold is None else threshold
+        now = self._clock()
+        hit = self._entries.get(key)
+        if hit is not None and hit[3] > now and hit[0] == scope:
+            self._entries.move_to_end(key)
+            return hit[2], 1.0
+        q = self._unit(vec)
+        if q is None or threshold >= 1:
+            return None
+        self._purge(now)
+        cands = [(k, e[1]) for k, e in self._entries.items() if e[0] == scope and e[1] is not None and e[1].shape == q.shape]
+        if not cands:
+            return None
+        sims = np.stack([v for _, v in cands]) @ q
+        best = int(np.argmax(sims))
+        if sims[best] < threshold:
+            return None
+        k = cands[best][0]
+        self._entries.move_to_end(k)
+        return self._entries[k][2], float(sims[best])
+
+    def put(self, key: str, value: Any, vec: Optional[np.ndarray] = None, scope: str = "",
+            ttl: Optional[float] = None) -> None:
+        """`ttl` sustituye al de la caché para esta entrada (p.ej. según el dominio)."""
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (scope, self._unit(vec), value, self._clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+_caches: Dict[str, SemanticCache] = {}
+
+def get_semantic_cache(name: str) -> SemanticCache:
+    """Instancia del proceso por nombre ("router", "planner", "answer"), configurada desde settings."""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = SemanticCache(
+            max_entries=settings.semantic_cache_size,
+            ttl=settings.semantic_cache_ttl,
+            threshold=settings.semantic_cache_threshold,
+        )
+    return cache
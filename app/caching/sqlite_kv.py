@@ -1,37 +1,174 @@
+import atexit
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import time
 import orjson
+from app.logging_setup import get_logger
+from app.utils.executor import run_blocking
+
+log = get_logger("sqlite_kv")
+
+# Pragmas para caché: WAL (lectores concurrentes + un escritor), fsync relajado, espera ante locks.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+class _SQLitePool:
+    """
+    Pool de conexiones por fichero, compartido por todo el proceso.
+    Las escrituras se acumulan en memoria y se confirman en grupo (una transacción)
+    al llegar a `batch_size` o tras `flush_interval` segundos.
+    """
+    def __init__(self, path: Path, size: int = 4, batch_size: int = 64, flush_interval: float = 0.5):
+        self.path = path
+        self.size = size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # un commit de lote a la vez
+        # k -> (v_bytes, ttl, ts) o None (borrado pendiente)
+        self._pending: Dict[str, Optional[Tuple[bytes, int, int]]] = {}
+        self._inflight: Dict[str, Optional[Tuple[bytes, int, int]]] = {}  # lote en commit
+        self._timer: Optional[threading.Timer] = None
+        with self.connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                k TEXT PRIMARY KEY,
+                v BLOB NOT NULL,
+                ttl INTEGER NOT NULL,
+                ts INTEGER NOT NULL
+            )
+            """)
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5.0)
+        for p in _PRAGMAS:
+            conn.execute(p)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    # --- write-behind buffer ---
+    def pending(self, k: str) -> Tuple[bool, Optional[Tuple[bytes, int, int]]]:
+        with self._lock:
+            if k in self._pending:
+                return True, self._pending[k]
+            if k in self._inflight:
+                return True, self._inflight[k]
+        return False, None
+
+    def stage(self, k: str, row: Optional[Tuple[bytes, int, int]]) -> bool:
+        """Encola la escritura. Devuelve True si el lote está lleno y hay que hacer flush()."""
+        with self._lock:
+            self._pending[k] = row
+            full = len(self._pending) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return full
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not batch:
+                return
+            upserts = [(k, *row) for k, row in batch.items() if row is not None]
+            deletes = [(k,) for k, row in batch.items() if row is None]
+            try:
+                with self.connection() as conn:
+                    with conn:  # una sola transacción para todo el lote
+                        if upserts:
+                            conn.executemany("REPLACE INTO kv (k, v, ttl, ts) VALUES (?, ?, ?, ?)", upserts)
+                        if deletes:
+                            conn.executemany("DELETE FROM kv WHERE k= ?", deletes)
+            except sqlite3.Error as e:
+                # el lote vuelve a la cola (salvo claves reescritas desde entonces) y se reintenta
+                with self._lock:
+                    for k, row in batch.items():
+                        self._pending.setdefault(k, row)
+                    if self._timer is None:
+                        self._timer = threading.Timer(self.flush_interval, self.flush)
+                        self._timer.daemon = True
+                        self._timer.start()
+                log.warning(f"Flush de {len(batch)} escrituras en {self.path.name} falló ({e}); se reintentará")
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+    def close(self) -> None:
+        self.flush()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+_pools: Dict[str, _SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path: Path) -> _SQLitePool:
+    """Devuelve el pool compartido del proceso para `path` (lo crea la primera vez)."""
+    key = str(Path(path).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _SQLitePool(Path(key))
+        return pool
+
+@atexit.register
+def flush_all() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for p in pools:
+        p.flush()
 
 class SQLiteKV:
+    """KV con TTL sobre SQLite. Instancias con el mismo `path` comparten pool y buffer de escritura."""
     def __init__(self, path: Path):
         self.path = path
-        self.conn = sqlite3.connect(str(path))
-        self._init()
-
-    def _init(self):
-        cur = self.conn.cursor()
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS kv (
-            k TEXT PRIMARY KEY,
-            v BLOB NOT NULL,
-            ttl INTEGER NOT NULL,
-            ts INTEGER NOT NULL
-        )
-        """)
-        self.conn.commit()
+        self.pool = get_pool(path)
 
     def set(self, k: str, v, ttl: int = 3600):
-        cur = self.conn.cursor()
-        cur.execute("REPLACE INTO kv (k, v, ttl, ts) VALUES (?, ?, ?, ?)",
-                    (k, orjson.dumps(v), ttl, int(time.time())))
-        self.conn.commit()
-
-    def get(self, k: str) -> Optional[Tuple[any, int]]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT v, ttl, ts FROM kv WHERE k= ?", (k,))
-        row = cur.fetchone()
+        if self.pool.stage(k, (orjson.dumps(v), ttl, int(time.time()))):
+            self.pool.flush()
+
+    def get(self, k: str) -> Optional[Tuple[Any, int]]:
+        hit, row = self.pool.pending(k)
+        if not hit:
+            with self.pool.connection() as conn:
+                row = conn.execute("SELECT v, ttl, ts FROM kv WHERE k= ?", (k,)).fetchone()
         if not row:
             return None
         v, ttl, ts = row
@@ -41,6 +178,45 @@ class SQLiteKV:
         return orjson.loads(v), ts
 
     def delete(self, k: str):
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM kv WHERE k= ?", (k,))
-        self.conn.commit()
+        if self.pool.stage(k, None):
+            self.pool.flush()
+
+    def flush(self):
+        self.pool.flush()
+
+    # --- valores binarios sin serializar (p.ej. vectores float32) ---
+    def set_raw(self, k: str, blob: bytes, ttl: int = 3600):
+        if self.pool.stage(k, (blob, ttl, int(time.time()))):
+            self.pool.flush()
+
+    def get_many_raw(self, keys: List[str]) -> Dict[str, bytes]:
+        """Lee varias claves en una consulta; omite las ausentes o caducadas."""
+        now = int(time.time())
+        out: Dict[str, bytes] = {}
+        missing: List[str] = []
+        for k in keys:
+            hit, row = self.pool.pending(k)
+            if not hit:
+                missing.append(k)
+            elif row and now - row[2] <= row[1]:
+                out[k] = row[0]
+        with self.pool.connection() as conn:
+            for i in range(0, len(missing), 500):  # límite de parámetros de SQLite
+                part = missing[i:i + 500]
+                q = f"SELECT k, v, ttl, ts FROM kv WHERE k IN ({','.join('?' * len(part))})"
+                for k, v, ttl, ts in conn.execute(q, part):
+                    if now - ts <= ttl:
+                        out[k] = v
+        return out
+
+    # --- async: la E/S de SQLite va a un hilo, el event loop no se bloquea ---
+    async def aget(self, k: str) -> Optional[Tuple[Any, int]]:
+        hit, _row = self.pool.pending(k)
+        if hit:  # lectura desde el buffer en memoria, sin E/S
+            return self.get(k)
+        return await run_blocking(self.get, k)
+
+    async def aset(self, k: str, v, ttl: int = 3600):
+        # stage() solo toca memoria; el commit del lote lleno va a un hilo
+        if self.pool.stage(k, (orjson.dumps(v), ttl, int(time.time()))):
+            await run_blocking(self.pool.flush)
@@ -10,3 +10,9 @@ class WebCache:
 
     def set(self, k: str, v, ttl: int = 3600):
         self.db.set(k, v, ttl)
+
+    async def aget(self, k: str):
+        return await self.db.aget(k)
+
+    async def aset(self, k: str, v, ttl: int = 3600):
+        await self.db.aset(k, v, ttl)
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from pathlib import Path
@@ -18,8 +21,94 @@ class Settings(BaseSettings):
     model_local_fallback: str = Field(default="gpt-5-nano", alias="MODEL_LOCAL_FALLBACK")
 
     embedding_model: str = Field(default="text-embedding-3-large", alias="EMBEDDING_MODEL")
+    embedding_batch_size: int = Field(default=256, alias="EMBEDDING_BATCH_SIZE")
+    embedding_batch_tokens: int = Field(default=100_000, alias="EMBEDDING_BATCH_TOKENS")
+
+    # Vector index: flat | hnsw | ivf_flat | ivf_pq (IVF se entrena con la primera ingesta)
+    vector_index_type: str = Field(default="flat", alias="VECTOR_INDEX_TYPE")
+    vector_normalize: bool = Field(default=True, alias="VECTOR_NORMALIZE")
+    vector_nlist: int = Field(default=1024, alias="VECTOR_NLIST")
+    vector_nprobe: int = Field(default=16, alias="VECTOR_NPROBE")
+    vector_pq_m: int = Field(default=16, alias="VECTOR_PQ_M")
+    vector_pq_nbits: int = Field(default=8, alias="VECTOR_PQ_NBITS")
+    vector_hnsw_m: int = Field(default=32, alias="VECTOR_HNSW_M")
+    vector_ef_construction: int = Field(default=200, alias="VECTOR_EF_CONSTRUCTION")
+    vector_ef_search: int = Field(default=64, alias="VECTOR_EF_SEARCH")
+
+    # Presupuesto de tokens: entrada máxima por llamada y parte dedicada a evidencia en los prompts
+    prompt_token_budget: int = Field(default=16_000, alias="PROMPT_TOKEN_BUDGET")
+    evidence_token_budget: int = Field(default=6_000, alias="EVIDENCE_TOKEN_BUDGET")
+
+    # HTTP (web search): pool compartido y deadline total para las páginas de una búsqueda
+    http_pool_size: int = Field(default=64, alias="HTTP_POOL_SIZE")
+    http_per_host: int = Field(default=8, alias="HTTP_PER_HOST")
+    web_max_results: int = Field(default=6, alias="WEB_MAX_RESULTS")
+    web_fetch_timeout: float = Field(default=12.0, alias="WEB_FETCH_TIMEOUT")
+    web_fetch_deadline: float = Field(default=8.0, alias="WEB_FETCH_DEADLINE")
+    web_evidence_tokens: int = Field(default=2500, alias="WEB_EVIDENCE_TOKENS")
+
+    # Recuperación RAG: "hybrid" (faiss + BM25 fusionados con RRF), "dense" o "sparse"
+    rag_retrieval: str = Field(default="hybrid", alias="RAG_RETRIEVAL")
+    rag_candidates: int = Field(default=20, alias="RAG_CANDIDATES")  # por buscador, antes de fusionar
+    rag_top_k: int = Field(default=5, alias="RAG_TOP_K")
+    rag_rrf_k: int = Field(default=60, alias="RAG_RRF_K")
+    # Rerank local: MMR sobre los vectores del índice (1 = sin diversidad) y fusión de chunks contiguos
+    rag_rerank_candidates: int = Field(default=50, alias="RAG_RERANK_CANDIDATES")
+    rag_mmr_lambda: float = Field(default=0.7, alias="RAG_MMR_LAMBDA")
+
+    # Chunking de la ingesta: "auto" usa markdown para .md y paragraphs para el resto (ver app.rag.chunking)
+    chunk_mode: str = Field(default="auto", alias="CHUNK_MODE")
+    chunk_overlap_tokens: int = Field(default=120, alias="CHUNK_OVERLAP_TOKENS")
 
     llama_gguf_path: str = Field(default="", alias="LLAMA_GGUF_PATH")
+    # Motor llama.cpp (app.models.local_llm): 0 = según la máquina; caché de prompts en MB (0 = sin caché)
+    llama_n_threads: int = Field(default=0, alias="LLAMA_N_THREADS")
+    llama_n_ctx: int = Field(default=0, alias="LLAMA_N_CTX")
+    llama_max_queue: int = Field(default=16, alias="LLAMA_MAX_QUEUE")
+    llama_prompt_cache_mb: int = Field(default=256, alias="LLAMA_PROMPT_CACHE_MB")
+    llama_preload: bool = Field(default=True, alias="LLAMA_PRELOAD")
+
+    # Scheduler: "dag" respeta PlanStep.requires; "layers" ejecuta capas con barrera
+    scheduler_mode: str = Field(default="dag", alias="SCHEDULER_MODE")
+    scheduler_max_concurrency: int = Field(default=8, alias="SCHEDULER_MAX_CONCURRENCY")
+
+    # Trabajo bloqueante fuera del event loop (app.utils.executor); 0 en CPU = núcleos de la máquina
+    executor_io_workers: int = Field(default=32, alias="EXECUTOR_IO_WORKERS")
+    executor_cpu_workers: int = Field(default=0, alias="EXECUTOR_CPU_WORKERS")
+    loop_lag_warn_ms: float = Field(default=25.0, alias="LOOP_LAG_WARN_MS")
+
+    # Respuesta final en streaming (deltas de SummaryAgent como eventos)
+    summary_stream: bool = Field(default=True, alias="SUMMARY_STREAM")
+
+    # Router: "local" clasifica con embeddings (centroides) y escala al LLM si la confianza es baja; "llm" siempre LLM
+    router_mode: str = Field(default="local", alias="ROUTER_MODE")
+    router_local_threshold: float = Field(default=0.75, alias="ROUTER_LOCAL_THRESHOLD")
+    router_local_min_examples: int = Field(default=3, alias="ROUTER_LOCAL_MIN_EXAMPLES")
+    router_train_datasets: str = Field(default="datasets/eval/prompts.jsonl", alias="ROUTER_TRAIN_DATASETS")  # separados por comas
+    router_retrain_interval: float = Field(default=60.0, alias="ROUTER_RETRAIN_INTERVAL")
+
+    # Caché semántica de router/planner (acierto exacto o por similitud del embedding de la query)
+    semantic_cache_size: int = Field(default=512, alias="SEMANTIC_CACHE_SIZE")
+    semantic_cache_ttl: float = Field(default=86400, alias="SEMANTIC_CACHE_TTL")
+    semantic_cache_threshold: float = Field(default=0.92, alias="SEMANTIC_CACHE_THRESHOLD")  # ≥1 desactiva la similitud
+
+    # Caché de respuestas completas delante de run_query: TTL por dominio del router ("finance=900,web=600"; 0 = no cachear)
+    answer_cache: bool = Field(default=True, alias="ANSWER_CACHE")
+    answer_cache_threshold: float = Field(default=0.95, alias="ANSWER_CACHE_THRESHOLD")
+    answer_cache_ttl: float = Field(default=3600, alias="ANSWER_CACHE_TTL")
+    answer_cache_domain_ttls: str = Field(default="finance=900,web=600", alias="ANSWER_CACHE_DOMAIN_TTLS")
+
+    # Servidor HTTP/SSE (app.server)
+    server_host: str = Field(default="127.0.0.1", alias="SERVER_HOST")
+    server_port: int = Field(default=8080, alias="SERVER_PORT")
+    server_max_concurrency: int = Field(default=8, alias="SERVER_MAX_CONCURRENCY")
+    server_max_queue: int = Field(default=32, alias="SERVER_MAX_QUEUE")
+    server_deadline: float = Field(default=120.0, alias="SERVER_DEADLINE")
+
+    # Evaluación: queries simultáneas y límites de ritmo (0 = sin límite)
+    eval_concurrency: int = Field(default=4, alias="EVAL_CONCURRENCY")
+    eval_rpm: float = Field(default=0, alias="EVAL_RPM")
+    eval_tpm: float = Field(default=0, alias="EVAL_TPM")
 
     # Costos (opcional)
     price_in_gpt5: float = Field(default=10, alias="PRICE_IN_GPT5")
@@ -41,6 +130,72 @@ class Settings(BaseSettings):
         env_file = ".env"
         extra = "ignore"
 
-settings = Settings()
+# Campos de todo el proceso, que `override_settings` rechaza: rutas (cachés, índice y memoria se
+# guardan en singletons por ruta), credenciales, servidor, motor llama.cpp y pools compartidos
+PROCESS_FIELDS = frozenset(
+    {"openai_api_key", "base_dir", "cache_dir", "vectorstore_dir", "router_train_datasets",
+     "http_pool_size", "http_per_host"}
+    | {name for name in Settings.model_fields if name.startswith(("server_", "llama_", "executor_"))}
+)
+
+_base_settings = Settings()
+_overlay: ContextVar[Optional[Settings]] = ContextVar("settings_overlay", default=None)
+
+class _SettingsProxy:
+    """
+    Punto de acceso a la configuración. Cada lectura resuelve primero el overlay del contexto
+    actual (`override_settings`) y si no hay, la configuración base; así queries concurrentes
+    (brazos A/B, tenants) usan modelos y precios distintos sin pisarse. Las escrituras van al
+    overlay activo (solo afectan a ese contexto) y, fuera de un overlay, a la base.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_overlay.get() or _base_settings, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(_overlay.get() or _base_settings, name, value)
+
+    def __repr__(self) -> str:
+        return f"<settings {current_settings()!r}>"
+
+settings = _SettingsProxy()
+
+def current_settings() -> Settings:
+    """El objeto `Settings` efectivo en este contexto (overlay o base)."""
+    return _overlay.get() or _base_settings
+
+def field_name(key: str) -> Optional[str]:
+    """Nombre del campo (`model_summary`) a partir del nombre o del alias de entorno; None si no existe."""
+    for name, info in Settings.model_fields.items():
+        if key.lower() == name or (info.alias and key.upper() == info.alias):
+            return name
+    return None
+
+@contextmanager
+def override_settings(overrides: Optional[Dict[str, Any]]) -> Iterator[Settings]:
+    """
+    Overlay de settings acotado al contexto actual (y a las tareas que se creen dentro).
+    Las claves desconocidas se ignoran y las de `PROCESS_FIELDS` lanzan `ValueError`. Los valores
+    se validan y convierten como los del entorno (`"4"` → 4); uno inválido lanza `ValidationError`.
+    Se puede anidar; al salir se restaura el anterior.
+    """
+    cur = current_settings()
+    update = {}
+    for k, v in (overrides or {}).items():
+        name = field_name(k)
+        if name in PROCESS_FIELDS:
+            raise ValueError(f"'{k}' es una opción de todo el proceso; no admite override por query")
+        if name is not None:
+            update[Settings.model_fields[name].alias or name] = v
+    if not update:
+        yield cur
+        return
+    token = _overlay.set(Settings.model_validate({**cur.model_dump(by_alias=True), **update}))
+    try:
+        yield _overlay.get()
+    finally:
+        _overlay.reset(token)
+
 settings.cache_dir.mkdir(parents=True, exist_ok=True)
 settings.vectorstore_dir.mkdir(parents=True, exist_ok=True)
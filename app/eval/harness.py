@@ -1,59 +1,175 @@
 import orjson
+import time
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from contextlib import contextmanager
-from app.eval.metrics import aspect_precision, length_tokens, basic_report
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings, override_settings
+from app.eval.metrics import aspect_precision, length_tokens, basic_report, usage_totals
+from app.logging_setup import get_logger
 from app.main import run_query
+from app.utils.hashing import stable_hash
+from app.utils.rate_limit import RateLimiter
 import asyncio
 
-@contextmanager
-def patch_settings(overrides: Dict[str, Any]):
-    from app import config
-    old = {}
-    for k, v in overrides.items():
-        if hasattr(config.settings, k.lower()) or hasattr(config.settings, k):
-            key = k.lower() if hasattr(config.settings, k.lower()) else k
-            old[key] = getattr(config.settings, key)
-            setattr(config.settings, key, v)
+log = get_logger("eval")
+
+RESULTS_DIR = Path(".cache") / "eval_results"
+
+# compatibilidad: el overlay por contexto sustituye a la mutación del singleton global
+patch_settings = override_settings
+
+def load_dataset(path: Path) -> List[Dict[str, Any]]:
+    return [orjson.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+def _job_key(arm: str, overrides: Dict[str, Any], item: Dict[str, Any], run: int) -> str:
+    # incluye los overrides: al reanudar con otra configuración no se reutilizan resultados
+    return stable_hash({"arm": arm, "overrides": overrides, "q": item["q"], "image_url": item.get("image_url"), "run": run})
+
+def _load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Registros completados de un JSONL previo; los fallidos o truncados se repiten."""
+    done: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return done
+    for line in path.read_bytes().splitlines():
+        try:
+            rec = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue  # última línea a medio escribir
+        if not rec.get("error"):
+            done[rec["key"]] = rec
+    return done
+
+async def _run_job(item: Dict[str, Any], overrides: Dict[str, Any], limiter: RateLimiter, est_tokens: int) -> Dict[str, Any]:
+    await limiter.acquire(est_tokens)
+    t0 = time.perf_counter()
     try:
-        yield
-    finally:
-        for k, v in old.items():
-            setattr(config.settings, k, v)
+        # sin caché de respuestas: cada run mide el pipeline completo
+        ans, usage = await run_query(item["q"], image_url=item.get("image_url"), overrides=overrides, bypass_cache=True)
+        err = None
+    except Exception as e:
+        ans, usage, err = "", [], f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - t0
+    tot = usage_totals(usage)
+    limiter.settle(est_tokens, tot["input_tokens"] + tot["output_tokens"])
+    aspects = item.get("aspects", [])
+    return {
+        "answer": ans or "",
+        "error": err,
+        "latency_s": round(latency, 4),
+        **tot,
+        "aspect_precision": aspect_precision(ans or "", aspects),
+        "length_tokens": length_tokens(ans or ""),
+    }
+
+async def run_eval(
+    path: Path,
+    arms: Dict[str, Dict[str, Any]],
+    runs: int = 1,
+    concurrency: Optional[int] = None,
+    out: Optional[Path] = None,
+    resume: bool = False,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Motor concurrente: `concurrency` workers sobre la cola de trabajos (prompt, run, brazo),
+    con los brazos intercalados por prompt (y orden alterno) para que vean las mismas condiciones.
+    Cada query lleva los overrides de su brazo como overlay propio: A y B corren solapados.
+    Cada resultado se añade a `out` (JSONL) en cuanto termina; con `resume` se saltan los ya hechos.
+    Devuelve (items, {brazo: registros}).
+    """
+    items = load_dataset(path)
+    out = out or RESULTS_DIR / f"{path.stem}{'-ab' if len(arms) > 1 else ''}.jsonl"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    done = _load_checkpoint(out) if resume else {}
+    if not resume:
+        out.write_bytes(b"")
 
-async def run_dataset(path: Path, runs: int = 1) -> Dict[str, Any]:
+    names = list(arms)
+    queue: asyncio.Queue = asyncio.Queue()
+    for idx, item in enumerate(items):
+        for run in range(max(1, runs)):
+            order = names if (idx + run) % 2 == 0 else names[::-1]
+            for arm in order:
+                if _job_key(arm, arms[arm], item, run) not in done:
+                    queue.put_nowait((idx, run, arm))
+    total = queue.qsize()
+    log.info(f"Eval: {total} trabajos pendientes ({len(done)} reanudados) en {out}")
+
+    limiter = RateLimiter(rpm if rpm is not None else settings.eval_rpm,
+                          tpm if tpm is not None else settings.eval_tpm)
+    seen_tokens: List[int] = []
+    records: List[Dict[str, Any]] = list(done.values())
+
+    async def worker():
+        with out.open("ab") as f:
+            while True:
+                try:
+                    idx, run, arm = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                item = items[idx]
+                est = sum(seen_tokens) // len(seen_tokens) if seen_tokens else 0
+                res = await _run_job(item, arms[arm], limiter, est)
+                if not res["error"]:
+                    seen_tokens.append(res["input_tokens"] + res["output_tokens"])
+                else:
+                    log.warning(f"[{arm}] prompt {idx} run {run}: {res['error']}")
+                rec = {"key": _job_key(arm, arms[arm], item, run), "arm": arm, "overrides": arms[arm],
+                       "idx": idx, "run": run, "q": item["q"], **res}
+                f.write(orjson.dumps(rec) + b"\n")
+                f.flush()
+                records.append(rec)
+
+    n_workers = max(1, min(concurrency or settings.eval_concurrency, total or 1))
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(n_workers):
+            tg.create_task(worker())
+
+    by_arm: Dict[str, List[Dict[str, Any]]] = {a: [] for a in names}
+    for rec in records:
+        if rec["arm"] in by_arm and rec["idx"] < len(items):
+            by_arm[rec["arm"]].append(rec)
+    return items, by_arm
+
+def summarize(items: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Por prompt se queda la respuesta más “completa” por aspectos; tokens y coste suman todos los runs."""
+    per_prompt: Dict[int, List[Dict[str, Any]]] = {}
+    for rec in records:
+        if not rec.get("error"):
+            per_prompt.setdefault(rec["idx"], []).append(rec)
     results: List[Dict[str, Any]] = []
-    for line in path.read_text(encoding="utf-8").splitlines():
-        if not line.strip():
-            continue
-        item = orjson.loads(line)
-        q = item["q"]
-        aspects = item.get("aspects", [])
-        image = item.get("image_url")
-        best_ans = None
-        for _ in range(max(1, runs)):
-            ans, usage = await run_query(q, image_url=image)
-            # Elige el más “completo” por aspectos
-            if best_ans is None or aspect_precision(ans, aspects) > aspect_precision(best_ans, aspects):
-                best_ans = ans
+    for idx, recs in sorted(per_prompt.items()):
+        best = max(sorted(recs, key=lambda r: r["run"]), key=lambda r: r["aspect_precision"])
         results.append({
-            "q": q,
-            "answer": best_ans,
+            "q": items[idx]["q"],
+            "answer": best["answer"],
             "metrics": {
-                "aspect_precision": aspect_precision(best_ans or "", aspects),
-                "length_tokens": length_tokens(best_ans or ""),
-            }
+                "aspect_precision": best["aspect_precision"],
+                "length_tokens": best["length_tokens"],
+                "latency_s": sum(r["latency_s"] for r in recs) / len(recs),
+                "input_tokens": sum(r["input_tokens"] for r in recs),
+                "output_tokens": sum(r["output_tokens"] for r in recs),
+                "cost_usd": sum(r["cost_usd"] for r in recs),
+            },
         })
     report = basic_report(results)
-    out = {"report": report, "results": results}
-    out_path = Path(".cache") / "eval_results"
-    out_path.mkdir(parents=True, exist_ok=True)
-    (out_path / "last_eval.json").write_bytes(orjson.dumps(out, option=orjson.OPT_INDENT_2))
+    failed = len(items) - len(results)
+    if failed:
+        report["failed"] = failed
+    return {"report": report, "results": results}
+
+async def run_dataset(path: Path, runs: int = 1, **opts) -> Dict[str, Any]:
+    """`opts`: concurrency, out, resume, rpm, tpm (ver `run_eval`)."""
+    items, by_arm = await run_eval(path, {"base": {}}, runs=runs, **opts)
+    out = summarize(items, by_arm["base"])
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    (RESULTS_DIR / "last_eval.json").write_bytes(orjson.dumps(out, option=orjson.OPT_INDENT_2))
     return out
 
-async def run_ab(path: Path, overrides_a: Dict[str, Any], overrides_b: Dict[str, Any], runs: int = 1) -> Dict[str, Any]:
-    with patch_settings(overrides_a):
-        res_a = await run_dataset(path, runs=runs)
-    with patch_settings(overrides_b):
-        res_b = await run_dataset(path, runs=runs)
-    return {"A": overrides_a, "A_results": res_a, "B": overrides_b, "B_results": res_b}
+async def run_ab(path: Path, overrides_a: Dict[str, Any], overrides_b: Dict[str, Any], runs: int = 1, **opts) -> Dict[str, Any]:
+    items, by_arm = await run_eval(path, {"A": overrides_a, "B": overrides_b}, runs=runs, **opts)
+    out = {"A": overrides_a, "A_results": summarize(items, by_arm["A"]),
+           "B": overrides_b, "B_results": summarize(items, by_arm["B"])}
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    (RESULTS_DIR / "last_ab.json").write_bytes(orjson.dumps(out, option=orjson.OPT_INDENT_2))
+    return out
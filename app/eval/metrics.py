@@ -18,13 +18,42 @@ def length_tokens(answer: str) -> int:
     # aproximación grosera
     return len(answer.split())
 
+def usage_totals(usage_log: List[str]) -> Dict[str, Any]:
+    """Suma las entradas `modelo|in=N|out=M|$C[|cancelled]` de `usage_log`."""
+    tot = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+    for line in usage_log or []:
+        fields = str(line).split("|")
+        tot["llm_calls"] += 1
+        for f in fields[1:]:
+            if f.startswith("in="):
+                tot["input_tokens"] += int(f[3:])
+            elif f.startswith("out="):
+                tot["output_tokens"] += int(f[4:])
+            elif f.startswith("$"):
+                tot["cost_usd"] += float(f[1:])
+    return tot
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    vs = sorted(values)
+    return vs[min(len(vs) - 1, int(round(q * (len(vs) - 1))))]
+
 def basic_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     if not results:
         return {}
     precs = [r["metrics"]["aspect_precision"] for r in results]
     lens = [r["metrics"]["length_tokens"] for r in results]
-    return {
+    report = {
         "n": len(results),
         "aspect_precision_avg": sum(precs)/len(precs),
         "answer_len_avg_tokens": sum(lens)/len(lens),
     }
+    lats = [r["metrics"]["latency_s"] for r in results if "latency_s" in r["metrics"]]
+    if lats:
+        report["latency_avg_s"] = sum(lats)/len(lats)
+        report["latency_p95_s"] = percentile(lats, 0.95)
+    for k in ("input_tokens", "output_tokens", "cost_usd"):
+        if any(k in r["metrics"] for r in results):
+            report[f"{k}_total"] = sum(r["metrics"].get(k, 0) for r in results)
+    return report
@@ -1,7 +1,10 @@
 import asyncio
-from typing import List, Callable, Dict
+import re
+import time
+from typing import Any, AsyncIterator, List, Callable, Dict, Optional
 from app.blackboard import Blackboard
-from app.scheduler import Scheduler
+from app.scheduler import Scheduler, DagStep, CycleError
+from app.config import settings, override_settings
 from app.logging_setup import get_logger
 from app.agents.router import RouterAgent
 from app.agents.planner import PlannerAgent
@@ -10,10 +13,15 @@ from app.agents.rag import RAGAgent
 from app.agents.web_search import WebSearchAgent
 from app.agents.data_analysis import DataAnalysisAgent
 from app.agents.critic import CriticAgent
-from app.agents.summary import SummaryAgent
+from app.agents.summary import NO_ANSWER, SummaryAgent
 from app.agents.hypothesis import HypothesisAgent
 from app.agents.memory import MemoryAgent
 from app.agents.local_text import LocalTextAgent
+from app.agents.base import BaseAgent
+from app.caching.semantic_cache import get_semantic_cache
+from app.models.embeddings import embed_array
+from app.utils.executor import run_blocking
+from app.utils.hashing import stable_hash
 
 log = get_logger("main")
 
@@ -31,7 +39,7 @@ def build_agent_registry(bb: Blackboard) -> Dict[str, Callable[[], None]]:
     local_text = LocalTextAgent(bb)
 
     # map nombre → callable async
-    return {
+    registry = {
         "router": router.act,
         "planner": planner.act,
         "vision": vision.act,
@@ -44,6 +52,20 @@ def build_agent_registry(bb: Blackboard) -> Dict[str, Callable[[], None]]:
         "memory": memory.act,
         "local_text": local_text.act,
     }
+    # el planner ofrece exactamente los agentes registrados (y su caché depende de esa lista)
+    planner.agents = [n for n in registry if n not in ("router", "planner")]
+    return registry
+
+async def _promote_draft(bb: Blackboard) -> None:
+    """
+    Sin `final_answer`, el borrador pasa a ser la respuesta. Se marca `answer_fallback`: la
+    respuesta no salió del paso final del resumen y no se guarda en la caché de respuestas.
+    """
+    if not await bb.get("final_answer"):
+        draft = await bb.get("draft_answer") or {}
+        if draft:
+            await bb.set("answer_fallback", "draft_promotion")
+            await bb.set("final_answer", draft.get("final_answer", ""))
 
 def layers_to_callables(layers: List[List[str]], registry: Dict[str, Callable], bb: Blackboard):
     plan: List[List[Callable]] = []
@@ -53,10 +75,7 @@ def layers_to_callables(layers: List[List[str]], registry: Dict[str, Callable],
         # If critic in this layer and we already had a summary layer before, inject promotion
         if "critic" in layer and seen_summary:
             async def promote_draft():  # closure over bb
-                if not await bb.get("final_answer"):
-                    draft = await bb.get("draft_answer") or {}
-                    if draft:
-                        await bb.set("final_answer", draft.get("final_answer", ""))
+                await _promote_draft(bb)
             fns.append(promote_draft)
         for name in layer:
             if name not in registry:
@@ -68,29 +87,182 @@ def layers_to_callables(layers: List[List[str]], registry: Dict[str, Callable],
         plan.append(fns)
     return plan
 
-async def run_query(query: str, image_url: str | None = None):
+def steps_to_dag(steps: List[Dict], registry: Dict[str, Callable], bb: Blackboard) -> Dict[str, DagStep]:
+    """Convierte `PlanOutput.steps` en nodos del DAG, con la misma promoción de borrador que las capas."""
+    dag: Dict[str, DagStep] = {}
+    summary_steps: set[str] = set()
+    for s in steps:
+        name = s["name"]
+        if name in dag:
+            log.warning(f"Duplicate step '{name}' in plan. Renaming.")
+            name = f"{name}#{len(dag)}"
+        fns: List[Callable] = []
+        if "critic" in s["agents"] and summary_steps.intersection(s.get("requires") or []):
+            async def promote_draft():  # closure over bb
+                await _promote_draft(bb)
+            fns.append(promote_draft)
+        for agent in s["agents"]:
+            if agent not in registry:
+                log.warning(f"Unknown agent '{agent}' in plan. Skipping.")
+                continue
+            fns.append(registry[agent])
+        if "summary" in s["agents"]:
+            summary_steps.add(name)
+        dag[name] = DagStep(fns, s.get("requires") or [])
+    return dag
+
+# clave del blackboard → tipo de evento de `stream_query`
+EVENT_KEYS = {
+    "plan": "plan",
+    "rag_citations": "evidence",
+    "web_snippets": "evidence",
+    "vision_struct": "evidence",
+    "analysis_numeric": "evidence",
+    "answer_delta": "delta",
+    "answer_reset": "reset",
+    "critic_verdict": "critic",
+    "final_answer": "answer",
+}
+
+async def stream_query(query: str, image_url: str | None = None,
+                       overrides: Optional[Dict[str, Any]] = None,
+                       bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta una query y produce eventos `{"type", "data", "t"}` (t = segundos desde el inicio) a
+    medida que ocurren: plan, evidence ({source, value}), delta (texto de la respuesta en streaming),
+    reset (el streaming falló: hay que descartar los delta recibidos), critic, answer; y al final `done` con {answer, usage, metrics: {ttft_s, total_s, cache_hit}}.
+    `ttft_s` es el tiempo hasta el primer texto de la respuesta que ve el usuario.
+    """
     bb = Blackboard()
+    queue: asyncio.Queue = asyncio.Queue()
+    t0 = time.perf_counter()
+    first_text: List[float] = []
+
+    def on_write(key: str, value: Any, version: int):
+        kind = EVENT_KEYS[key]
+        t = time.perf_counter() - t0
+        if kind in ("delta", "answer") and value and not first_text:
+            first_text.append(t)
+        data = {"source": key, "value": value} if kind == "evidence" else value
+        queue.put_nowait({"type": kind, "data": data, "t": round(t, 4)})
+
+    for key in EVENT_KEYS:
+        bb.subscribe(key, on_write)
+    # el overlay se aplica dentro de la tarea: un generador no debe tocar el contexto de quien lo consume
+    task = asyncio.create_task(_run_with_overrides(query, image_url, bb, overrides, bypass_cache))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+        answer, usage = await task
+    finally:
+        if not task.done():  # el consumidor abandonó el stream
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    total = time.perf_counter() - t0
+    metrics = {"ttft_s": round(first_text[0], 4) if first_text else None, "total_s": round(total, 4),
+               "cache_hit": await bb.exists("answer_cache_hit")}
+    log.info(f"Query terminada: ttft={metrics['ttft_s']}s total={metrics['total_s']}s")
+    yield {"type": "done", "data": {"answer": answer, "usage": usage, "metrics": metrics}, "t": round(total, 4)}
+
+async def run_query(query: str, image_url: str | None = None, overrides: Optional[Dict[str, Any]] = None,
+                    bypass_cache: bool = False):
+    """
+    Ejecuta una query completa y devuelve (respuesta, usage_log). `overrides`
+    ({"MODEL_SUMMARY": "gpt-5", ...}) aplica solo a esta query y a las tareas de sus agentes.
+    Con `bypass_cache` se ejecuta el pipeline aunque haya respuesta cacheada, y no se guarda.
+    """
+    return await _run_with_overrides(query, image_url, Blackboard(), overrides, bypass_cache)
+
+async def _run_with_overrides(query: str, image_url: str | None, bb: Blackboard,
+                              overrides: Optional[Dict[str, Any]], bypass_cache: bool = False):
+    with override_settings(overrides):
+        if bypass_cache or not settings.answer_cache:
+            return await _run_query(query, image_url, bb)
+        return await _cached_run_query(query, image_url, bb, overrides)
+
+def _answer_ttl(domain: str) -> float:
+    """TTL de una respuesta según el dominio del router (`ANSWER_CACHE_DOMAIN_TTLS`) o el general."""
+    for item in settings.answer_cache_domain_ttls.split(","):
+        name, _, ttl = item.partition("=")
+        if name.strip() == domain:
+            try:
+                return float(ttl)
+            except ValueError:
+                log.warning(f"ANSWER_CACHE_DOMAIN_TTLS: TTL inválido para '{domain}': {ttl!r}")
+    return settings.answer_cache_ttl
+
+async def _cached_run_query(query: str, image_url: str | None, bb: Blackboard,
+                            overrides: Optional[Dict[str, Any]]):
+    """
+    Caché de respuestas completas delante del pipeline. Clave exacta: query normalizada + hash de
+    la imagen + overrides; si falla, similitud del embedding de la query (≥ `ANSWER_CACHE_THRESHOLD`)
+    entre entradas con la misma imagen y overrides. Un acierto no llama a ningún LLM (usage vacío).
+    """
+    cache = get_semantic_cache("answer")
+    scope = stable_hash({"image": stable_hash(image_url) if image_url else None, "overrides": overrides or {}})
+    key = BaseAgent._query_key(query, scope=scope)
+    vec = None
+    if query.strip():
+        try:
+            vec = (await run_blocking(embed_array, [query]))[0]
+            await bb.set("input_embedding", vec)  # el router lo reutiliza
+        except Exception as e:
+            log.warning(f"Embedding de la query falló; caché de respuestas solo exacta: {e}")
+    hit = cache.get(key, vec, scope=scope, threshold=settings.answer_cache_threshold)
+    if hit is not None:
+        entry, sim = hit
+        log.info(f"Caché de respuestas: acierto (sim={sim:.3f}, dominio={entry['domain']}).")
+        await bb.set("answer_cache_hit", {"similarity": round(sim, 4), "domain": entry["domain"]})
+        await bb.set("draft_answer", {"final_answer": entry["answer"], "citations": entry["citations"]})
+        await bb.set("final_answer", entry["answer"])
+        return entry["answer"], []
+
+    answer, usage = await _run_query(query, image_url, bb)
+    # ni el relleno del resumen ni un borrador promovido tras un fallo se sirven desde caché
+    if (answer or "").strip() == NO_ANSWER or await bb.exists("answer_fallback"):
+        log.info("Respuesta degradada; no se guarda en la caché de respuestas.")
+    elif answer:
+        domain = ((await bb.get("router_output")) or {}).get("domain") or "general"
+        ttl = _answer_ttl(domain)
+        if ttl > 0:
+            citations = (await bb.get("draft_answer") or {}).get("citations") or await bb.get("rag_citations") or []
+            cache.put(key, {"answer": answer, "citations": citations, "usage": usage, "domain": domain},
+                      vec, scope=scope, ttl=ttl)
+    return answer, usage
+
+async def _run_query(query: str, image_url: str | None, bb: Blackboard):
     await bb.set("input", query)
     if image_url:
         await bb.set("image_url", image_url)
 
     registry = build_agent_registry(bb)
-    sched = Scheduler(bb)
 
     # Bootstrap: router → planner → rest (a partir de su plan)
     await registry["router"]()
     await registry["planner"]()
 
-    layers = await bb.get("plan_layers") or [["rag","web_search"], ["data"], ["summary"], ["critic"], ["summary"], ["memory"]]
-    plan = layers_to_callables(layers, registry, bb)
-
-    await sched.run(plan)
+    plan_dict = await bb.get("plan") or {}
+    steps = plan_dict.get("steps") or []
+    stop_key = plan_dict.get("stop_condition") or "final_answer"
+    if not re.fullmatch(r"\w+", stop_key):
+        log.warning(f"stop_condition '{stop_key}' no es una clave del blackboard; usando 'final_answer'.")
+        stop_key = "final_answer"
+    sched = Scheduler(bb, max_concurrency=settings.scheduler_max_concurrency, stop_key=stop_key)
+    ran = False
+    # Sin aristas 'requires' el orden del plan es la única dependencia: modo capas.
+    if settings.scheduler_mode == "dag" and any(s.get("requires") for s in steps):
+        try:
+            await sched.run_dag(steps_to_dag(steps, registry, bb))
+            ran = True
+        except CycleError as e:
+            log.warning(f"{e}; falling back to layered execution.")
+    if not ran:
+        layers = await bb.get("plan_layers") or [["rag","web_search"], ["data"], ["summary"], ["critic"], ["summary"], ["memory"]]
+        plan = layers_to_callables(layers, registry, bb)
+        await sched.run(plan)
 
-    fa = await bb.get("final_answer")
-    if not fa:
-        draft = await bb.get("draft_answer")
-        if draft:
-            await bb.set("final_answer", draft.get("final_answer", ""))
+    await _promote_draft(bb)
 
     verdict = await bb.get("critic_verdict")
     if verdict and verdict.get("conflicts", 0) > 0:
@@ -102,7 +274,11 @@ async def run_query(query: str, image_url: str | None = None):
     return final_answer, usage_log
 
 async def demo():
-    ans, usage = await run_query("Resume los beneficios y riesgos de usar modelos locales vs GPT-5 para análisis financiero, cita fuentes si puedes.")
+    from app.web.http_client import close_session
+    try:
+        ans, usage = await run_query("Resume los beneficios y riesgos de usar modelos locales vs GPT-5 para análisis financiero, cita fuentes si puedes.")
+    finally:
+        await close_session()
     print("=== FINAL ANSWER ===")
     print(ans)
     print("\n=== USAGE ===")
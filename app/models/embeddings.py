@@ -1,19 +1,54 @@
-from typing import List
+from typing import Dict, Iterator, List
+import numpy as np
 from openai import OpenAI
 from app.config import settings
 from app.caching.embeddings_cache import EmbeddingsCache
-from app.utils.hashing import stable_hash
+from app.utils.hashing import text_key
+from app.utils.token_budget import count_tokens
 
 _client = OpenAI(api_key=settings.openai_api_key)
 _cache = EmbeddingsCache(settings.base_dir / ".emb_cache.sqlite")
 
-def embed_texts(texts: List[str], model: str | None = None) -> List[List[float]]:
+def _batches(texts: List[str], model: str, max_items: int, max_tokens: int) -> Iterator[List[str]]:
+    """Agrupa textos respetando el máximo de entradas y de tokens por petición."""
+    batch: List[str] = []
+    tokens = 0
+    for t in texts:
+        n = count_tokens(t, model)
+        if batch and (len(batch) >= max_items or tokens + n > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(t)
+        tokens += n
+    if batch:
+        yield batch
+
+def embed_array(texts: List[str], model: str | None = None) -> np.ndarray:
+    """
+    Embeddings float32 de forma (len(texts), dim), en el orden de entrada.
+    Caché por texto: solo los textos que faltan (deduplicados) van a la API.
+    """
     model = model or settings.embedding_model
-    key = stable_hash({"m": model, "t": texts})
-    cached = _cache.get(key)
-    if cached:
-        return cached[0]
-    resp = _client.embeddings.create(model=model, input=texts)
-    vecs = [d.embedding for d in resp.data]
-    _cache.set(key, vecs)
-    return vecs
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    keys = [text_key(model, t) for t in texts]
+    found: Dict[str, np.ndarray] = _cache.get_vectors(list(dict.fromkeys(keys)))
+
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        text_to_key = {t: k for k, t in missing.items()}
+        for batch in _batches(list(missing.values()), model, settings.embedding_batch_size, settings.embedding_batch_tokens):
+            resp = _client.embeddings.create(model=model, input=batch)
+            fresh = {
+                text_to_key[t]: np.asarray(d.embedding, dtype=np.float32)
+                for t, d in zip(batch, sorted(resp.data, key=lambda d: d.index))
+            }
+            _cache.set_vectors(fresh)
+            found.update(fresh)
+    return np.stack([found[k] for k in keys])
+
+def embed_texts(texts: List[str], model: str | None = None) -> List[List[float]]:
+    return embed_array(texts, model).tolist()
@@ -1,29 +1,270 @@
-from typing import List, Dict, Optional
+import asyncio
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
 from app.config import settings
 from app.logging_setup import get_logger
+from app.utils.executor import run_blocking
 
 log = get_logger("local_llm")
 
 try:
     from llama_cpp import Llama
-except Exception as e:
+except Exception:
     Llama = None  # type: ignore
 
-_llm = None
-
-def get_local_llm() -> Optional["Llama"]:
-    global _llm
-    if _llm:
-        return _llm
-    if not settings.llama_gguf_path or not Llama:
-        log.info("Local Llama not configured or llama-cpp not installed; returning None.")
-        return None
-    _llm = Llama(model_path=settings.llama_gguf_path, n_ctx=4096, n_threads=4)
-    return _llm
-
-def local_generate(prompt: str, max_tokens: int = 512) -> str:
-    llm = get_local_llm()
-    if not llm:
-        raise RuntimeError("Local LLM not available")
-    out = llm(prompt=prompt, max_tokens=max_tokens, temperature=0.2)
-    return out["choices"][0]["text"]
+try:
+    from llama_cpp import LlamaRAMCache
+except Exception:
+    LlamaRAMCache = None  # type: ignore
+
+# Prefijo fijo de todos los prompts locales: su caché KV se calcula al precargar y se reutiliza
+SYSTEM_PROMPT = "Answer briefly and helpfully:\n\n"
+
+KV_BYTES_PER_TOKEN = 512 * 1024  # caché KV f16 de un modelo 7B sin GQA (cota alta)
+CTX_MIN, CTX_MAX = 2048, 8192
+
+def build_prompt(query: str) -> str:
+    return f"{SYSTEM_PROMPT}{query}\n"
+
+def auto_threads() -> int:
+    """
+    Hilos de inferencia: núcleos físicos disponibles para el proceso (la mitad de los lógicos con
+    SMT activo, que llama.cpp no aprovecha), dejando uno libre al event loop si hay 4 o más.
+    """
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n = os.cpu_count() or 1
+    try:
+        if Path("/sys/devices/system/cpu/smt/active").read_text().strip() == "1":
+            n //= 2
+    except OSError:
+        pass
+    return max(1, n - 1 if n >= 4 else n)
+
+def auto_ctx(model_path: str) -> int:
+    """
+    Contexto que cabe en la mitad de la memoria libre tras cargar el modelo, en potencia de 2
+    entre CTX_MIN y CTX_MAX. Sin datos de memoria, CTX_MIN.
+    """
+    try:
+        free = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return CTX_MIN
+    try:
+        free -= Path(model_path).stat().st_size
+    except OSError:
+        pass
+    ctx = CTX_MIN
+    while ctx * 2 <= CTX_MAX and ctx * 2 * KV_BYTES_PER_TOKEN <= free // 2:
+        ctx *= 2
+    return ctx
+
+class _Job:
+    __slots__ = ("prompt", "max_tokens", "temperature", "put", "cancelled")
+
+    def __init__(self, prompt: str, max_tokens: int, temperature: float, put: Callable[[Tuple[str, Any]], None]):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.put = put  # recibe ("tok", texto) · ("end", None) · ("err", excepción)
+        self.cancelled = False
+
+class LocalLLMStream:
+    """
+    Generación en streaming de `LlamaEngine.stream`: se itera con `async for` y produce trozos de
+    texto según los emite el modelo. La petición entra en la cola al empezar a iterar; si se deja
+    de iterar (o se cancela), el worker la abandona en el siguiente token. Al terminar expone
+    `text` y `ttft` (segundos hasta el primer token, cola incluida).
+    """
+    def __init__(self, engine: "LlamaEngine", prompt: str, max_tokens: int, temperature: float):
+        self._engine = engine
+        self._args = (prompt, max_tokens, temperature)
+        self.text = ""
+        self.ttft: Optional[float] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        job = _Job(*self._args, put=lambda item: loop.call_soon_threadsafe(items.put_nowait, item))
+        t0 = time.perf_counter()
+        parts = []
+        self._engine._submit(job)
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "end":
+                    break
+                if kind == "err":
+                    raise value
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - t0
+                parts.append(value)
+                yield value
+        finally:
+            job.cancelled = True  # no-op si ya terminó
+            self.text = "".join(parts)
+
+class LlamaEngine:
+    """
+    Motor llama.cpp persistente: un hilo propio carga el modelo una vez y atiende las peticiones
+    de una cola FIFO de una en una (llama.cpp no admite llamadas concurrentes sobre un modelo).
+    El event loop solo encola y recibe tokens. Hilos y contexto se dimensionan según la máquina
+    salvo que los fijen el constructor o settings. Con `LlamaRAMCache` guarda estados KV por prefijo de prompt, y
+    el de `SYSTEM_PROMPT` se calcula al cargar; sin ella llama.cpp reutiliza igualmente el
+    prefijo común con la petición anterior.
+    """
+    def __init__(self, model_path: Optional[str] = None, n_threads: Optional[int] = None,
+                 n_ctx: Optional[int] = None, max_queue: Optional[int] = None,
+                 prompt_cache_mb: Optional[int] = None):
+        # lo que no se pasa se toma de settings al arrancar (0 en hilos/contexto = según la máquina)
+        self.model_path = model_path
+        self.n_threads = n_threads
+        self.n_ctx = n_ctx
+        self.max_queue = max_queue
+        self.prompt_cache_mb = prompt_cache_mb
+        self.error: Optional[str] = None
+        self.served = 0
+        self._llm = None
+        self._jobs: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- ciclo de vida ---
+    def start(self) -> "LlamaEngine":
+        """Arranca el hilo del motor (idempotente); la carga del modelo ocurre en ese hilo."""
+        with self._lock:
+            if self._thread is None:
+                self._resolve()
+                self._jobs = queue.Queue(maxsize=max(1, self.max_queue))
+                self._loaded = threading.Event()
+                self._thread = threading.Thread(target=self._worker, name="llama-engine", daemon=True)
+                self._thread.start()
+        return self
+
+    async def ready(self) -> bool:
+        """Arranca el motor y espera a que termine la carga sin bloquear el loop. True si hay modelo."""
+        self.start()
+        if not self._loaded.is_set():
+            await run_blocking(self._loaded.wait)
+        return self._llm is not None
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Termina tras la petición en curso; las que esperan en cola reciben error."""
+        with self._lock:
+            thread, jobs = self._thread, self._jobs
+            self._thread = None
+        if thread is None:
+            return
+        while True:
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.put(("err", RuntimeError("Local LLM engine closed")))
+        jobs.put(None)
+        thread.join(timeout)
+
+    def _resolve(self) -> None:
+        if self.model_path is None:
+            self.model_path = settings.llama_gguf_path
+        if self.max_queue is None:
+            self.max_queue = settings.llama_max_queue
+        if self.prompt_cache_mb is None:
+            self.prompt_cache_mb = settings.llama_prompt_cache_mb
+        self.n_threads = (settings.llama_n_threads if self.n_threads is None else self.n_threads) or auto_threads()
+        if self.n_ctx is None:
+            self.n_ctx = settings.llama_n_ctx
+        if not self.n_ctx and self.model_path:
+            self.n_ctx = auto_ctx(self.model_path)
+
+    def _load(self) -> None:
+        if not self.model_path or not Llama:
+            self.error = "Local Llama not configured or llama-cpp not installed"
+            log.info(f"{self.error}; local model disabled.")
+            return
+        t0 = time.perf_counter()
+        llm = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads,
+                    n_threads_batch=self.n_threads, verbose=False)
+        if self.prompt_cache_mb > 0 and LlamaRAMCache is not None:
+            llm.set_cache(LlamaRAMCache(capacity_bytes=self.prompt_cache_mb << 20))
+        llm(prompt=SYSTEM_PROMPT, max_tokens=1, temperature=0.0)  # KV del prefijo común
+        self._llm = llm
+        log.info(f"Local Llama cargado en {time.perf_counter() - t0:.1f}s "
+                 f"(n_threads={self.n_threads}, n_ctx={self.n_ctx})")
+
+    def _worker(self) -> None:
+        try:
+            self._load()
+        except Exception as e:
+            self.error = f"load failed: {e!r}"
+            log.warning(f"No se pudo cargar el modelo local: {e!r}")
+        finally:
+            self._loaded.set()
+        jobs = self._jobs
+        while (job := jobs.get()) is not None:
+            if job.cancelled:
+                continue
+            if self._llm is None:
+                job.put(("err", RuntimeError(f"Local LLM not available: {self.error}")))
+                continue
+            try:
+                for chunk in self._llm(prompt=job.prompt, max_tokens=job.max_tokens,
+                                       temperature=job.temperature, stream=True):
+                    if job.cancelled:
+                        break
+                    text = chunk["choices"][0]["text"]
+                    if text:
+                        job.put(("tok", text))
+                self.served += 1
+                job.put(("end", None))
+            except Exception as e:
+                if not job.cancelled:
+                    try:
+                        job.put(("err", e))
+                    except RuntimeError:  # loop del llamador ya cerrado
+                        pass
+
+    # --- peticiones ---
+    def _submit(self, job: _Job) -> None:
+        self.start()
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            raise RuntimeError(f"Local LLM queue full ({self._jobs.maxsize} pending)") from None
+
+    def stream(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> LocalLLMStream:
+        return LocalLLMStream(self, prompt, max_tokens, temperature)
+
+    async def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> str:
+        s = self.stream(prompt, max_tokens, temperature)
+        async for _ in s:
+            pass
+        return s.text
+
+    def stats(self) -> Dict[str, Any]:
+        if self._thread is None:
+            state = "stopped"
+        elif not self._loaded.is_set():
+            state = "loading"
+        else:
+            state = "ready" if self._llm is not None else "unavailable"
+        return {"state": state, "queued": self._jobs.qsize() if self._jobs else 0, "served": self.served,
+                "n_threads": self.n_threads or 0, "n_ctx": self.n_ctx or 0}
+
+_engine: Optional[LlamaEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> LlamaEngine:
+    """Motor local del proceso (se crea sin arrancar; arranca con la primera petición o `ready`)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LlamaEngine()
+        return _engine
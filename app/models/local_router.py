@@ -0,0 +1,119 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import orjson
+from rapidfuzz import fuzz, process, utils
+from app.config import settings
+from app.logging_setup import get_logger
+from app.models.embeddings import embed_array
+
+log = get_logger("local_router")
+
+class LocalRouter:
+    """
+    Clasificador de dominio por centroide más cercano sobre embeddings de queries etiquetadas.
+    Confianza = probabilidad softmax (temperatura `temp`) del centroide ganador. Un casi-duplicado
+    léxico de un ejemplo (`token_sort_ratio` ≥ `fuzzy_min` y longitudes parecidas) decide
+    directamente con su etiqueta; una query que solo comparte palabras con un ejemplo no cuenta.
+    Solo participan dominios con al menos `min_examples` ejemplos; hacen falta dos o más.
+    """
+    def __init__(self, examples: Sequence[Tuple[str, str]], min_examples: int = 3,
+                 temp: float = 0.05, fuzzy_min: float = 95.0):
+        self.texts = [q for q, _ in examples]
+        self.labels = [d for _, d in examples]
+        self.min_examples = min_examples
+        self.temp = temp
+        self.fuzzy_min = fuzzy_min
+        self.domains: List[str] = []
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def ready(self) -> bool:
+        return len(self.domains) >= 2
+
+    def fit(self) -> "LocalRouter":
+        counts: Dict[str, int] = {}
+        for d in self.labels:
+            counts[d] = counts.get(d, 0) + 1
+        self.domains = sorted(d for d, n in counts.items() if n >= self.min_examples)
+        if not self.ready:
+            return self
+        vecs = embed_array(self.texts)
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        labels = np.array(self.labels)
+        cents = np.stack([vecs[labels == d].mean(axis=0) for d in self.domains])
+        self.centroids = (cents / np.maximum(np.linalg.norm(cents, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+        return self
+
+    def predict(self, query: str, vec: Optional[np.ndarray] = None) -> Optional[Tuple[str, float]]:
+        """(dominio, confianza) o None si no hay modelo."""
+        if not self.ready:
+            return None
+        m = process.extractOne(query, self.texts, scorer=fuzz.token_sort_ratio,
+                               processor=utils.default_process, score_cutoff=self.fuzzy_min)
+        if m is not None and self.labels[m[2]] in self.domains:
+            a, b = len(query.strip()), len(m[0].strip())
+            if min(a, b) >= 0.8 * max(a, b):
+                return self.labels[m[2]], m[1] / 100.0
+        if vec is None:
+            vec = embed_array([query])[0]
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        if v.shape[0] != self.centroids.shape[1]:
+            return None
+        v = v / max(float(np.linalg.norm(v)), 1e-12)
+        sims = self.centroids @ v
+        p = np.exp((sims - sims.max()) / self.temp)
+        p /= p.sum()
+        best = int(np.argmax(p))
+        return self.domains[best], float(p[best])
+
+def load_examples(memory_path: Path, datasets: Sequence[Path]) -> List[Tuple[str, str]]:
+    """
+    (query, dominio) de los datasets con campo `domain` y del historial: solo entradas
+    enrutadas por el LLM (o su caché), para no reentrenar con las propias predicciones.
+    """
+    out: Dict[str, str] = {}
+    for path in list(datasets) + [memory_path]:
+        if not path.exists():
+            continue
+        for line in path.read_bytes().splitlines():
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            q, d = rec.get("q"), rec.get("domain")
+            if not q or not d or rec.get("route_source", "llm") not in ("llm", "cache"):
+                continue
+            out[q] = d
+    return list(out.items())
+
+_router: Optional[LocalRouter] = None
+_stamp: Optional[Tuple] = None
+_fitted_at = 0.0
+_lock = threading.Lock()
+
+def _paths() -> Tuple[Path, List[Path]]:
+    memory = settings.base_dir / ".memory.jsonl"
+    datasets = [settings.base_dir / p for p in settings.router_train_datasets.split(",") if p.strip()]
+    return memory, datasets
+
+def get_local_router() -> LocalRouter:
+    """
+    Clasificador del proceso. Se reentrena si cambian el historial o los datasets (mtime/tamaño),
+    como mucho una vez cada `ROUTER_RETRAIN_INTERVAL` segundos (el historial crece con cada query).
+    """
+    global _router, _stamp, _fitted_at
+    memory, datasets = _paths()
+    with _lock:
+        if _router is not None and time.monotonic() - _fitted_at < settings.router_retrain_interval:
+            return _router
+        stamp = tuple((p.stat().st_mtime_ns, p.stat().st_size) if p.exists() else None for p in [memory, *datasets])
+        _fitted_at = time.monotonic()
+        if _router is None or stamp != _stamp:
+            examples = load_examples(memory, datasets)
+            _router = LocalRouter(examples, min_examples=settings.router_local_min_examples).fit()
+            _stamp = stamp
+            log.info(f"Router local: {len(examples)} ejemplos, dominios={_router.domains}")
+        return _router
@@ -1,14 +1,18 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
-from openai import OpenAI
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional
+from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel
 from tenacity import retry, wait_exponential_jitter, stop_after_attempt
 from app.config import settings
 from app.logging_setup import get_logger
-from app.utils.token_budget import enforce_token_budget
+from app.utils.token_budget import count_message_tokens, count_tokens, enforce_token_budget
 
 log = get_logger("openai_llm")
 client = OpenAI(api_key=settings.openai_api_key)
+aclient = AsyncOpenAI(api_key=settings.openai_api_key)
 
 class LLMUsage(BaseModel):
     input_tokens: int = 0
@@ -16,6 +20,14 @@ class LLMUsage(BaseModel):
     cost_usd: float = 0.0
     model: str
 
+    def log_line(self) -> str:
+        """Formato de una entrada de `usage_log`."""
+        return self.model + f"|in={self.input_tokens}|out={self.output_tokens}|${self.cost_usd:.6f}"
+
+# Sumidero del uso consumido por llamadas abortadas (cancelación de la tarea). El scheduler
+# lo fija por paso para poder registrar ese gasto aunque el agente nunca reciba la respuesta.
+cancelled_usage: ContextVar[Optional[List[LLMUsage]]] = ContextVar("cancelled_usage", default=None)
+
 def _estimate_cost(model: str, in_tok: int, out_tok: int) -> float:
     pricing = {
         "gpt-5": (settings.price_in_gpt5, settings.price_out_gpt5),
@@ -78,17 +90,15 @@ def _extract_text(choices) -> str:
         log.warning("Respuesta del modelo sin contenido textual interpretable.")
     return text
 
-@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
-def call_llm(
-    model: str,
-    messages: List[Dict[str, str]],
-    json_object: bool = False,
-    temperature: float = 0.2,
-    max_tokens: Optional[int] = None,
-) -> tuple[str, LLMUsage]:
-    """Directo a Chat Completions con robust text extraction y fallback de modelos."""
-    messages = enforce_token_budget(messages)
+# --- construcción de kwargs y fallbacks compartidos (sync / async) ---
 
+def _build_kwargs(
+    model: str,
+    messages: List[Dict[str, Any]],
+    json_object: bool,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+) -> Dict[str, Any]:
     kwargs: Dict[str, Any] = dict(model=model, messages=messages)
     if temperature is not None and temperature != 1:
         kwargs["temperature"] = temperature
@@ -96,160 +106,269 @@ def call_llm(
         kwargs["response_format"] = {"type": "json_object"}
     if max_tokens is not None:
         kwargs["max_completion_tokens"] = max_tokens
+    return kwargs
 
-    total_in = 0
-    total_out = 0
-    used_models: List[str] = []
+def _mm_messages(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    content_parts: List[Dict[str, Any]] = []
+    for p in parts:
+        if p.get("type") == "input_text":
+            content_parts.append({"type": "text", "text": p.get("text", "")})
+        elif p.get("type") == "input_image":
+            content_parts.append({"type": "image_url", "image_url": {"url": p.get("image_url", "")}})
+    return [{"role": "user", "content": content_parts}]
+
+def _relax_kwargs(k: Dict[str, Any], err: Exception, max_tokens: Optional[int], mm: bool = False) -> bool:
+    """Quita in-place el parámetro que el modelo no soporta. False si el error no es de ese tipo."""
+    se = str(err).lower()
+    if "max_completion_tokens" in k and "max_tokens" in se and "unsupported" in se:
+        k.pop("max_completion_tokens", None)
+        if max_tokens is not None:
+            k["max_tokens"] = max_tokens
+        return True
+    if "temperature" in k and "temperature" in se and "unsupported" in se:
+        log.info("Retry multimodal sin temperature (no soportado)." if mm
+                 else "Retry sin temperature (no soportado por el modelo).")
+        k.pop("temperature", None)
+        return True
+    return False
+
+def _alt_models(mm: bool) -> List[str]:
+    return ["gpt-4o-mini", "gpt-4o"] if mm else ["gpt-4o-mini", "gpt-4o", "gpt-4o-2024-05-13"]
+
+class _Tally:
+    """Acumula tokens y modelos usados a lo largo de reintentos y fallbacks."""
+    def __init__(self) -> None:
+        self.total_in = 0
+        self.total_out = 0
+        self.used_models: List[str] = []
 
-    def _invoke(k: Dict[str, Any]):
-        return client.chat.completions.create(**k)
+    def add(self, usage_raw: Any, model: Optional[str] = None) -> None:
+        self.total_in += getattr(usage_raw, "prompt_tokens", 0) or 0
+        self.total_out += getattr(usage_raw, "completion_tokens", 0) or 0
+        if model:
+            self.used_models.append(model)
+
+    def usage(self) -> LLMUsage:
+        last = self.used_models[-1]
+        return LLMUsage(
+            model=last,
+            input_tokens=self.total_in,
+            output_tokens=self.total_out,
+            cost_usd=_estimate_cost(last, self.total_in, self.total_out),
+        )
+
+def _complete(kwargs: Dict[str, Any], json_object: bool, max_tokens: Optional[int], mm: bool = False) -> tuple[str, LLMUsage]:
+    tally = _Tally()
 
     def _one_attempt(k: Dict[str, Any]) -> tuple[str, Any]:
         try:
-            cc_local = _invoke(k)
+            cc_local = client.chat.completions.create(**k)
         except Exception as e:
-            se = str(e).lower()
-            if "max_completion_tokens" in k and "max_tokens" in se and "unsupported" in se:
-                k.pop("max_completion_tokens", None)
-                if max_tokens is not None:
-                    k["max_tokens"] = max_tokens
-                cc_local = _invoke(k)
-            elif "temperature" in k and "temperature" in se and "unsupported" in se:
-                log.info("Retry sin temperature (no soportado por el modelo).")
-                k.pop("temperature", None)
-                cc_local = _invoke(k)
-            else:
+            if not _relax_kwargs(k, e, max_tokens, mm):
+                if mm:
+                    raise RuntimeError(f"Multimodal call failed: {e}")
                 raise
-        text_local = _extract_text(cc_local.choices)
-        usage_raw_local = cc_local.usage
-        return text_local, usage_raw_local
+            cc_local = client.chat.completions.create(**k)
+        return _extract_text(cc_local.choices), cc_local.usage
 
     # Primary attempt
     text, usage_raw = _one_attempt(kwargs)
-    used_models.append(model)
-    total_in += getattr(usage_raw, "prompt_tokens", 0)
-    total_out += getattr(usage_raw, "completion_tokens", 0)
+    tally.add(usage_raw, kwargs["model"])
 
     if json_object and not text.strip() and kwargs.get("response_format"):
         log.warning("Contenido vacío con response_format; reintentando sin JSON mode.")
         kwargs_no = dict(kwargs)
         kwargs_no.pop("response_format", None)
         t2, u2 = _one_attempt(kwargs_no)
-        total_in += getattr(u2, "prompt_tokens", 0)
-        total_out += getattr(u2, "completion_tokens", 0)
+        tally.add(u2)
         if t2.strip():
             text = t2
 
     # Model fallback if still empty
     if not text.strip():
-        alt_models = [m for m in ["gpt-4o-mini", "gpt-4o", "gpt-4o-2024-05-13"] if m not in used_models]
-        for alt in alt_models:
-            log.warning(f"Texto vacío con modelo {model}; intentando fallback {alt}.")
+        for alt in [m for m in _alt_models(mm) if m not in tally.used_models]:
+            log.warning(f"Texto vacío con modelo {kwargs['model']}; intentando fallback {alt}.")
             alt_kwargs = dict(kwargs)
             alt_kwargs["model"] = alt
             alt_kwargs.pop("response_format", None)  # evitar modo JSON en fallback
             t_alt, u_alt = _one_attempt(alt_kwargs)
-            total_in += getattr(u_alt, "prompt_tokens", 0)
-            total_out += getattr(u_alt, "completion_tokens", 0)
-            used_models.append(alt)
+            tally.add(u_alt, alt)
             if t_alt.strip():
                 text = t_alt
                 break
 
-    usage = LLMUsage(
-        model=used_models[-1],
-        input_tokens=total_in,
-        output_tokens=total_out,
-        cost_usd=_estimate_cost(used_models[-1], total_in, total_out),
-    )
-    return text, usage
+    return text, tally.usage()
 
-@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
-def call_llm_mm(
-    model: str,
-    parts: List[Dict[str, Any]],
-    json_object: bool = True,
-    temperature: float = 0.2,
-    max_tokens: Optional[int] = 800,
-) -> tuple[str, LLMUsage]:
-    """Multimodal con extraction y fallback de modelos."""
-    content_parts: List[Dict[str, Any]] = []
-    for p in parts:
-        if p.get("type") == "input_text":
-            content_parts.append({"type": "text", "text": p.get("text", "")})
-        elif p.get("type") == "input_image":
-            content_parts.append({"type": "image_url", "image_url": {"url": p.get("image_url", "")}})
-    messages = [{"role": "user", "content": content_parts}]  # type: ignore
-
-    kwargs: Dict[str, Any] = dict(model=model, messages=messages)
-    if temperature is not None and temperature != 1:
-        kwargs["temperature"] = temperature
-    if json_object:
-        kwargs["response_format"] = {"type": "json_object"}
-    if max_tokens is not None:
-        kwargs["max_completion_tokens"] = max_tokens
+async def _acomplete(kwargs: Dict[str, Any], json_object: bool, max_tokens: Optional[int], mm: bool = False) -> tuple[str, LLMUsage]:
+    """
+    Igual que `_complete` pero sobre `AsyncOpenAI`: no bloquea el event loop.
+    Si la tarea se cancela, la petición HTTP en curso se aborta y su uso (entrada estimada;
+    la salida parcial no se conoce) se suma al de los intentos completados en `cancelled_usage`.
+    """
+    tally = _Tally()
 
-    total_in = 0
-    total_out = 0
-    used_models: List[str] = []
-
-    def _invoke(k: Dict[str, Any]):
-        return client.chat.completions.create(**k)
-
-    def _one_attempt(k: Dict[str, Any]) -> tuple[str, Any]:
+    async def _one_attempt(k: Dict[str, Any]) -> tuple[str, Any]:
         try:
-            cc_local = _invoke(k)
-        except Exception as e:
-            se = str(e).lower()
-            if "max_completion_tokens" in k and "max_tokens" in se and "unsupported" in se:
-                k.pop("max_completion_tokens", None)
-                if max_tokens is not None:
-                    k["max_tokens"] = max_tokens
-                cc_local = _invoke(k)
-            elif "temperature" in k and "temperature" in se and "unsupported" in se:
-                log.info("Retry multimodal sin temperature (no soportado).")
-                k.pop("temperature", None)
-                cc_local = _invoke(k)
-            else:
-                raise RuntimeError(f"Multimodal call failed: {e}")
-        txt_local = _extract_text(cc_local.choices)
-        usage_raw_local = cc_local.usage
-        return txt_local, usage_raw_local
+            try:
+                cc_local = await aclient.chat.completions.create(**k)
+            except Exception as e:
+                if not _relax_kwargs(k, e, max_tokens, mm):
+                    if mm:
+                        raise RuntimeError(f"Multimodal call failed: {e}")
+                    raise
+                cc_local = await aclient.chat.completions.create(**k)
+        except asyncio.CancelledError:
+            sink = cancelled_usage.get()
+            if sink is not None:
+                tally.total_in += count_message_tokens(k["messages"], k["model"])
+                tally.used_models.append(k["model"])
+                sink.append(tally.usage())
+            raise
+        return _extract_text(cc_local.choices), cc_local.usage
 
-    text, usage_raw = _one_attempt(kwargs)
-    used_models.append(model)
-    total_in += getattr(usage_raw, "prompt_tokens", 0)
-    total_out += getattr(usage_raw, "completion_tokens", 0)
+    text, usage_raw = await _one_attempt(kwargs)
+    tally.add(usage_raw, kwargs["model"])
 
     if json_object and not text.strip() and kwargs.get("response_format"):
-        log.warning("Contenido multimodal vacío con response_format; retry sin JSON mode.")
+        log.warning("Contenido vacío con response_format; reintentando sin JSON mode.")
         kwargs_no = dict(kwargs)
         kwargs_no.pop("response_format", None)
-        t2, u2 = _one_attempt(kwargs_no)
-        total_in += getattr(u2, "prompt_tokens", 0)
-        total_out += getattr(u2, "completion_tokens", 0)
+        t2, u2 = await _one_attempt(kwargs_no)
+        tally.add(u2)
         if t2.strip():
             text = t2
 
     if not text.strip():
-        alt_models = [m for m in ["gpt-4o-mini", "gpt-4o"] if m not in used_models]
-        for alt in alt_models:
-            log.warning(f"Texto multimodal vacío con {model}; fallback {alt}.")
+        for alt in [m for m in _alt_models(mm) if m not in tally.used_models]:
+            log.warning(f"Texto vacío con modelo {kwargs['model']}; intentando fallback {alt}.")
             alt_kwargs = dict(kwargs)
             alt_kwargs["model"] = alt
             alt_kwargs.pop("response_format", None)
-            t_alt, u_alt = _one_attempt(alt_kwargs)
-            total_in += getattr(u_alt, "prompt_tokens", 0)
-            total_out += getattr(u_alt, "completion_tokens", 0)
-            used_models.append(alt)
+            t_alt, u_alt = await _one_attempt(alt_kwargs)
+            tally.add(u_alt, alt)
             if t_alt.strip():
                 text = t_alt
                 break
 
-    usage = LLMUsage(
-        model=used_models[-1],
-        input_tokens=total_in,
-        output_tokens=total_out,
-        cost_usd=_estimate_cost(used_models[-1], total_in, total_out),
-    )
-    return text, usage
+    return text, tally.usage()
+
+@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
+def call_llm(
+    model: str,
+    messages: List[Dict[str, str]],
+    json_object: bool = False,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> tuple[str, LLMUsage]:
+    """Directo a Chat Completions con robust text extraction y fallback de modelos."""
+    messages = enforce_token_budget(messages, model=model, reserve=max_tokens, budget=settings.prompt_token_budget)
+    kwargs = _build_kwargs(model, messages, json_object, temperature, max_tokens)
+    return _complete(kwargs, json_object, max_tokens)
+
+@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
+def call_llm_mm(
+    model: str,
+    parts: List[Dict[str, Any]],
+    json_object: bool = True,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = 800,
+) -> tuple[str, LLMUsage]:
+    """Multimodal con extraction y fallback de modelos."""
+    kwargs = _build_kwargs(model, _mm_messages(parts), json_object, temperature, max_tokens)
+    return _complete(kwargs, json_object, max_tokens, mm=True)
+
+# tenacity detecta corutinas y usa asyncio.sleep entre reintentos (no bloquea el loop)
+@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
+async def acall_llm(
+    model: str,
+    messages: List[Dict[str, str]],
+    json_object: bool = False,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> tuple[str, LLMUsage]:
+    """Versión async de `call_llm` (AsyncOpenAI); la usan los agentes dentro de `act()`."""
+    messages = enforce_token_budget(messages, model=model, reserve=max_tokens, budget=settings.prompt_token_budget)
+    kwargs = _build_kwargs(model, messages, json_object, temperature, max_tokens)
+    return await _acomplete(kwargs, json_object, max_tokens)
+
+@retry(wait=wait_exponential_jitter(initial=1, max=10), stop=stop_after_attempt(5))
+async def acall_llm_mm(
+    model: str,
+    parts: List[Dict[str, Any]],
+    json_object: bool = True,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = 800,
+) -> tuple[str, LLMUsage]:
+    """Versión async de `call_llm_mm`."""
+    kwargs = _build_kwargs(model, _mm_messages(parts), json_object, temperature, max_tokens)
+    return await _acomplete(kwargs, json_object, max_tokens, mm=True)
+
+class LLMStream:
+    """
+    Respuesta en streaming de `astream_llm`: se itera con `async for` y produce deltas de texto.
+    Al terminar expone `text`, `usage` y `ttft` (segundos hasta el primer token). Sin reintentos
+    ni fallback de modelos: si falla antes del primer delta, el llamador decide (p.ej. `acall_llm`).
+    """
+    def __init__(self, kwargs: Dict[str, Any], max_tokens: Optional[int]):
+        self._kwargs = kwargs
+        self._max_tokens = max_tokens
+        self.text = ""
+        self.usage: Optional[LLMUsage] = None
+        self.ttft: Optional[float] = None
+
+    async def _open(self, k: Dict[str, Any]):
+        try:
+            return await aclient.chat.completions.create(**k)
+        except Exception as e:
+            if not _relax_kwargs(k, e, self._max_tokens):
+                raise
+            return await aclient.chat.completions.create(**k)
+
+    def _usage(self, usage_raw: Any) -> LLMUsage:
+        model = self._kwargs["model"]
+        in_tok = getattr(usage_raw, "prompt_tokens", None) or count_message_tokens(self._kwargs["messages"], model)
+        out_tok = getattr(usage_raw, "completion_tokens", None) or count_tokens(self.text, model)
+        return LLMUsage(model=model, input_tokens=in_tok, output_tokens=out_tok,
+                        cost_usd=_estimate_cost(model, in_tok, out_tok))
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        k = dict(self._kwargs, stream=True, stream_options={"include_usage": True})
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        usage_raw = None
+        try:
+            stream = await self._open(k)
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage_raw = chunk.usage
+                for ch in chunk.choices or []:
+                    delta = getattr(ch.delta, "content", None)
+                    if delta:
+                        if self.ttft is None:
+                            self.ttft = time.perf_counter() - t0
+                        parts.append(delta)
+                        yield delta
+        except asyncio.CancelledError:
+            # abortada: se cobra la entrada y lo ya generado
+            self.text = "".join(parts)
+            sink = cancelled_usage.get()
+            if sink is not None:
+                sink.append(self._usage(None))
+            raise
+        except Exception:
+            # cortado a medias: `usage` estima lo ya consumido (None si no llegó ningún delta)
+            self.text = "".join(parts)
+            self.usage = self._usage(None) if parts else None
+            raise
+        self.text = "".join(parts)
+        self.usage = self._usage(usage_raw)
+
+def astream_llm(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> LLMStream:
+    """Variante streaming de `acall_llm` (texto libre, sin JSON mode)."""
+    messages = enforce_token_budget(messages, model=model, reserve=max_tokens, budget=settings.prompt_token_budget)
+    return LLMStream(_build_kwargs(model, messages, False, temperature, max_tokens), max_tokens)
@@ -0,0 +1,176 @@
+import mmap
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
+import orjson
+
+MAGIC = b"MAGCHNK1"
+
+class ChunkStore:
+    """
+    Textos y metadatos de chunks por ID, en un fichero binario columnar mapeado en memoria:
+
+        MAGIC | n:u64 | ids:i64[n] (ordenados) | text_off:i64[n+1] | src:i32[n] (+pad)
+              | meta_off:i64[n+1] | texto UTF-8 concatenado | meta orjson concatenado
+
+    `source` se codifica como índice en una tabla de fuentes (guardada en la cabecera JSON);
+    el resto de metadatos va en `meta`. Abrir es O(1) y solo se decodifican los IDs pedidos.
+    Las altas/bajas posteriores se guardan en memoria hasta el siguiente `write()`.
+    """
+    def __init__(self, sources: Optional[List[str]] = None):
+        self.sources: List[str] = list(sources or [])
+        self._mm: Optional[mmap.mmap] = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._text_off = np.zeros(1, dtype=np.int64)
+        self._src = np.zeros(0, dtype=np.int32)
+        self._meta_off = np.zeros(1, dtype=np.int64)
+        self._text_base = 0
+        self._meta_base = 0
+        self._added: Dict[int, Tuple[str, dict]] = {}
+        self._deleted: Set[int] = set()
+
+    # --- apertura ---
+    @classmethod
+    def open(cls, path: Path, sources: List[str]) -> "ChunkStore":
+        store = cls(sources)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return store
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:8] != MAGIC:
+            raise ValueError(f"{path} no es un chunk store válido")
+        n = int(np.frombuffer(mm, dtype=np.uint64, count=1, offset=8)[0])
+        off = 16
+        store._ids = np.frombuffer(mm, dtype=np.int64, count=n, offset=off); off += 8 * n
+        store._text_off = np.frombuffer(mm, dtype=np.int64, count=n + 1, offset=off); off += 8 * (n + 1)
+        store._src = np.frombuffer(mm, dtype=np.int32, count=n, offset=off); off += 4 * n + (4 * n) % 8
+        store._meta_off = np.frombuffer(mm, dtype=np.int64, count=n + 1, offset=off); off += 8 * (n + 1)
+        store._text_base = off
+        store._meta_base = off + int(store._text_off[-1])
+        store._mm = mm
+        return store
+
+    # --- acceso ---
+    def _pos(self, i: int) -> int:
+        p = int(np.searchsorted(self._ids, i))
+        if p < len(self._ids) and self._ids[p] == i and i not in self._deleted:
+            return p
+        return -1
+
+    def __contains__(self, i: object) -> bool:
+        return isinstance(i, (int, np.integer)) and (int(i) in self._added or self._pos(int(i)) >= 0)
+
+    def __len__(self) -> int:
+        # _deleted solo contiene IDs de la base (borrados o sobrescritos por _added)
+        return len(self._ids) - len(self._deleted) + len(self._added)
+
+    def _pos_raw(self, i: int) -> int:
+        p = int(np.searchsorted(self._ids, i))
+        return p if p < len(self._ids) and self._ids[p] == i else -1
+
+    def ids(self) -> Iterator[int]:
+        for i in self._ids.tolist():
+            if i not in self._deleted:
+                yield i
+        yield from self._added
+
+    def _raw(self, p: int) -> Tuple[bytes, int, bytes]:
+        t0, t1 = int(self._text_off[p]), int(self._text_off[p + 1])
+        m0, m1 = int(self._meta_off[p]), int(self._meta_off[p + 1])
+        mm = self._mm
+        return (mm[self._text_base + t0:self._text_base + t1], int(self._src[p]),
+                mm[self._meta_base + m0:self._meta_base + m1])
+
+    def get(self, i: int) -> Optional[Tuple[str, dict]]:
+        if i in self._added:
+            return self._added[i]
+        p = self._pos(i)
+        if p < 0:
+            return None
+        text, src, meta_b = self._raw(p)
+        meta = orjson.loads(meta_b) if meta_b else {}
+        if src >= 0:
+            meta["source"] = self.sources[src]
+        return text.decode("utf-8"), meta
+
+    def text(self, i: int) -> str:
+        hit = self.get(i)
+        if hit is None:
+            raise KeyError(i)
+        return hit[0]
+
+    # --- mutación (en memoria) ---
+    def add(self, i: int, text: str, meta: dict) -> None:
+        self._added[i] = (text, meta)
+        if self._pos_raw(i) >= 0:
+            self._deleted.add(i)  # la versión de la base queda oculta
+
+    def remove(self, i: int) -> None:
+        self._added.pop(i, None)
+        if self._pos_raw(i) >= 0:
+            self._deleted.add(i)
+
+    # --- persistencia ---
+    def write(self, path: Path) -> None:
+        """
+        Reescribe el fichero (base + altas - bajas) de forma atómica. Actualiza `sources`.
+        Los chunks de la base se copian como bytes desde el mmap, sin decodificar ni retener.
+        """
+        src_idx = {s: k for k, s in enumerate(self.sources)}
+        enc: Dict[int, Tuple[bytes, int, bytes]] = {}
+        for i, (t, m) in self._added.items():
+            rest = {kk: v for kk, v in m.items() if kk != "source"}
+            s = m.get("source")
+            if s is not None and s not in src_idx:
+                src_idx[s] = len(self.sources)
+                self.sources.append(s)
+            enc[i] = (t.encode("utf-8"), src_idx[s] if s is not None else -1, orjson.dumps(rest) if rest else b"")
+        ids = sorted(self.ids())
+        n = len(ids)
+        text_off = np.zeros(n + 1, dtype=np.int64)
+        meta_off = np.zeros(n + 1, dtype=np.int64)
+        src = np.full(n, -1, dtype=np.int32)
+        base_pos = np.zeros(n, dtype=np.int64)
+        for k, i in enumerate(ids):
+            if i in enc:
+                tb, src[k], mb = enc[i]
+                tlen, mlen = len(tb), len(mb)
+            else:
+                p = base_pos[k] = self._pos_raw(i)
+                src[k] = self._src[p]
+                tlen = int(self._text_off[p + 1] - self._text_off[p])
+                mlen = int(self._meta_off[p + 1] - self._meta_off[p])
+            text_off[k + 1] = text_off[k] + tlen
+            meta_off[k + 1] = meta_off[k] + mlen
+        tmp = str(path) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(n).tobytes())
+            f.write(np.asarray(ids, dtype=np.int64).tobytes())
+            f.write(text_off.tobytes())
+            f.write(src.tobytes())
+            f.write(b"\0" * ((4 * n) % 8))
+            f.write(meta_off.tobytes())
+            for col in (0, 2):  # sección de textos, luego sección de metadatos
+                for k, i in enumerate(ids):
+                    f.write(enc[i][col] if i in enc else self._raw(int(base_pos[k]))[col])
+        os.replace(tmp, path)
+
+class TextsView(Mapping):
+    """Vista dict-like {id: texto} sobre un ChunkStore (decodifica bajo demanda)."""
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __getitem__(self, i: int) -> str:
+        return self._store.text(i)
+
+    def __iter__(self) -> Iterator[int]:
+        return self._store.ids()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __contains__(self, i: object) -> bool:
+        return i in self._store
@@ -1,22 +1,249 @@
+import io
 import re
-from typing import List
+from collections import deque
+from typing import Deque, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+from app.config import settings
+from app.utils.token_budget import count_tokens_batch
+
+MODES = ("sentences", "paragraphs", "markdown")
+
+# Fin de frase: . ! ? … (más cierres de comillas/paréntesis), espacio y algo que puede abrir frase
+_SENT_END = re.compile(r"""([.!?…]+["'”’»)\]]*)\s+(?=["'“‘«(\[¿¡]?[A-ZÁÉÍÓÚÑÜ0-9])""")
+_ABBREV = {"sr", "sra", "srta", "dr", "dra", "lic", "ing", "etc", "p.ej", "e.g", "i.e", "vs", "fig",
+           "núm", "art", "pág", "cap", "mr", "mrs", "ms", "st", "no", "approx", "inc", "ltd"}
+_PARA = re.compile(r"\n[ \t\r]*\n")  # también "\r\n\r\n": los ficheros se leen sin traducir saltos
+_HEADING = re.compile(r" {0,3}(#{1,6})[ \t]+(.*?)[ \t#\r]*")
+_FENCE = re.compile(r" {0,3}(```|~~~)")
+_WS = " \t\r\n\f\v"
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # offsets de carácter en el documento: text == doc[start:end]
+    end: int
+    tokens: int
+    section: Optional[str] = None  # ruta de encabezados markdown ("Intro > Riesgos")
+
+    @property
+    def span(self) -> str:
+        return f"{self.start}-{self.end}"
+
+class _Unit(NamedTuple):
+    start: int
+    end: int
+    text: str
+    sep: str  # espacio en blanco original entre la unidad anterior y esta
+    tokens: int
+    section: Optional[str]
+    breaks: bool  # empieza sección: no se junta con lo anterior
+
+def _trim(text: str, a: int, b: int) -> Tuple[int, int]:
+    while a < b and text[a] in _WS:
+        a += 1
+    while b > a and text[b - 1] in _WS:
+        b -= 1
+    return a, b
+
+def _is_abbrev(text: str, a: int, dot: int) -> bool:
+    """La palabra que acaba en `dot` es una abreviatura conocida o una inicial ("J. Smith")."""
+    ws = max(text.rfind(" ", a, dot), text.rfind("\n", a, dot), a - 1)
+    word = text[ws + 1:dot].lower().lstrip("(\"'«“")
+    return word in _ABBREV or (len(word) == 1 and word.isalpha())
+
+def sentence_spans(text: str, a: int = 0, b: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    """(inicio, fin) de cada frase de text[a:b], sin el espacio que las separa."""
+    b = len(text) if b is None else b
+    pos = a
+    for m in _SENT_END.finditer(text, a, b):
+        if text[m.start(1)] == "." and _is_abbrev(text, pos, m.start(1)):
+            continue
+        s, e = _trim(text, pos, m.end(1))
+        if s < e:
+            yield s, e
+        pos = m.end()
+    s, e = _trim(text, pos, b)
+    if s < e:
+        yield s, e
 
 def split_into_sentences(text: str) -> List[str]:
-    # Regex simple para frases. En prod usa spacy si quieres.
-    parts = re.split(r"(?<=[\.!?])\s+", text.strip())
-    return [p for p in parts if p]
-
-def chunk_text(text: str, target_tokens: int = 1200, overlap_sentences: int = 2) -> List[str]:
-    sents = split_into_sentences(text)
-    chunks, cur = [], []
-    cur_len = 0
-    for s in sents:
-        cur.append(s)
-        cur_len += len(s.split())
-        if cur_len >= target_tokens:
-            chunks.append(" ".join(cur))
-            cur = cur[-overlap_sentences:]
-            cur_len = len(" ".join(cur).split())
-    if cur:
-        chunks.append(" ".join(cur))
-    return chunks
+    return [text[s:e] for s, e in sentence_spans(text)]
+
+def _paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    pos = 0
+    for m in _PARA.finditer(text):
+        s, e = _trim(text, pos, m.start())
+        if s < e:
+            yield s, e
+        pos = m.end()
+    s, e = _trim(text, pos, len(text))
+    if s < e:
+        yield s, e
+
+def _read_blocks(stream: TextIO, block_chars: int) -> Iterator[Tuple[int, str]]:
+    """
+    (offset, texto) de bloques consecutivos que acaban justo antes de un separador de párrafo.
+    Si en `4 * block_chars` no hay ninguno, se corta en el último fin de frase o, en su defecto,
+    en el último espacio.
+    """
+    buf, base = "", 0
+    while True:
+        data = stream.read(block_chars)
+        if not data:
+            if buf:
+                yield base, buf
+            return
+        buf += data
+        cut = max(buf.rfind("\n\n"), buf.rfind("\n\r\n"))
+        if cut <= 0 and len(buf) >= 4 * block_chars:
+            for m in _SENT_END.finditer(buf):
+                if buf[m.start(1)] != "." or not _is_abbrev(buf, max(0, m.start(1) - 32), m.start(1)):
+                    cut = m.end(1)
+            if cut <= 0:
+                cut = max(buf.rfind("\n"), buf.rfind(" "))
+            if cut <= 0:
+                cut = len(buf)
+        if cut > 0:
+            yield base, buf[:cut]
+            base += cut
+            buf = buf[cut:]
+
+class _Splitter:
+    """Convierte bloques de texto en unidades (frases, párrafos, encabezados) con tokens contados."""
+    def __init__(self, mode: str, target: int, model: Optional[str]):
+        self.mode = mode
+        self.target = target
+        self.model = model
+        self.carry = ""  # espacio en blanco final del bloque anterior
+        self.in_fence = False
+        self.headings: List[str] = []
+
+    @property
+    def section(self) -> Optional[str]:
+        return " > ".join(self.headings) or None
+
+    def _spans(self, text: str) -> Iterator[Tuple[int, int, Optional[str], bool]]:
+        """(inicio, fin, sección, rompe) antes de contar tokens."""
+        for s, e in _paragraph_spans(text):
+            if self.mode == "sentences":  # un salto de párrafo también cierra frase
+                for a, b in sentence_spans(text, s, e):
+                    yield a, b, None, False
+                continue
+            if self.mode == "paragraphs":
+                yield s, e, None, False
+                continue
+            # markdown: cada línea de encabezado (fuera de bloques de código) abre sección
+            start, breaks = s, False
+            pos = s
+            while pos < e:
+                nl = text.find("\n", pos, e)
+                line_end = e if nl < 0 else nl
+                line = text[pos:line_end]
+                if _FENCE.match(line):
+                    self.in_fence = not self.in_fence
+                elif not self.in_fence and (h := _HEADING.fullmatch(line)):
+                    if pos > start:
+                        a, b = _trim(text, start, pos)
+                        if a < b:
+                            yield a, b, self.section, breaks
+                    level = len(h.group(1))
+                    self.headings = self.headings[:level - 1] + [h.group(2).strip()]
+                    a, b = _trim(text, pos, line_end)
+                    yield a, b, self.section, True
+                    start, breaks = line_end, False
+                pos = line_end + 1
+            a, b = _trim(text, start, e)
+            if a < b:
+                yield a, b, self.section, breaks
+
+    def _fit(self, text: str, s: int, e: int, n: int) -> Iterator[Tuple[int, int, int]]:
+        """Parte un tramo de más de `target` tokens: primero por frases y, si no basta, por espacios."""
+        if n <= self.target:
+            yield s, e, n
+            return
+        sents = list(sentence_spans(text, s, e))
+        if len(sents) > 1:
+            for (a, b), k in zip(sents, count_tokens_batch([text[a:b] for a, b in sents], self.model)):
+                yield from self._fit(text, a, b, k)
+            return
+        step = max(1, int((e - s) * self.target / n * 0.9))  # caracteres por trozo, con margen
+        pieces: List[Tuple[int, int]] = []
+        a = s
+        while a < e:
+            b = min(e, a + step)
+            if b < e:
+                sp = text.rfind(" ", a + 1, b)
+                b = sp if sp > a else b
+            pa, pb = _trim(text, a, b)
+            if pa < pb:
+                pieces.append((pa, pb))
+            a = b
+        for (a, b), k in zip(pieces, count_tokens_batch([text[a:b] for a, b in pieces], self.model)):
+            yield a, b, k
+
+    def units(self, base: int, text: str) -> Iterator[_Unit]:
+        spans = list(self._spans(text))
+        # cada unidad cuenta con el espacio que la precede: la suma se acerca al total del chunk
+        starts = [0] + [e for _, e, _, _ in spans[:-1]]
+        texts = [text[p:e] for p, (_, e, _, _) in zip(starts, spans)]
+        if texts:
+            texts[0] = self.carry + texts[0]
+        counts = count_tokens_batch(texts, self.model)
+        prev = 0
+        for (s, e, section, breaks), n in zip(spans, counts):
+            for a, b, k in self._fit(text, s, e, n):
+                sep = self.carry + text[prev:a]
+                self.carry = ""
+                yield _Unit(base + a, base + b, text[a:b], sep, k, section, breaks)
+                prev, breaks = b, False
+        self.carry += text[prev:]
+
+def iter_chunks(
+    source: Union[str, TextIO],
+    target_tokens: int = 1200,
+    overlap_tokens: Optional[int] = None,
+    mode: str = "sentences",
+    model: Optional[str] = None,
+    block_chars: int = 1 << 20,
+) -> Iterator[Chunk]:
+    """
+    Chunks de hasta `target_tokens` tokens del tokenizer del modelo de embeddings (o `model`)
+    sobre un texto o un fichero abierto, leído por bloques de `block_chars`: la memoria no
+    depende del tamaño del documento. Modos:
+      - "sentences": une frases.
+      - "paragraphs": une párrafos enteros; uno demasiado largo se parte por frases.
+      - "markdown": como "paragraphs", y cada encabezado empieza un chunk nuevo (`section`).
+    Cada chunk repite al final del anterior hasta `overlap_tokens` tokens de unidades completas
+    (por defecto un 10% del objetivo), salvo tras un encabezado. Cada unidad entra y sale de la
+    ventana una sola vez. Las unidades de más de `target_tokens` se parten.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown chunking mode '{mode}'; expected one of {MODES}")
+    overlap = target_tokens // 10 if overlap_tokens is None else overlap_tokens
+    stream = io.StringIO(source) if isinstance(source, str) else source
+    splitter = _Splitter(mode, target_tokens, model or settings.embedding_model)
+    window: Deque[_Unit] = deque()
+    total = 0
+
+    def emit() -> Chunk:
+        first = window[0]
+        text = first.text + "".join(u.sep + u.text for u in list(window)[1:])
+        return Chunk(text, first.start, window[-1].end, total, first.section)
+
+    for base, block in _read_blocks(stream, block_chars):
+        for u in splitter.units(base, block):
+            if window and (u.breaks or total + u.tokens > target_tokens):
+                yield emit()
+                if u.breaks:
+                    window.clear()
+                    total = 0
+                # solapamiento: se quedan las últimas unidades que caben en `overlap`
+                # y dejan sitio a la nueva dentro del objetivo
+                while window and (total > overlap or total + u.tokens > target_tokens):
+                    total -= window.popleft().tokens
+            window.append(u)
+            total += u.tokens
+    if window:
+        yield emit()
+
+def chunk_text(text: str, target_tokens: int = 1200, overlap_tokens: Optional[int] = None,
+               mode: str = "sentences") -> List[str]:
+    return [c.text for c in iter_chunks(text, target_tokens, overlap_tokens, mode)]
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.rag.vectorstore import SimpleFAISS
+from app.utils.executor import run_blocking
+
+RETRIEVAL_MODES = ("hybrid", "dense", "sparse")
+
+def rrf(rankings: Sequence[Sequence[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Reciprocal rank fusion: cada lista aporta 1 / (k + posición) a sus IDs. Solo usa el orden,
+    así que combina scores de escalas distintas (coseno, BM25). Empates: gana el ID menor.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for pos, (i, _score) in enumerate(ranking, start=1):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + pos)
+    return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))
+
+async def retrieve(vs: SimpleFAISS, query: str, candidates: int = 20, mode: str = "hybrid",
+                   vec: Optional[np.ndarray] = None, rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Candidatos [(id, score)] para `query`. En modo "hybrid" las búsquedas densa (faiss) y
+    léxica (BM25) corren a la vez en el pool de CPU y se fusionan con RRF.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'; expected one of {RETRIEVAL_MODES}")
+    if mode == "dense":
+        return await run_blocking(vs.search_ids, query, candidates, vec, pool="cpu")
+    if mode == "sparse":
+        return await run_blocking(vs.search_sparse_ids, query, candidates, pool="cpu")
+    dense, sparse = await asyncio.gather(
+        run_blocking(vs.search_ids, query, candidates, vec, pool="cpu"),
+        run_blocking(vs.search_sparse_ids, query, candidates, pool="cpu"),
+    )
+    return rrf([dense, sparse], k=rrf_k)
@@ -0,0 +1,81 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from app.config import settings
+from app.logging_setup import get_logger
+from app.rag.vectorstore import SimpleFAISS
+
+log = get_logger("index_service")
+
+class IndexService:
+    """
+    Índice compartido por todo el proceso: se carga una vez (mmap) y se reutiliza entre queries.
+    Si los ficheros en disco cambian (p.ej. tras `scripts/ingest.py`), se recarga en caliente;
+    las búsquedas en curso siguen usando la instancia anterior hasta terminar.
+    """
+    def __init__(self, persist_dir: Path, name: str = "default", check_interval: float = 2.0):
+        self.persist_dir = persist_dir
+        self.name = name
+        self.check_interval = check_interval
+        self.build_lock = threading.Lock()  # serializa ingestas en frío
+        self._lock = threading.Lock()
+        self._vs: Optional[SimpleFAISS] = None
+        self._stamp: Optional[Tuple[int, ...]] = None
+        self._checked = 0.0
+
+    def _disk_stamp(self) -> Optional[Tuple[int, ...]]:
+        """mtimes de (faiss, chunks, bm25, json); 0 si falta un fichero opcional de formatos anteriores."""
+        stamp = []
+        for ext in ("faiss", "chunks", "bm25", "json"):
+            try:
+                stamp.append((self.persist_dir / f"{self.name}.{ext}").stat().st_mtime_ns)
+            except FileNotFoundError:
+                if ext in ("faiss", "json"):
+                    return None
+                stamp.append(0)
+        return tuple(stamp)
+
+    def get(self) -> Optional[SimpleFAISS]:
+        """Índice actual, o None si aún no hay uno persistido."""
+        now = time.monotonic()
+        if self._vs is not None and now - self._checked < self.check_interval:
+            return self._vs
+        with self._lock:
+            self._checked = now
+            stamp = self._disk_stamp()
+            if stamp is None or stamp == self._stamp:
+                return self._vs
+            # save() escribe el JSON el último: si es más antiguo que otro fichero, hay un
+            # guardado a medio renombrar; se sigue con el índice anterior y se reintenta
+            if stamp[-1] < max(stamp[:-1]):
+                self._checked = 0.0
+                return self._vs
+            vs = SimpleFAISS(self.persist_dir)
+            try:
+                vs.load(self.name, mmap=True)
+            except Exception as e:
+                log.warning(f"No se pudo cargar el índice '{self.name}': {e}")
+                return self._vs
+            if self._disk_stamp() != stamp:  # otro guardado durante la carga: mezcla posible
+                self._checked = 0.0
+                return self._vs
+            log.info(f"Índice '{self.name}' {'recargado' if self._vs else 'cargado'} ({len(vs.texts)} chunks).")
+            self._vs, self._stamp = vs, stamp
+            return vs
+
+    def invalidate(self):
+        """Fuerza la comprobación en disco en el siguiente get()."""
+        self._checked = 0.0
+
+_services: Dict[Tuple[str, str], IndexService] = {}
+_services_lock = threading.Lock()
+
+def get_index_service(name: str = "default", persist_dir: Optional[Path] = None) -> IndexService:
+    persist_dir = persist_dir or settings.vectorstore_dir
+    key = (str(persist_dir), name)
+    with _services_lock:
+        svc = _services.get(key)
+        if svc is None:
+            svc = _services[key] = IndexService(persist_dir, name)
+        return svc
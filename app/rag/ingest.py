@@ -0,0 +1,124 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Any
+import orjson
+from app.config import settings
+from app.rag.chunking import iter_chunks
+from app.rag.vectorstore import SimpleFAISS
+from app.logging_setup import get_logger
+
+log = get_logger("ingest")
+
+SUFFIXES = {".txt", ".md"}
+BATCH_CHUNKS = 2048  # chunks por add_texts: acota la memoria con documentos grandes
+
+def _file_sha(p: Path) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def manifest_path(vs: SimpleFAISS, name: str) -> Path:
+    return vs.persist_dir / f"{name}.manifest.json"
+
+def _chunk_mode(p: Path) -> str:
+    if settings.chunk_mode != "auto":
+        return settings.chunk_mode
+    return "markdown" if p.suffix.lower() == ".md" else "paragraphs"
+
+def load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    """{ruta relativa: {"mtime", "size", "sha", "ids"}}"""
+    if not path.exists():
+        return {}
+    return orjson.loads(path.read_bytes())
+
+def sync_directory(
+    vs: SimpleFAISS,
+    corpus_dir: Path,
+    name: str = "default",
+    target_tokens: int = 1200,
+    full: bool = False,
+) -> Dict[str, int]:
+    """
+    Sincroniza el índice con `corpus_dir`: embebe solo ficheros nuevos o modificados
+    y borra los vectores de los eliminados. Devuelve contadores de la operación.
+    Los ficheros se leen en streaming y los chunks se embeben en lotes de `BATCH_CHUNKS`
+    (de uno o varios ficheros); cada chunk guarda su `span` (offsets de carácter) y su sección.
+    """
+    mpath = manifest_path(vs, name)
+    # índice previo sin manifest (ingesta antigua): no se sabe qué IDs son de qué fichero
+    full = full or (not mpath.exists() and bool(vs.texts))
+    manifest = {} if full else load_manifest(mpath)
+    if manifest and (vs.index is None or not vs.texts):
+        # manifest sin índice (faiss borrado o ilegible): lo "sin cambios" no está indexado
+        log.warning(f"El manifest de '{name}' no tiene índice detrás; reconstruyendo desde cero.")
+        full, manifest = True, {}
+    if full:
+        vs.reset()  # IVF se vuelve a entrenar con el corpus completo
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0, "chunks": 0}
+
+    seen: set[str] = set()
+    stale_ids: List[int] = []
+    touched = False
+    changed = False
+    texts: List[str] = []
+    metas: List[dict] = []
+    owners: List[Dict[str, Any]] = []  # entrada del manifest de cada chunk pendiente
+
+    def flush():
+        ids = vs.add_texts(texts, metas)
+        for entry, i in zip(owners, ids):
+            entry["ids"].append(i)
+        stats["chunks"] += len(ids)
+        texts.clear()
+        metas.clear()
+        owners.clear()
+
+    files = sorted(p for p in corpus_dir.rglob("*") if p.is_file() and p.suffix.lower() in SUFFIXES) \
+        if corpus_dir.exists() else []
+    for p in files:
+        rel = str(p.relative_to(corpus_dir))
+        seen.add(rel)
+        st = p.stat()
+        old = manifest.get(rel)
+        if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+            stats["unchanged"] += 1
+            continue
+        sha = _file_sha(p)
+        if old and old["sha"] == sha:  # touch sin cambios de contenido
+            old.update(mtime=st.st_mtime, size=st.st_size)
+            touched = True
+            stats["unchanged"] += 1
+            continue
+        if old:
+            stale_ids.extend(old["ids"])
+        entry = manifest[rel] = {"mtime": st.st_mtime, "size": st.st_size, "sha": sha, "ids": []}
+        changed = True
+        # newline="": sin traducir "\r\n", los spans son offsets en el texto decodificado del fichero
+        with open(p, encoding="utf-8", errors="ignore", newline="") as f:
+            for c in iter_chunks(f, target_tokens, settings.chunk_overlap_tokens, mode=_chunk_mode(p)):
+                meta = {"source": str(p), "span": c.span}
+                if c.section:
+                    meta["section"] = c.section
+                texts.append(c.text)
+                metas.append(meta)
+                owners.append(entry)
+                if len(texts) >= BATCH_CHUNKS:
+                    flush()
+        stats["updated" if old else "added"] += 1
+
+    for rel in [r for r in manifest if r not in seen]:
+        stale_ids.extend(manifest.pop(rel)["ids"])
+        stats["deleted"] += 1
+
+    flush()
+    vs.remove_ids(stale_ids)
+
+    if (changed or stale_ids or full) and vs.index is not None:
+        vs.save(name)
+    if changed or stale_ids or full or touched or not mpath.exists():
+        mpath.parent.mkdir(parents=True, exist_ok=True)
+        mpath.write_bytes(orjson.dumps(manifest))
+    log.info(f"Ingesta '{name}': {stats}")
+    return stats
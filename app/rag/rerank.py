@@ -0,0 +1,83 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+def mmr(relevance: Sequence[float], vecs: np.ndarray, k: int, lambda_: float = 0.7) -> List[int]:
+    """
+    Maximal marginal relevance: posiciones de `k` candidatos que maximizan
+    λ·relevancia − (1−λ)·máx. similitud coseno con los ya elegidos. `relevance` se reescala
+    a [0, 1] (puede venir de RRF, BM25 o coseno). λ = 1 equivale a quedarse con los k primeros.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    rel = np.asarray(relevance, dtype=np.float32)
+    span = float(rel.max() - rel.min())
+    rel = (rel - rel.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+    v = np.asarray(vecs, dtype=np.float32)
+    v = v / np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+    sims = v @ v.T
+    chosen = [int(np.argmax(rel))]
+    max_sim = sims[chosen[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[chosen[0]] = False
+    for _ in range(k - 1):
+        score = np.where(available, lambda_ * rel - (1.0 - lambda_) * max_sim, -np.inf)
+        best = int(np.argmax(score))
+        chosen.append(best)
+        available[best] = False
+        np.maximum(max_sim, sims[best], out=max_sim)
+    return chosen
+
+def _span(meta: dict) -> Optional[Tuple[int, int]]:
+    try:
+        a, b = str(meta.get("span") or "").split("-")
+        return int(a), int(b)
+    except ValueError:
+        return None
+
+def merge_adjacent(passages: Sequence[Tuple[str, dict, float]], max_gap: int = 2) -> List[Tuple[str, dict, float]]:
+    """
+    Une pasajes de la misma fuente cuyos `span` se solapan o están a `max_gap` caracteres o menos
+    (chunks consecutivos con solapamiento). El texto se reconstruye con los offsets, sin repetir
+    el tramo compartido. Cada grupo ocupa el puesto de su mejor pasaje y conserva su score.
+    """
+    groups: List[List[Tuple[int, int, str, dict, float, int]]] = []
+    loose: List[Tuple[int, Tuple[str, dict, float]]] = []
+    by_source: dict = {}
+    for rank, (text, meta, score) in enumerate(passages):
+        sp = _span(meta)
+        if sp is None:
+            loose.append((rank, (text, meta, score)))
+            continue
+        by_source.setdefault(meta.get("source"), []).append((sp[0], sp[1], text, meta, score, rank))
+    for items in by_source.values():
+        items.sort(key=lambda it: (it[0], it[1], it[5]))
+        cur, cur_end = [items[0]], items[0][1]
+        for it in items[1:]:
+            if it[0] - cur_end <= max_gap:
+                cur.append(it)
+                cur_end = max(cur_end, it[1])
+            else:
+                groups.append(cur)
+                cur, cur_end = [it], it[1]
+        groups.append(cur)
+
+    out: List[Tuple[int, Tuple[str, dict, float]]] = list(loose)
+    for g in groups:
+        start, end, text = g[0][0], g[0][1], g[0][2]
+        for s, e, t, _m, _sc, _r in g[1:]:
+            if e <= end:
+                continue  # contenido dentro de lo ya unido
+            if s >= end:
+                text += (" " if s - end <= 1 else "\n\n") + t
+            else:
+                text += t[end - s:]
+            end = e
+        best = min(g, key=lambda it: it[5])
+        meta = dict(best[3], span=f"{start}-{end}")
+        if len(g) > 1:
+            meta["merged"] = len(g)
+        out.append((best[5], (text, meta, best[4])))
+    out.sort(key=lambda r: r[0])
+    return [p for _rank, p in out]
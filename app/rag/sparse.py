@@ -0,0 +1,111 @@
+import math
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import orjson
+
+# Palabras, números con separadores (1,200.50 · 3.5%) y códigos compuestos (EUR/USD · ISIN-US0378…)
+_TOKEN = re.compile(r"[^\W_]+(?:[.,:/\-][^\W_]+)*%?")
+_SPLIT = re.compile(r"[.,:/\-%]")
+_FOLD = str.maketrans("áéíóúüàèìòùâêîôûç", "aeiouuaeiouaeiouc")
+
+def tokenize(text: str) -> List[str]:
+    """Términos para BM25: minúsculas sin tildes; un compuesto con letras añade también sus partes."""
+    out: List[str] = []
+    for m in _TOKEN.finditer(text.lower().translate(_FOLD)):
+        tok = m.group()
+        out.append(tok)
+        if len(tok) > 1 and _SPLIT.search(tok) and not tok.replace(".", "").replace(",", "").rstrip("%").isdigit():
+            out.extend(p for p in _SPLIT.split(tok) if p)
+    return out
+
+class BM25Index:
+    """
+    Índice invertido BM25 por ID de chunk (los mismos IDs que el índice FAISS).
+    `remove` recibe el texto para no guardar un índice directo: se re-tokeniza al borrar.
+    Se persiste junto al índice denso (`{name}.bm25`) y se carga entero en memoria.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_len: Dict[int, int] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[int, str]]) -> "BM25Index":
+        idx = cls()
+        for i, text in docs:
+            idx.add(i, text)
+        return idx
+
+    def add(self, i: int, text: str) -> None:
+        if i in self.doc_len:
+            return
+        terms = tokenize(text)
+        tf: Dict[str, int] = {}
+        for t in terms:
+            tf[t] = tf.get(t, 0) + 1
+        for t, n in tf.items():
+            self.postings.setdefault(t, {})[i] = n
+        self.doc_len[i] = len(terms)
+        self.total_len += len(terms)
+
+    def remove(self, i: int, text: str) -> None:
+        n = self.doc_len.pop(i, None)
+        if n is None:
+            return
+        self.total_len -= n
+        for t in set(tokenize(text)):
+            post = self.postings.get(t)
+            if post is not None:
+                post.pop(i, None)
+                if not post:
+                    del self.postings[t]
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """[(id, score)] de mayor a menor; vacío si ningún término de la query está indexado."""
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avgdl = self.total_len / n_docs or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[int, float] = {}
+        for t in set(tokenize(query)):
+            post = self.postings.get(t)
+            if not post:
+                continue
+            idf = math.log(1.0 + (n_docs - len(post) + 0.5) / (len(post) + 0.5))
+            for i, tf in post.items():
+                norm = tf + k1 * (1.0 - b + b * self.doc_len[i] / avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1.0) / norm
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+    # --- persistencia ---
+    def save(self, path: Path) -> None:
+        """Escritura atómica (tmp + rename); postings aplanados como [id, tf, id, tf, ...]."""
+        data = {
+            "format": "bm25-v1",
+            "k1": self.k1,
+            "b": self.b,
+            "doc_len": [x for kv in self.doc_len.items() for x in kv],
+            "postings": {t: [x for kv in post.items() for x in kv] for t, post in self.postings.items()},
+        }
+        tmp = str(path) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        data = orjson.loads(Path(path).read_bytes())
+        idx = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        dl = data["doc_len"]
+        idx.doc_len = dict(zip(dl[::2], dl[1::2]))
+        idx.total_len = sum(idx.doc_len.values())
+        idx.postings = {t: dict(zip(p[::2], p[1::2])) for t, p in data["postings"].items()}
+        return idx
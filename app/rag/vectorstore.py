@@ -1,43 +1,284 @@
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
+import os
 import faiss
 import numpy as np
 from pathlib import Path
 import orjson
-from app.models.embeddings import embed_texts
+from app.config import settings
+from app.logging_setup import get_logger
+from app.models.embeddings import embed_array
+from app.rag.chunk_store import ChunkStore, TextsView
+from app.rag.sparse import BM25Index
+
+log = get_logger("vectorstore")
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+def _pq_m(dim: int, m: int) -> int:
+    # IVF-PQ exige que m divida la dimensión
+    while m > 1 and dim % m:
+        m -= 1
+    return max(1, m)
+
+def make_index(kind: str, train: np.ndarray) -> Tuple[faiss.Index, str]:
+    """
+    Crea (y entrena si hace falta) el índice base. `train` son los vectores de la primera ingesta;
+    con pocos vectores se reduce nlist y, si no alcanza para PQ, se cae a IVF-Flat / Flat.
+    Devuelve el índice y el tipo efectivo (el pedido o aquel al que se cayó).
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{kind}'; expected one of {INDEX_TYPES}")
+    n, dim = train.shape
+    ip = faiss.METRIC_INNER_PRODUCT
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings.vector_hnsw_m, ip)
+        index.hnsw.efConstruction = settings.vector_ef_construction
+        return index, kind
+    if kind.startswith("ivf"):
+        nlist = max(1, min(settings.vector_nlist, n // 39))  # ~39 puntos por centroide
+        if kind == "ivf_pq" and n < 2 ** settings.vector_pq_nbits:
+            log.warning(f"{n} vectores no bastan para entrenar PQ; usando ivf_flat.")
+            kind = "ivf_flat"
+        if nlist == 1 and n < 39:
+            log.warning(f"{n} vectores no bastan para entrenar IVF; usando flat.")
+            return faiss.IndexFlatIP(dim), "flat"
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, settings.vector_pq_m),
+                                     settings.vector_pq_nbits, ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+        index.train(train)
+        return index, kind
+    return faiss.IndexFlatIP(dim), kind
+
+def with_ids(base: faiss.Index) -> faiss.Index:
+    """IVF guarda IDs propios (y su remove_ids no renumera): no se envuelve en IndexIDMap."""
+    return with_direct_map(base) if isinstance(base, faiss.IndexIVF) else faiss.IndexIDMap(base)
+
+def with_direct_map(index: faiss.Index) -> faiss.Index:
+    """
+    IVF: mapa ID → posición (Hashtable: los IDs no son secuenciales) para poder reconstruir
+    vectores. Se crea al construir o cargar el índice, nunca al leer: add/remove lo mantienen.
+    """
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF) and base.direct_map.type == faiss.DirectMap.NoMap:
+        base.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Aplica nprobe (IVF) / efSearch (HNSW) atravesando el IndexIDMap."""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexIVF) and nprobe:
+        base.nprobe = min(nprobe, base.nlist)
+    if isinstance(base, faiss.IndexHNSW) and ef_search:
+        base.hnsw.efSearch = ef_search
 
 class SimpleFAISS:
-    def __init__(self, persist_dir: Path):
+    """
+    Índice FAISS con IDs estables (IndexIDMap o IDs nativos de IVF) para poder borrar/actualizar chunks.
+    Textos y metadatos viven en un ChunkStore mapeado en memoria (`{name}.chunks`); `texts` es
+    una vista {id: texto}. El tipo de índice base sale de `settings.vector_index_type`;
+    con `vector_normalize` los scores son similitud coseno. A la par se mantiene un índice
+    BM25 (`sparse`, `{name}.bm25`) con los mismos IDs para la búsqueda léxica.
+    """
+    def __init__(self, persist_dir: Path, index_type: Optional[str] = None, normalize: Optional[bool] = None):
         self.persist_dir = persist_dir
+        self.index_type = index_type or settings.vector_index_type
+        self.normalize = settings.vector_normalize if normalize is None else normalize
         self.index = None
-        self.texts: List[str] = []
-        self.meta: List[dict] = []
+        self.store = ChunkStore()
+        self.sparse = BM25Index()
+        self.next_id = 0
+        self._id_map = None  # caché (IDs ordenados, posición de cada uno) de IndexIDMap
+
+    @property
+    def texts(self) -> TextsView:
+        return TextsView(self.store)
+
+    def reset(self, index_type: Optional[str] = None):
+        """Vacía el índice; el siguiente add_texts lo recrea (y re-entrena) con el tipo configurado."""
+        self.index_type = index_type or settings.vector_index_type
+        self.index = None
+        self.store = ChunkStore()
+        self.sparse = BM25Index()
+        self.next_id = 0
+        self._id_map = None  # caché (IDs ordenados, posición de cada uno) de IndexIDMap
+
+    def _prep(self, arr: np.ndarray) -> np.ndarray:
+        arr = np.ascontiguousarray(arr, dtype="float32")
+        if self.normalize:
+            faiss.normalize_L2(arr)
+        return arr
 
-    def add_texts(self, texts: List[str], metadatas: List[dict]):
-        vecs = embed_texts(texts)
-        arr = np.array(vecs).astype("float32")
+    def _ensure_index(self, arr: np.ndarray):
         if self.index is None:
-            self.index = faiss.IndexFlatIP(arr.shape[1])
-        self.index.add(arr)
-        self.texts.extend(texts)
-        self.meta.extend(metadatas)
+            base, self.index_type = make_index(self.index_type, arr)
+            self.index = with_ids(base)
+            self._apply_search_params()
+
+    def _apply_search_params(self):
+        set_search_params(self.index, settings.vector_nprobe, settings.vector_ef_search)
+
+    def add_texts(self, texts: List[str], metadatas: List[dict]) -> List[int]:
+        if not texts:
+            return []
+        arr = self._prep(embed_array(texts))
+        self._ensure_index(arr)
+        ids = np.arange(self.next_id, self.next_id + len(texts), dtype="int64")
+        self.next_id += len(texts)
+        self.index.add_with_ids(arr, ids)
+        for i, t, m in zip(ids.tolist(), texts, metadatas):
+            self.store.add(i, t, m)
+            self.sparse.add(i, t)
+        self._id_map = None
+        return ids.tolist()
+
+    def remove_ids(self, ids: List[int]) -> int:
+        if self.index is None or not ids:
+            return 0
+        try:
+            removed = self.index.remove_ids(np.asarray(ids, dtype="int64"))
+        except RuntimeError:
+            # HNSW no soporta borrado: se reconstruye el grafo con los vectores restantes
+            removed = self._rebuild_without(set(ids))
+        for i in ids:
+            hit = self.store.get(i)
+            if hit is not None:
+                self.sparse.remove(i, hit[0])
+            self.store.remove(i)
+        self._id_map = None
+        return int(removed)
+
+    def _rebuild_without(self, drop: set) -> int:
+        all_ids = faiss.vector_to_array(self.index.id_map)
+        vecs = self.index.index.reconstruct_n(0, self.index.ntotal)
+        keep = np.array([i not in drop for i in all_ids.tolist()], dtype=bool)
+        base, self.index_type = make_index(self.index_type, vecs[keep] if keep.any() else vecs)
+        rebuilt = with_ids(base)
+        if keep.any():
+            rebuilt.add_with_ids(vecs[keep], all_ids[keep])
+        self.index = rebuilt
+        self._apply_search_params()
+        return int((~keep).sum())
 
     def save(self, name: str):
+        """
+        Escritura en dos fases: todos los ficheros van primero a `.tmp` y después se renombran
+        seguidos, con el JSON el último. Ningún fichero se ve a medias; un lector que coincide con
+        los renombrados lo detecta por los mtimes (ver IndexService) y reintenta.
+        """
         self.persist_dir.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self.index, str(self.persist_dir / f"{name}.faiss"))
-        with open(self.persist_dir / f"{name}.json", "wb") as f:
-            f.write(orjson.dumps({"texts": self.texts, "meta": self.meta}))
+        paths = {ext: self.persist_dir / f"{name}.{ext}" for ext in ("faiss", "chunks", "bm25", "json")}
+        tmp = {ext: Path(str(p) + ".tmp") for ext, p in paths.items()}
+        faiss.write_index(self.index, str(tmp["faiss"]))
+        self.store.write(tmp["chunks"])  # actualiza `sources`, que van en el JSON
+        self.sparse.save(tmp["bm25"])
+        # cabecera pequeña; el JSON es el último (IndexService lo usa para detectar cambios)
+        with open(tmp["json"], "wb") as f:
+            f.write(orjson.dumps({
+                "format": "chunks-v1",
+                "next_id": self.next_id,
+                "index_type": self.index_type,
+                "normalize": self.normalize,
+                "sources": self.store.sources,
+            }))
+        for ext in ("faiss", "chunks", "bm25", "json"):
+            os.replace(tmp[ext], paths[ext])
+        self.store = ChunkStore.open(paths["chunks"], self.store.sources)
 
-    def load(self, name: str):
-        self.index = faiss.read_index(str(self.persist_dir / f"{name}.faiss"))
+    def load(self, name: str, mmap: bool = False):
+        """`mmap=True` mapea el índice en memoria (solo lectura: no usar add/remove después)."""
+        path = str(self.persist_dir / f"{name}.faiss")
+        index = None
+        if mmap:
+            try:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+            except RuntimeError as e:
+                log.warning(f"mmap no soportado para {path}: {e}; lectura normal.")
+        if index is None:
+            index = faiss.read_index(path)
         data = orjson.loads((self.persist_dir / f"{name}.json").read_bytes())
-        self.texts = data["texts"]; self.meta = data["meta"]
+        if "texts" in data:
+            # sidecar JSON monolítico (formatos anteriores): se carga en memoria
+            ids = data.get("ids")
+            if ids is None:
+                # formato más antiguo: índice plano sin IDs ni normalización, posición == ID
+                ids = list(range(len(data["texts"])))
+                flat = index
+                index = faiss.IndexIDMap(faiss.IndexFlatIP(flat.d))
+                if flat.ntotal:
+                    index.add_with_ids(flat.reconstruct_n(0, flat.ntotal), np.asarray(ids, dtype="int64"))
+            self.store = ChunkStore()
+            for i, t, m in zip(ids, data["texts"], data["meta"]):
+                self.store.add(i, t, m)
+            next_id = max(ids, default=-1) + 1
+        else:
+            self.store = ChunkStore.open(self.persist_dir / f"{name}.chunks", data.get("sources", []))
+            next_id = 0
+        bm25_path = self.persist_dir / f"{name}.bm25"
+        if bm25_path.exists():
+            self.sparse = BM25Index.load(bm25_path)
+        else:
+            # índice anterior al BM25: se construye desde los textos (se persiste en el próximo save)
+            log.info(f"Sin {bm25_path.name}; construyendo BM25 desde {len(self.store)} chunks.")
+            self.sparse = BM25Index.build((i, self.store.text(i)) for i in self.store.ids())
+        self.index = with_direct_map(index)
+        self.index_type = data.get("index_type", "flat")
+        self.normalize = data.get("normalize", False)
+        self.next_id = data.get("next_id", next_id)
+        self._id_map = None
+        self._apply_search_params()
 
-    def search(self, query: str, k: int = 20) -> List[Tuple[str, dict, float]]:
-        qv = np.array(embed_texts([query])[0]).astype("float32")
-        D, I = self.index.search(qv.reshape(1, -1), k)
+    def search_ids(self, query: str, k: int = 20, vec: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Búsqueda densa: [(id, score)]. Con `vec` (embedding de la query ya calculado) no se embebe."""
+        if self.index is None:
+            return []
+        if vec is not None and np.size(vec) != self.index.d:
+            vec = None  # embedding de otro modelo/dimensión: se embebe con el del índice
+        qv = self._prep(np.asarray(vec, dtype="float32").reshape(1, -1) if vec is not None else embed_array([query]))
+        D, I = self.index.search(qv, k)
+        return [(int(i), float(d)) for d, i in zip(D[0], I[0]) if i >= 0 and int(i) in self.store]
+
+    def search_sparse_ids(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """Búsqueda léxica BM25: [(id, score)]."""
+        return [(i, s) for i, s in self.sparse.search(query, k) if i in self.store]
+
+    def vectors(self, ids: Sequence[int]) -> Optional[np.ndarray]:
+        """
+        Vectores guardados en el índice para `ids` (sin volver a embeber; con PQ son aproximados).
+        None si el índice no permite reconstruirlos o falta algún ID.
+        """
+        if self.index is None or not len(ids):
+            return None
+        keys = np.asarray(ids, dtype="int64")
+        try:
+            if isinstance(self.index, faiss.IndexIDMap):
+                if self._id_map is None:
+                    id_map = faiss.vector_to_array(self.index.id_map)
+                    # los IDs se asignan crecientes y borrar no reordena: casi siempre ya están ordenados
+                    order = None if np.all(id_map[1:] > id_map[:-1]) else np.argsort(id_map)
+                    self._id_map = (id_map if order is None else id_map[order], order)
+                sorted_ids, order = self._id_map
+                pos = np.searchsorted(sorted_ids, keys)
+                if np.any(pos >= len(sorted_ids)) or np.any(sorted_ids[np.minimum(pos, len(sorted_ids) - 1)] != keys):
+                    return None
+                if order is not None:
+                    pos = order[pos]
+                return faiss.downcast_index(self.index.index).reconstruct_batch(pos)
+            return faiss.downcast_index(self.index).reconstruct_batch(keys)  # IVF: ver with_direct_map
+        except RuntimeError as e:
+            log.warning(f"No se pueden reconstruir vectores del índice: {e}")
+            return None
+
+    def fetch(self, hits: Sequence[Tuple[int, float]]) -> List[Tuple[str, dict, float]]:
+        """(texto, meta, score) de una lista [(id, score)]; los IDs que ya no existen se omiten."""
         out = []
-        for d, i in zip(D[0], I[0]):
-            if i < 0 or i >= len(self.texts): 
-                continue
-            out.append((self.texts[i], self.meta[i], float(d)))
+        for i, score in hits:
+            hit = self.store.get(i)
+            if hit is not None:
+                out.append((hit[0], hit[1], score))
         return out
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, dict, float]]:
+        return self.fetch(self.search_ids(query, k))
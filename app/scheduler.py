@@ -1,34 +1,137 @@
 from __future__ import annotations
 import asyncio
-from typing import Dict, List, Callable, Any
+from typing import Dict, List, Callable, Any, Optional, Set
 from app.blackboard import Blackboard
+from app.models.openai_llm import LLMUsage, cancelled_usage
 from app.logging_setup import get_logger
 
 log = get_logger("scheduler")
 
+class CycleError(ValueError):
+    """El plan tiene dependencias circulares (no es un DAG)."""
+
+class DagStep:
+    """Nodo del DAG: callables que corren en paralelo + nombres de pasos requeridos."""
+    def __init__(self, fns: List[Callable[[], Any]], requires: Optional[List[str]] = None):
+        self.fns = fns
+        self.requires = list(requires or [])
+
+def topo_order(dag: Dict[str, DagStep]) -> List[str]:
+    """Orden topológico (Kahn). Ignora requisitos desconocidos; lanza CycleError si hay ciclos."""
+    deps: Dict[str, List[str]] = {}
+    for name, step in dag.items():
+        known = [r for r in step.requires if r in dag and r != name]
+        for r in step.requires:
+            if r not in dag:
+                log.warning(f"Paso '{name}' requiere '{r}', que no existe en el plan. Ignorado.")
+        deps[name] = known
+    indeg = {n: len(d) for n, d in deps.items()}
+    children: Dict[str, List[str]] = {n: [] for n in dag}
+    for n, d in deps.items():
+        for r in d:
+            children[r].append(n)
+    ready = [n for n in dag if indeg[n] == 0]
+    order: List[str] = []
+    while ready:
+        n = ready.pop(0)
+        order.append(n)
+        for c in children[n]:
+            indeg[c] -= 1
+            if indeg[c] == 0:
+                ready.append(c)
+    if len(order) != len(dag):
+        cyclic = sorted(n for n in dag if n not in order)
+        raise CycleError(f"Ciclo en el plan entre pasos: {cyclic}")
+    for n, d in deps.items():
+        dag[n].requires = d
+    return order
+
 class Scheduler:
     """
     Ejecuta pasos en paralelo y cancela cuando encuentra 'final_answer'.
+    Dos modos: `run` (capas con barrera) y `run_dag` (cada paso arranca cuando terminan sus requisitos).
+    `max_concurrency` limita cuántos agentes corren a la vez. La parada (`stop_key`, la
+    `stop_condition` del plan) se dispara por suscripción al blackboard en cuanto la clave recibe
+    un valor no vacío: se cancelan los agentes en vuelo (salvo el que la escribió) y los pasos
+    pendientes no arrancan. El uso de las llamadas LLM abortadas se anota en `usage_log`.
     """
-    def __init__(self, bb: Blackboard):
+    def __init__(self, bb: Blackboard, max_concurrency: Optional[int] = None, stop_key: str = "final_answer"):
         self.bb = bb
         self.tasks: List[asyncio.Task] = []
+        self._inflight: Set[asyncio.Task] = set()
         self.cancel_event = asyncio.Event()
+        self.stop_key = stop_key
+        self._sem = asyncio.Semaphore(max_concurrency) if max_concurrency and max_concurrency > 0 else None
+        self._unsubscribe = bb.subscribe(stop_key, self._on_stop)
+
+    def _on_stop(self, key: str, value: Any, version: int):
+        if value is None or (isinstance(value, str) and not value.strip()) or self.cancel_event.is_set():
+            return
+        self.cancel_event.set()
+        writer = asyncio.current_task()
+        victims = [t for t in self._inflight if t is not writer and not t.done()]
+        for t in victims:
+            t.cancel()
+        log.info(f"'{key}' presente; fin del grafo ({len(victims)} agentes en vuelo cancelados).")
+
+    async def _call(self, step: Callable[[], Any]):
+        partial: List[LLMUsage] = []
+        token = cancelled_usage.set(partial)
+        try:
+            if self._sem is None:
+                return await step()
+            async with self._sem:
+                return await step()
+        except asyncio.CancelledError:
+            for u in partial:
+                await self.bb.append("usage_log", u.log_line() + "|cancelled")
+            raise
+        finally:
+            cancelled_usage.reset(token)
 
     async def run_parallel(self, steps: List[Callable[[], Any]]):
+        if self.cancel_event.is_set():
+            return
         async with asyncio.TaskGroup() as tg:  # Python 3.11+
             for step in steps:
-                tg.create_task(step())
+                t = tg.create_task(self._call(step))
+                self._inflight.add(t)
+                t.add_done_callback(self._inflight.discard)
+
+    async def _check_final(self):
+        # la clave pudo escribirse antes de crear el scheduler
+        if not self.cancel_event.is_set() and await self.bb.exists(self.stop_key):
+            self._on_stop(self.stop_key, await self.bb.get(self.stop_key), self.bb.version(self.stop_key))
 
     async def run(self, plan: List[List[Callable[[], Any]]]):
+        await self._check_final()
         for layer in plan:
             if self.cancel_event.is_set():
                 log.info("Cancelado por finalización anticipada.")
                 break
             await self.run_parallel(layer)
-            if await self.bb.exists("final_answer"):
-                self.cancel_event.set()
-                log.info("Final answer presente; fin del grafo.")
+
+    async def run_dag(self, dag: Dict[str, DagStep]):
+        """Lanza cada paso en cuanto sus `requires` terminan; sin barreras entre capas."""
+        topo_order(dag)  # valida antes de ejecutar nada
+        await self._check_final()
+        done = {name: asyncio.Event() for name in dag}
+
+        async def run_step(name: str):
+            step = dag[name]
+            try:
+                for r in step.requires:
+                    await done[r].wait()
+                if self.cancel_event.is_set():
+                    log.info(f"Paso '{name}' omitido por finalización anticipada.")
+                    return
+                await self.run_parallel(step.fns)
+            finally:
+                done[name].set()
+
+        async with asyncio.TaskGroup() as tg:
+            for name in dag:
+                self.tasks.append(tg.create_task(run_step(name)))
 
     def cancel(self):
         self.cancel_event.set()
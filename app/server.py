@@ -0,0 +1,240 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+import orjson
+from aiohttp import web
+from app.caching.sqlite_kv import flush_all
+from app.config import PROCESS_FIELDS, Settings, field_name, override_settings, settings
+from app.logging_setup import get_logger
+from app.main import stream_query
+from app.models.local_llm import get_engine
+from app.rag.index_service import get_index_service
+from app.utils.executor import LoopLagMonitor, run_blocking, shutdown_executors
+from app.utils.hashing import stable_hash
+from app.web.http_client import close_session
+
+log = get_logger("server")
+
+# Opciones que un cliente puede cambiar por query (`overrides`): modelos, precios, streaming del
+# resumen y caché de respuestas. El resto se configura solo en el entorno del proceso.
+QUERY_OVERRIDES = frozenset(
+    name for name in Settings.model_fields
+    if (name.startswith(("model_", "price_", "answer_cache")) or name == "summary_stream")
+    and name not in PROCESS_FIELDS
+)
+
+class _Flight:
+    """
+    Una ejecución de `stream_query` compartida por todos los clientes que piden lo mismo a la vez.
+    Los eventos se guardan en orden para que cada cliente (JSON o SSE) los reproduzca desde el
+    principio aunque se una tarde. Si se van todos los clientes antes de terminar, se cancela.
+    """
+    def __init__(self, server: "QueryServer", key: str, query: str, image_url: Optional[str],
+                 overrides: Optional[Dict[str, Any]], bypass_cache: bool = False):
+        self.key = key
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.clients = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(server, query, image_url, overrides, bypass_cache))
+
+    async def _run(self, server: "QueryServer", query: str, image_url: Optional[str],
+                   overrides: Optional[Dict[str, Any]], bypass_cache: bool):
+        try:
+            async with server.slots:
+                server.running += 1
+                try:
+                    async for ev in stream_query(query, image_url=image_url, overrides=overrides, bypass_cache=bypass_cache):
+                        self.events.append(ev)
+                        self._wake()
+                finally:
+                    server.running -= 1
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            log.warning(f"Query falló: {e}")
+            self.error = e
+        finally:
+            self.done = True
+            # si se canceló por falta de clientes, la clave puede ser ya de otro vuelo nuevo
+            if server.flights.get(self.key) is self:
+                del server.flights[self.key]
+            self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise RuntimeError(f"query failed: {self.error!r}")
+                return
+            await self._changed.wait()
+
+class QueryServer:
+    """
+    Front-end HTTP de larga vida sobre `stream_query`:
+      POST /query           → JSON {answer, usage, metrics}
+      GET|POST /query/stream → SSE con los eventos (plan, evidence, delta, reset, critic, answer, done)
+      GET /health            → estado, lag del event loop (p50/p99/máx) y motor local
+    Concurrencia acotada (`max_concurrency` queries ejecutándose), backpressure (503 cuando hay
+    más de `max_queue` esperando), deadline por petición (504) y coalescing de queries idénticas
+    en vuelo. Cachés, clientes OpenAI, sesión HTTP e índice son los del proceso.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 deadline: Optional[float] = None):
+        self.max_concurrency = max_concurrency or settings.server_max_concurrency
+        self.max_queue = settings.server_max_queue if max_queue is None else max_queue
+        self.deadline = deadline or settings.server_deadline
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.running = 0
+        self.flights: Dict[str, _Flight] = {}
+        self.loop_lag = LoopLagMonitor()
+
+    # --- app ---
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/query", self.handle_query)
+        app.router.add_get("/query/stream", self.handle_stream)
+        app.router.add_post("/query/stream", self.handle_stream)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app: web.Application):
+        self.loop_lag.start()
+        # índice caliente antes de la primera query
+        await run_blocking(get_index_service("default").get)
+        # modelo local cargado (y prefijo común en caché) antes de la primera query
+        if settings.llama_gguf_path and settings.llama_preload:
+            await get_engine().ready()
+
+    async def _on_cleanup(self, app: web.Application):
+        for f in list(self.flights.values()):
+            f.task.cancel()
+        await close_session()
+        await run_blocking(flush_all)
+        await self.loop_lag.stop()
+        get_engine().close(timeout=0)
+        shutdown_executors(wait=False)
+
+    # --- helpers ---
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        try:
+            if request.method == "POST" and request.can_read_body:
+                body = orjson.loads(await request.read())
+            else:
+                body = dict(request.query)
+                if "overrides" in body:
+                    body["overrides"] = orjson.loads(body["overrides"])
+        except orjson.JSONDecodeError:
+            raise web.HTTPBadRequest(text="invalid JSON")
+        if not isinstance(body, dict) or not str(body.get("q") or "").strip():
+            raise web.HTTPBadRequest(text="missing 'q'")
+        self._check_overrides(body.get("overrides"))
+        return body
+
+    @staticmethod
+    def _check_overrides(overrides: Any):
+        """400 si `overrides` trae claves fuera de QUERY_OVERRIDES o valores que no validan."""
+        if overrides is None:
+            return
+        if not isinstance(overrides, dict):
+            raise web.HTTPBadRequest(text="'overrides' must be an object")
+        bad = sorted(k for k in overrides if field_name(str(k)) not in QUERY_OVERRIDES)
+        if bad:
+            raise web.HTTPBadRequest(text=f"overrides not allowed: {', '.join(bad)}")
+        try:
+            with override_settings(overrides):
+                pass
+        except ValueError as e:  # incluye ValidationError de pydantic
+            raise web.HTTPBadRequest(text=f"invalid overrides: {e}")
+
+    def _join(self, params: Dict[str, Any]) -> _Flight:
+        q, image_url, overrides = params["q"], params.get("image_url"), params.get("overrides") or None
+        bypass = str(params.get("bypass_cache") or "").lower() in ("1", "true", "yes")
+        key = stable_hash({"q": q, "image_url": image_url, "overrides": overrides, "bypass_cache": bypass})
+        flight = self.flights.get(key)
+        if flight is None:
+            if len(self.flights) >= self.max_concurrency + self.max_queue:
+                raise web.HTTPServiceUnavailable(text="server busy", headers={"Retry-After": "1"})
+            flight = self.flights[key] = _Flight(self, key, q, image_url, overrides, bypass)
+        else:
+            log.info("Coalescing: query idéntica en vuelo, compartiendo ejecución.")
+        flight.clients += 1
+        return flight
+
+    def _leave(self, flight: _Flight):
+        flight.clients -= 1
+        if flight.clients <= 0 and not flight.done:
+            log.info("Sin clientes: cancelando query en vuelo.")
+            self.flights.pop(flight.key, None)
+            flight.task.cancel()
+
+    def _deadline(self, params: Dict[str, Any]) -> float:
+        try:
+            return min(float(params.get("deadline") or self.deadline), self.deadline)
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="invalid 'deadline'")
+
+    # --- handlers ---
+    async def handle_query(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        deadline = self._deadline(params)
+        flight = self._join(params)
+        try:
+            async with asyncio.timeout(deadline):
+                done = None
+                async for ev in flight.follow():
+                    if ev["type"] == "done":
+                        done = ev["data"]
+        except TimeoutError:
+            raise web.HTTPGatewayTimeout(text=f"deadline {deadline}s exceeded")
+        except RuntimeError as e:
+            raise web.HTTPInternalServerError(text=str(e))
+        finally:
+            self._leave(flight)
+        return web.Response(body=orjson.dumps(done), content_type="application/json")
+
+    async def handle_stream(self, request: web.Request) -> web.StreamResponse:
+        params = await self._params(request)
+        deadline = self._deadline(params)
+        flight = self._join(params)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        try:
+            await resp.prepare(request)
+            async with asyncio.timeout(deadline):
+                async for ev in flight.follow():
+                    await resp.write(b"event: " + ev["type"].encode() + b"\ndata: " + orjson.dumps(ev) + b"\n\n")
+        except TimeoutError:
+            await resp.write(b"event: error\ndata: " + orjson.dumps({"error": f"deadline {deadline}s exceeded"}) + b"\n\n")
+        except RuntimeError as e:
+            await resp.write(b"event: error\ndata: " + orjson.dumps({"error": str(e)}) + b"\n\n")
+        except ConnectionResetError:
+            log.info("Cliente SSE desconectado.")
+        finally:
+            self._leave(flight)
+        return resp
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True, "inflight": len(self.flights), "running": self.running,
+                                  "loop_lag": self.loop_lag.snapshot(), "local_llm": get_engine().stats()})
+
+def main():
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default=settings.server_host)
+    p.add_argument("--port", type=int, default=settings.server_port)
+    args = p.parse_args()
+    web.run_app(QueryServer().app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
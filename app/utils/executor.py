@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+from app.config import settings
+from app.logging_setup import get_logger
+
+log = get_logger("executor")
+
+T = TypeVar("T")
+
+# Pools con nombre para el trabajo bloqueante:
+#   "io"  → red síncrona (DDG, embeddings), SQLite, ficheros
+#   "cpu" → faiss, numpy, clasificador local (liberan el GIL; hilos del tamaño de la máquina)
+# llama.cpp no usa ninguno: tiene su propio hilo (app/models/local_llm.py).
+_POOL_NAMES = ("io", "cpu")
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def _pool_size(name: str) -> int:
+    if name == "io":
+        return max(1, settings.executor_io_workers)
+    return max(1, settings.executor_cpu_workers or os.cpu_count() or 1)
+
+def get_pool(name: str = "io") -> ThreadPoolExecutor:
+    """Pool del proceso por nombre; se crea en el primer uso con el tamaño de settings."""
+    if name not in _POOL_NAMES:
+        raise ValueError(f"pool desconocido: {name!r} (válidos: {', '.join(_POOL_NAMES)})")
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = ThreadPoolExecutor(max_workers=_pool_size(name), thread_name_prefix=f"exec-{name}")
+    return pool
+
+async def run_blocking(fn: Callable[..., T], *args: Any, pool: str = "io", **kwargs: Any) -> T:
+    """
+    Ejecuta `fn(*args, **kwargs)` en el pool `pool` sin bloquear el event loop.
+    Copia el contexto actual: el overlay de settings y demás contextvars siguen vigentes en el hilo.
+    Si se cancela la espera, la llamada en curso termina en su hilo pero su resultado se descarta.
+    """
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_pool(pool), call)
+
+def shutdown_executors(wait: bool = True) -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for p in pools:
+        p.shutdown(wait=wait, cancel_futures=True)
+
+class LoopLagMonitor:
+    """
+    Mide cuánto tarda el event loop en despertar una tarea que duerme `interval` segundos:
+    el retraso sobre lo pedido es el tiempo que alguien tuvo el loop bloqueado.
+    Guarda el máximo y una ventana de `window` muestras (p50/p99); avisa por log si una
+    muestra supera `warn_ms`.
+    """
+    def __init__(self, interval: float = 0.05, warn_ms: Optional[float] = None, window: int = 1200,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.interval = interval
+        self.warn_ms = settings.loop_lag_warn_ms if warn_ms is None else warn_ms
+        self._clock = clock
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.max_ms = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "LoopLagMonitor":
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+        return self
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        return self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def record(self, lag_ms: float) -> None:
+        lag_ms = max(0.0, lag_ms)
+        self._samples.append(lag_ms)
+        self.max_ms = max(self.max_ms, lag_ms)
+        if self.warn_ms and lag_ms > self.warn_ms:
+            self.stalls += 1
+            log.warning(f"Event loop bloqueado {lag_ms:.1f} ms (umbral {self.warn_ms:.0f} ms).")
+
+    async def _run(self) -> None:
+        while True:
+            t0 = self._clock()
+            await asyncio.sleep(self.interval)
+            self.record((self._clock() - t0 - self.interval) * 1000.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = sorted(self._samples)
+
+        def pct(p: float) -> float:
+            return round(s[min(len(s) - 1, int(p * len(s)))], 2) if s else 0.0
+
+        return {"samples": len(s), "p50_ms": pct(0.50), "p99_ms": pct(0.99),
+                "max_ms": round(self.max_ms, 2), "stalls": self.stalls}
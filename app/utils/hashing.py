@@ -9,3 +9,7 @@ def stable_hash(obj: Any) -> str:
 def prompt_key(model: str, messages: List[Dict[str, str]], extra: Dict | None = None) -> str:
     payload = {"model": model, "messages": messages, "extra": extra or {}}
     return stable_hash(payload)
+
+def text_key(model: str, text: str) -> str:
+    """Clave content-addressed para un texto bajo un modelo (p.ej. embeddings)."""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
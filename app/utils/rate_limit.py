@@ -0,0 +1,55 @@
+import asyncio
+import time
+from typing import Callable
+
+class RateLimiter:
+    """
+    Doble token bucket (peticiones/min y tokens/min) para asyncio; 0 = sin límite.
+    `acquire(tokens)` espera hasta que ambos cubos tienen saldo y lo descuenta. Como el consumo
+    real solo se conoce al final, `settle(reserved, actual)` corrige el cubo de tokens: si se
+    gastó más de lo reservado queda en negativo y esa deuda frena las siguientes peticiones.
+    """
+    def __init__(self, rpm: float = 0, tpm: float = 0, clock: Callable[[], float] = time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._req = float(rpm)
+        self._tok = float(tpm)
+        self._t = clock()
+        self._lock = asyncio.Lock()  # FIFO entre quienes esperan
+
+    def _refill(self) -> None:
+        now = self._clock()
+        dt, self._t = now - self._t, now
+        if self.rpm:
+            self._req = min(float(self.rpm), self._req + dt * self.rpm / 60.0)
+        if self.tpm:
+            self._tok = min(float(self.tpm), self._tok + dt * self.tpm / 60.0)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm and self._req < 1:
+            wait = (1 - self._req) * 60.0 / self.rpm
+        if self.tpm:
+            need = min(tokens, self.tpm)  # una petición mayor que el cubo no debe bloquear para siempre
+            if self._tok < need:
+                wait = max(wait, (need - self._tok) * 60.0 / self.tpm)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._req -= 1
+            if self.tpm:
+                self._tok -= tokens
+
+    def settle(self, reserved: int, actual: int) -> None:
+        if self.tpm:
+            self._refill()
+            self._tok -= actual - reserved
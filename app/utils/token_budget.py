@@ -1,11 +1,140 @@
-from typing import List, Dict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-# Sencillo: presupuesto total y “hard truncation” por mensajes antiguos.
-def enforce_token_budget(messages: List[Dict[str, str]], max_messages: int = 30) -> List[Dict[str, str]]:
-    if len(messages) <= max_messages:
+# Ventana de contexto por familia de modelo (prefijo más largo gana)
+CONTEXT_LIMITS: Dict[str, int] = {
+    "gpt-5": 272_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_000_000,
+    "text-embedding-3": 8_191,
+}
+DEFAULT_CONTEXT = 128_000
+MESSAGE_OVERHEAD = 4  # tokens de formato por mensaje en chat completions
+
+@lru_cache(maxsize=32)
+def _encoding(model: Optional[str]):
+    """Encoder de tiktoken por modelo (cacheado). None si tiktoken o sus ficheros no están disponibles."""
+    try:
+        import tiktoken
+    except Exception:
+        return None
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                # modelos nuevos que tiktoken aún no conoce: misma familia que gpt-4o
+                return tiktoken.get_encoding("o200k_base" if model.startswith(("gpt-5", "gpt-4o", "o")) else "cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # sin acceso a los ficheros BPE: se usa la aproximación por caracteres
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(enc.encode(text, disallowed_special=()))
+
+def count_tokens_batch(texts: Sequence[str], model: Optional[str] = None) -> List[int]:
+    """`count_tokens` para muchos textos de una vez (tiktoken los codifica en paralelo)."""
+    enc = _encoding(model)
+    if enc is None:
+        return [max(1, len(t) // 4) if t else 0 for t in texts]
+    return [len(toks) for toks in enc.encode_batch(list(texts), disallowed_special=())]
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(model)
+    if enc is None:
+        return text[: max_tokens * 4]
+    toks = enc.encode(text, disallowed_special=())
+    if len(toks) <= max_tokens:
+        return text
+    return enc.decode(toks[:max_tokens])
+
+def context_limit(model: Optional[str]) -> int:
+    best = ""
+    for prefix in CONTEXT_LIMITS:
+        if model and model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return CONTEXT_LIMITS.get(best, DEFAULT_CONTEXT)
+
+def _content_tokens(content: Any, model: Optional[str]) -> int:
+    if isinstance(content, str):
+        return count_tokens(content, model)
+    if isinstance(content, list):  # multimodal: solo cuenta las partes de texto
+        return sum(count_tokens(p.get("text", ""), model) for p in content if isinstance(p, dict))
+    return 0
+
+def count_message_tokens(messages: Sequence[Dict[str, Any]], model: Optional[str] = None) -> int:
+    return sum(_content_tokens(m.get("content"), model) + MESSAGE_OVERHEAD for m in messages) + 3
+
+def fit_sections(sections: Sequence[Tuple[str, str]], budget: int, model: Optional[str] = None) -> Dict[str, str]:
+    """
+    Reparte `budget` tokens entre secciones de evidencia (nombre, texto) por llenado equitativo:
+    las que caben en su parte van enteras y el sobrante se redistribuye entre las grandes,
+    que se recortan. A igualdad, las primeras secciones tienen prioridad.
+    """
+    sizes = {name: count_tokens(text, model) for name, text in sections}
+    alloc: Dict[str, int] = {}
+    remaining = max(0, budget)
+    pending = [name for name, _ in sections]
+    while pending:
+        share = remaining // len(pending)
+        fits = [n for n in pending if sizes[n] <= share]
+        if not fits:
+            extra = remaining - share * len(pending)
+            for k, n in enumerate(pending):
+                alloc[n] = share + (1 if k < extra else 0)
+            break
+        for n in fits:
+            alloc[n] = sizes[n]
+            remaining -= sizes[n]
+        pending = [n for n in pending if n not in fits]
+    return {
+        name: text if alloc[name] >= sizes[name] else truncate_tokens(text, alloc[name], model) + " …[recortado]"
+        for name, text in sections
+    }
+
+def enforce_token_budget(
+    messages: List[Dict[str, Any]],
+    max_messages: int = 30,
+    model: Optional[str] = None,
+    reserve: Optional[int] = None,
+    budget: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Red de seguridad antes de cada llamada: limita nº de mensajes y, con `budget`, tokens de entrada.
+    Quita mensajes antiguos (nunca los de sistema) y, si aún no cabe, recorta el último mensaje largo.
+    `budget` se acota a la ventana del modelo menos `reserve` (tokens de salida).
+    """
+    if len(messages) > max_messages:
+        # Mantén system + últimos N-1
+        system_msgs = [m for m in messages if m.get("role") == "system"]
+        other = [m for m in messages if m.get("role") != "system"]
+        keep = other[-(max_messages - len(system_msgs)):] if max_messages > len(system_msgs) else []
+        messages = system_msgs + keep
+    if budget is None:
+        return messages
+    budget = min(budget, context_limit(model) - (reserve or 0))
+    total = count_message_tokens(messages, model)
+    if total <= budget:
         return messages
-    # Mantén system + últimos N-1
-    system_msgs = [m for m in messages if m.get("role") == "system"]
-    other = [m for m in messages if m.get("role") != "system"]
-    keep = other[-(max_messages - len(system_msgs)):] if max_messages > len(system_msgs) else []
-    return system_msgs + keep
+    messages = list(messages)
+    # 1) descarta los mensajes no-sistema más antiguos (conserva al menos el último)
+    while total > budget:
+        idx = [i for i, m in enumerate(messages) if m.get("role") != "system"]
+        if len(idx) <= 1:
+            break
+        total -= _content_tokens(messages[idx[0]].get("content"), model) + MESSAGE_OVERHEAD
+        messages.pop(idx[0])
+    # 2) recorta el contenido de texto más largo
+    if total > budget:
+        i = max(range(len(messages)), key=lambda j: _content_tokens(messages[j].get("content"), model))
+        content = messages[i].get("content")
+        if isinstance(content, str):
+            cur = count_tokens(content, model)
+            messages[i] = {**messages[i], "content": truncate_tokens(content, max(0, cur - (total - budget)), model)}
+    return messages
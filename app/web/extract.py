@@ -0,0 +1,177 @@
+import math
+import re
+from collections import Counter
+from html import unescape
+from html.parser import HTMLParser
+from typing import Dict, List, Tuple
+from rapidfuzz import fuzz
+from app.utils.token_budget import count_tokens
+
+# Contenido que nunca es "texto principal"
+_SKIP = {"script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer",
+         "aside", "form", "button", "select", "head"}
+_BLOCK = {"p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "table",
+          "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "dt", "figcaption"}
+_MAIN = {"main", "article"}
+_VOID = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "wbr"}
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.main_depth = 0
+        self.all_parts: List[str] = []
+        self.main_parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID:
+            if tag == "br":
+                self._emit("\n")
+            return
+        if tag in _SKIP:
+            self.skip_depth += 1
+        elif tag in _MAIN:
+            self.main_depth += 1
+        if tag in _BLOCK:
+            self._emit("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _VOID:
+            return
+        if tag in _SKIP:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in _MAIN:
+            self.main_depth = max(0, self.main_depth - 1)
+        if tag in _BLOCK:
+            self._emit("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._emit(data)
+
+    def _emit(self, s: str):
+        if self.skip_depth:
+            return
+        self.all_parts.append(s)
+        if self.main_depth:
+            self.main_parts.append(s)
+
+def html_to_text(html: str) -> str:
+    """Texto principal de una página: sin scripts/estilos/navegación; prioriza <main>/<article>."""
+    p = _TextExtractor()
+    try:
+        p.feed(html)
+        p.close()
+    except Exception:
+        return re.sub(r"\s+", " ", unescape(re.sub(r"<[^>]+>", " ", html))).strip()
+    main = "".join(p.main_parts)
+    text = main if len(main.strip()) > 200 else "".join(p.all_parts)
+    lines = [re.sub(r"[ \t\r\f\v]+", " ", ln).strip() for ln in text.split("\n")]
+    return "\n".join(ln for ln in lines if ln)
+
+def _wrap(s: str, max_chars: int) -> List[str]:
+    """Trozos de hasta `max_chars`, cortando en el último espacio si lo hay."""
+    out: List[str] = []
+    while len(s) > max_chars:
+        cut = s.rfind(" ", 0, max_chars + 1)
+        cut = cut if cut > 0 else max_chars
+        out.append(s[:cut].rstrip())
+        s = s[cut:].lstrip()
+    if s:
+        out.append(s)
+    return out
+
+def split_passages(text: str, max_chars: int = 700, min_chars: int = 200) -> List[str]:
+    """
+    Pasajes ~párrafo: junta líneas cortas hasta `min_chars` y parte las largas por frases;
+    una frase más larga que `max_chars` se parte por palabras, sin perder texto.
+    """
+    units: List[str] = []
+    for line in text.split("\n"):
+        if len(line) <= max_chars:
+            units.append(line)
+        else:
+            for sent in re.split(r"(?<=[\.!?])\s+", line):
+                if sent:
+                    units.extend(_wrap(sent, max_chars))
+    out: List[str] = []
+    cur = ""
+    for u in units:
+        if cur and len(cur) + 1 + len(u) > max_chars:
+            out.append(cur)
+            cur = ""
+        cur = f"{cur} {u}" if cur else u
+        if len(cur) >= min_chars:
+            out.append(cur)
+            cur = ""
+    if cur:
+        out.append(cur)
+    return out
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def _terms(s: str) -> List[str]:
+    return [t for t in _TOKEN.findall(s.lower()) if len(t) > 1]
+
+def bm25_scores(query: str, passages: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    q = set(_terms(query))
+    docs = [_terms(p) for p in passages]
+    if not docs or not q:
+        return [0.0] * len(passages)
+    avgdl = sum(len(d) for d in docs) / len(docs) or 1.0
+    df = Counter(t for d in docs for t in set(d) if t in q)
+    n = len(docs)
+    scores = []
+    for d in docs:
+        tf = Counter(t for t in d if t in q)
+        s = 0.0
+        for t, f in tf.items():
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            s += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * len(d) / avgdl))
+        scores.append(s)
+    return scores
+
+def rank_passages(query: str, passages: List[str]) -> List[Tuple[int, float]]:
+    """(índice, score) de mayor a menor: BM25 normalizado + similitud difusa (variantes morfológicas)."""
+    bm = bm25_scores(query, passages)
+    top = max(bm, default=0.0) or 1.0
+    ranked = [
+        (i, 0.7 * (bm[i] / top) + 0.3 * fuzz.token_set_ratio(query, p) / 100.0)
+        for i, p in enumerate(passages)
+    ]
+    return sorted(ranked, key=lambda x: x[1], reverse=True)
+
+def select_evidence(query: str, pages: List[Dict[str, str]], token_budget: int = 2500,
+                    max_passages_per_page: int = 4, min_score: float = 0.2) -> List[Dict[str, str]]:
+    """
+    `pages`: [{source, url, html}]. Devuelve [{source, url, content}] con solo los mejores
+    pasajes de todas las páginas (ranking conjunto) que caben en `token_budget`.
+    """
+    passages: List[str] = []
+    owner: List[int] = []
+    for pi, page in enumerate(pages):
+        for ps in split_passages(html_to_text(page.get("html") or "")):
+            passages.append(ps)
+            owner.append(pi)
+    chosen: Dict[int, List[int]] = {}
+    used = 0
+    for i, score in rank_passages(query, passages):
+        if score < min_score:
+            break  # ordenado: el resto tampoco es relevante
+        pi = owner[i]
+        if len(chosen.get(pi, [])) >= max_passages_per_page:
+            continue
+        n = count_tokens(passages[i])
+        if used + n > token_budget:
+            continue
+        chosen.setdefault(pi, []).append(i)
+        used += n
+    out = []
+    for pi, idxs in sorted(chosen.items()):
+        page = pages[pi]
+        out.append({
+            "source": page.get("source", "web"),
+            "url": page.get("url", ""),
+            "content": "\n".join(passages[i] for i in sorted(idxs)),  # orden original del documento
+        })
+    return out
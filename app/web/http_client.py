@@ -1,5 +1,7 @@
+import asyncio
+import weakref
 import aiohttp
-from typing import Optional
+from typing import Dict, List, Optional
 from app.caching.web_cache import WebCache
 from app.config import settings
 from app.logging_setup import get_logger
@@ -7,19 +9,69 @@ from app.logging_setup import get_logger
 log = get_logger("http_client")
 _cache = WebCache(settings.base_dir / ".web_cache.sqlite")
 
+# Una sesión (pool de conexiones + caché DNS) por event loop
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+def get_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    sess = _sessions.get(loop)
+    if sess is None or sess.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.http_pool_size,
+            limit_per_host=settings.http_per_host,
+            ttl_dns_cache=300,
+        )
+        sess = aiohttp.ClientSession(connector=connector, headers={"User-Agent": "Mozilla/5.0"})
+        _sessions[loop] = sess
+    return sess
+
+async def close_session():
+    sess = _sessions.pop(asyncio.get_running_loop(), None)
+    if sess is not None and not sess.closed:
+        await sess.close()
+
 async def fetch_text(url: str, ttl: int = 3600, timeout: float = 10.0) -> Optional[str]:
-    cached = _cache.get(url)
+    cached = await _cache.aget(url)
     if cached:
         return cached[0]
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(url, timeout=timeout, headers={"User-Agent":"Mozilla/5.0"}) as r:
-                if r.status != 200:
-                    log.warning(f"HTTP {r.status} for {url}")
-                    return None
-                text = await r.text()
-                _cache.set(url, text, ttl)
-                return text
+        async with get_session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            if r.status != 200:
+                log.warning(f"HTTP {r.status} for {url}")
+                return None
+            text = await r.text()
+            await _cache.aset(url, text, ttl)
+            return text
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         log.warning(f"fetch_text error for {url}: {e}")
         return None
+
+async def fetch_many(urls: List[str], ttl: int = 3600, timeout: float = 10.0,
+                     deadline: Optional[float] = None) -> Dict[str, str]:
+    """
+    Descarga en paralelo. Al vencer `deadline` (segundos, total) cancela lo pendiente
+    y devuelve lo que haya llegado: {url: texto} solo para las descargas correctas.
+    """
+    tasks = {asyncio.create_task(fetch_text(u, ttl=ttl, timeout=timeout)): u for u in dict.fromkeys(urls)}
+    if not tasks:
+        return {}
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+    except asyncio.CancelledError:
+        # asyncio.wait no cancela las descargas hijas: abortarlas para liberar conexiones
+        for t in tasks:
+            t.cancel()
+        raise
+    for t in pending:
+        t.cancel()
+    if pending:
+        log.info(f"Deadline {deadline}s: {len(pending)}/{len(tasks)} páginas descartadas.")
+        await asyncio.gather(*pending, return_exceptions=True)
+    out: Dict[str, str] = {}
+    for t in done:
+        text = t.result()
+        if text:
+            out[tasks[t]] = text
+    return out
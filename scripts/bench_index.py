@@ -0,0 +1,57 @@
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from app.config import settings
+from app.rag.vectorstore import INDEX_TYPES, make_index, set_search_params
+
+def _dataset(n: int, dim: int, nq: int, seed: int = 0):
+    # datos agrupados (más parecido a embeddings reales que ruido uniforme)
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype("float32")
+    xb = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+    xq = centers[rng.integers(0, len(centers), nq)] + 0.3 * rng.standard_normal((nq, dim)).astype("float32")
+    faiss.normalize_L2(xb)
+    faiss.normalize_L2(xq)
+    return xb, xq
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall vs latencia de los índices ANN frente a Flat")
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = ap.parse_args()
+
+    xb, xq = _dataset(args.n, args.dim, args.queries)
+    rows = []
+    truth = None
+    for kind in ["flat"] + [t for t in args.types.split(",") if t != "flat"]:
+        t0 = time.perf_counter()
+        index, built = make_index(kind, xb)
+        index.add(xb)
+        build_s = time.perf_counter() - t0
+        set_search_params(index, settings.vector_nprobe, settings.vector_ef_search)
+        lat = []
+        found = np.empty((len(xq), args.k), dtype="int64")
+        for i, q in enumerate(xq):  # una consulta por llamada, como en el servicio
+            t = time.perf_counter()
+            _D, I = index.search(q.reshape(1, -1), args.k)
+            lat.append((time.perf_counter() - t) * 1000)
+            found[i] = I[0]
+        if truth is None:
+            truth = found
+        recall = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, truth)]))
+        rows.append({
+            "index": kind if built == kind else f"{kind}→{built}",
+            "build_s": round(build_s, 3),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            f"recall@{args.k}": round(recall, 4),
+        })
+    print(json.dumps(rows, indent=2))
+
+if __name__ == "__main__":
+    main()
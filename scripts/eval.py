@@ -12,16 +12,23 @@ def main():
     ap.add_argument("--ab", action="store_true", help="Corre A/B")
     ap.add_argument("--a", type=str, default=None, help="Overrides JSON para A")
     ap.add_argument("--b", type=str, default=None, help="Overrides JSON para B")
+    ap.add_argument("--concurrency", type=int, default=None, help="Queries simultáneas (def. EVAL_CONCURRENCY)")
+    ap.add_argument("--rpm", type=float, default=None, help="Máx. queries por minuto (def. EVAL_RPM)")
+    ap.add_argument("--tpm", type=float, default=None, help="Máx. tokens por minuto (def. EVAL_TPM)")
+    ap.add_argument("--out", type=str, default=None, help="JSONL de resultados (checkpoint)")
+    ap.add_argument("--resume", action="store_true", help="Reanuda desde --out saltando lo ya evaluado")
     args = ap.parse_args()
+    opts = dict(concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm,
+                out=Path(args.out) if args.out else None, resume=args.resume)
 
     if args.ab:
         if not args.a or not args.b:
             raise SystemExit("--ab requiere --a y --b con JSON de overrides")
         overrides_a = json.loads(args.a)
         overrides_b = json.loads(args.b)
-        out = asyncio.run(run_ab(Path(args.dataset), overrides_a, overrides_b, runs=args.runs))
+        out = asyncio.run(run_ab(Path(args.dataset), overrides_a, overrides_b, runs=args.runs, **opts))
     else:
-        out = asyncio.run(run_dataset(Path(args.dataset), runs=args.runs))
+        out = asyncio.run(run_dataset(Path(args.dataset), runs=args.runs, **opts))
 
     print(json.dumps(out, indent=2, ensure_ascii=False))
 
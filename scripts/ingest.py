@@ -0,0 +1,28 @@
+import argparse
+import json
+from pathlib import Path
+from app.config import settings
+from app.rag.vectorstore import SimpleFAISS
+from app.rag.ingest import sync_directory, manifest_path
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--corpus", default=str(settings.base_dir / "corpus"), help="Directorio con .txt/.md")
+    p.add_argument("--name", default="default", help="Nombre del índice en el vectorstore")
+    p.add_argument("--full", action="store_true", help="Reconstruye el índice desde cero")
+    args = p.parse_args()
+
+    vs = SimpleFAISS(settings.vectorstore_dir)
+    if not args.full and manifest_path(vs, args.name).exists():
+        # el manifest se escribe aunque no haya índice (p.ej. corpus vacío): sin índice,
+        # sync_directory ignora el manifest y reconstruye
+        try:
+            vs.load(args.name)
+        except Exception as e:
+            print(f"No se pudo cargar el índice '{args.name}' ({e}); reconstruyendo desde cero")
+            vs = SimpleFAISS(settings.vectorstore_dir)
+    stats = sync_directory(vs, Path(args.corpus), name=args.name, full=args.full)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
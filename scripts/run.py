@@ -1,17 +1,56 @@
 import argparse
 import asyncio
-from app.main import run_query
+import sys
+from app.main import stream_query
+from app.web.http_client import close_session
+
+async def _run(query, image_url, bypass_cache=False):
+    """Imprime el progreso y la respuesta a medida que llegan; devuelve el evento final."""
+    done = None
+    streamed = False
+    try:
+        async for ev in stream_query(query, image_url=image_url, bypass_cache=bypass_cache):
+            kind, data = ev["type"], ev["data"]
+            if kind == "plan":
+                steps = [s.get("name") for s in (data or {}).get("steps", [])]
+                print(f"[{ev['t']:.1f}s] plan: {' → '.join(steps)}", file=sys.stderr)
+            elif kind == "evidence":
+                n = len(data["value"]) if isinstance(data["value"], (list, dict)) else 1
+                print(f"[{ev['t']:.1f}s] evidencia: {data['source']} ({n})", file=sys.stderr)
+            elif kind == "critic":
+                print(f"[{ev['t']:.1f}s] crítico: conflicts={(data or {}).get('conflicts', 0)}", file=sys.stderr)
+            elif kind == "delta":
+                if not streamed:
+                    print("=== ANSWER ===")
+                    streamed = True
+                print(data, end="", flush=True)
+            elif kind == "reset":  # el stream se cortó: la respuesta buena llega en `done`
+                if streamed:
+                    print()
+                print(f"[{ev['t']:.1f}s] respuesta interrumpida ({data}); regenerando", file=sys.stderr)
+                streamed = False
+            elif kind == "done":
+                done = data
+    finally:
+        await close_session()
+    if streamed:
+        print()
+    else:
+        print("=== ANSWER ===")
+        print(done["answer"])
+    return done
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--q", "--query", dest="query", required=True, help="Pregunta/consulta de usuario")
     p.add_argument("--image", dest="image_url", default=None, help="URL/base64 de imagen opcional")
+    p.add_argument("--no-cache", action="store_true", help="Ignora la caché de respuestas")
     args = p.parse_args()
-    ans, usage = asyncio.run(run_query(args.query, image_url=args.image_url))
-    print("=== ANSWER ===")
-    print(ans)
+    done = asyncio.run(_run(args.query, args.image_url, args.no_cache))
     print("\n=== USAGE ===")
-    print("\n".join(usage))
+    print("\n".join(done["usage"]))
+    m = done["metrics"]
+    print(f"\nTTFT: {m['ttft_s']}s · total: {m['total_s']}s{' (caché)' if m.get('cache_hit') else ''}")
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,62 @@
+import hashlib
+import sys
+import numpy as np
 import pytest
 
 class Dummy:
     def __init__(self, text):
         self.text = text
 
+class _NoDDGS:
+    """Sustituto offline de duckduckgo_search.DDGS: sin resultados."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query, max_results=6):
+        return []
+
+class _FakeStream:
+    """Sustituto de LLMStream: trocea la respuesta fake en deltas."""
+    def __init__(self, text, usage):
+        self._full = text
+        self._usage = usage
+        self.text = ""
+        self.usage = None
+        self.ttft = None
+
+    async def __aiter__(self):
+        for i in range(0, len(self._full), 8):
+            if self.ttft is None:
+                self.ttft = 0.0
+            yield self._full[i:i + 8]
+        self.text, self.usage = self._full, self._usage
+
+def _fake_vec(text: str, dim: int = 16):
+    h = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 for b in h[:dim]]
+
 @pytest.fixture(autouse=True)
 def stub_llm_calls(monkeypatch):
     """
     Stubs para que los tests sean offline:
-    - call_llm devuelve JSONs mínimos válidos según el agente.
-    - call_llm_mm (visión) devuelve estructura vacía.
+    - call_llm / acall_llm devuelven JSONs mínimos válidos según el agente.
+    - astream_llm trocea esa misma respuesta en deltas.
+    - call_llm_mm / acall_llm_mm (visión) devuelven estructura vacía.
+    - embeddings deterministas y búsqueda web sin resultados.
+    - app.main también importa embed_array (caché de respuestas).
+    Los agentes importan las funciones por nombre, así que se parchean también en cada módulo.
     """
-    from app import agents
+    import app.main  # noqa: F401  (carga todos los módulos de agentes)
     import app.models.openai_llm as ollm
+    import app.models.embeddings as emb
 
     def fake_call_llm(model, messages, json_object=False, temperature=0.2, max_tokens=None):
         sys_plus_user = "\n".join([m.get("content","") for m in messages])
         if "routing expert" in sys_plus_user.lower():
-            return ('{"domain":"general","confidence":0.9,"suggested_agents":["planner"]}', 
+            return ('{"domain":"general","confidence":0.9,"suggested_agents":["planner"]}',
                     ollm.LLMUsage(model=model, input_tokens=10, output_tokens=10, cost_usd=0.0))
         if "design multi-agent plans" in sys_plus_user.lower():
             return ('{"steps":[{"name":"gather","agents":["rag","web_search"]},{"name":"analyze","agents":["data"]},{"name":"draft","agents":["summary"]},{"name":"critique","agents":["critic"]},{"name":"finalize","agents":["summary"]}],"stop_condition":"final_answer"}',
@@ -35,8 +74,42 @@ def stub_llm_calls(monkeypatch):
         return ('{"ok":true}', ollm.LLMUsage(model=model, input_tokens=5, output_tokens=5, cost_usd=0.0))
 
     def fake_call_llm_mm(model, parts, json_object=True, temperature=0.2, max_tokens=800):
-        return ('{"contains_chart":false,"contains_text":false,"any_numbers":false}', 
+        return ('{"contains_chart":false,"contains_text":false,"any_numbers":false}',
                 ollm.LLMUsage(model=model, input_tokens=5, output_tokens=5, cost_usd=0.0))
 
-    monkeypatch.setattr(ollm, "call_llm", fake_call_llm)
-    monkeypatch.setattr(ollm, "call_llm_mm", fake_call_llm_mm)
+    async def fake_acall_llm(model, messages, json_object=False, temperature=0.2, max_tokens=None):
+        return fake_call_llm(model, messages, json_object, temperature, max_tokens)
+
+    async def fake_acall_llm_mm(model, parts, json_object=True, temperature=0.2, max_tokens=800):
+        return fake_call_llm_mm(model, parts, json_object, temperature, max_tokens)
+
+    def fake_astream_llm(model, messages, temperature=0.2, max_tokens=None):
+        return _FakeStream(*fake_call_llm(model, messages, False, temperature, max_tokens))
+
+    def fake_embed_texts(texts, model=None):
+        return [_fake_vec(t) for t in texts]
+
+    def fake_embed_array(texts, model=None):
+        return np.array(fake_embed_texts(texts, model), dtype=np.float32)
+
+    fakes = {
+        "call_llm": fake_call_llm,
+        "call_llm_mm": fake_call_llm_mm,
+        "acall_llm": fake_acall_llm,
+        "acall_llm_mm": fake_acall_llm_mm,
+        "astream_llm": fake_astream_llm,
+        "embed_texts": fake_embed_texts,
+        "embed_array": fake_embed_array,
+        "DDGS": _NoDDGS,
+    }
+    targets = [ollm, emb] + [
+        m for name, m in list(sys.modules.items())
+        if m is not None and (name == "app.main" or name.startswith(("app.agents.", "app.rag.", "app.models.local_router")))
+    ]
+    for mod in targets:
+        for attr, fake in fakes.items():
+            if hasattr(mod, attr):
+                monkeypatch.setattr(mod, attr, fake)
+    # cachés semánticas del proceso (router, planner, respuestas) vacías en cada test
+    import app.caching.semantic_cache as semantic_cache
+    monkeypatch.setattr(semantic_cache, "_caches", {})
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import app.main as main
+from app.config import override_settings
+from app.main import run_query, stream_query
+
+Q = "¿Qué es una curva de tipos invertida?"
+
+@pytest.mark.asyncio
+async def test_repeated_query_is_served_from_answer_cache():
+    ans1, usage1 = await run_query(Q)
+    assert usage1
+    # misma query salvo mayúsculas/espacios: acierto exacto, sin llamadas LLM
+    ans2, usage2 = await run_query("  ¿qué es una   curva de tipos invertida? ")
+    assert ans2 == ans1 and usage2 == []
+    # bypass explícito: se ejecuta el pipeline completo
+    _, usage3 = await run_query(Q, bypass_cache=True)
+    assert usage3
+
+@pytest.mark.asyncio
+async def test_paraphrase_hits_by_embedding_similarity(monkeypatch):
+    monkeypatch.setattr(main, "embed_array", lambda texts, model=None: np.ones((len(texts), 8), dtype=np.float32))
+    ans, _ = await run_query(Q)
+    events = [ev async for ev in stream_query("Explícame qué significa que la curva de tipos se invierta")]
+    done = events[-1]["data"]
+    assert done["answer"] == ans and done["usage"] == []
+    assert done["metrics"]["cache_hit"] is True
+    assert [ev["type"] for ev in events] == ["answer", "done"]
+
+@pytest.mark.asyncio
+async def test_image_overrides_and_domain_ttl_separate_entries():
+    await run_query(Q)
+    # otra imagen u otros overrides no comparten respuesta
+    _, usage = await run_query(Q, image_url="data:image/png;base64,AAAA")
+    assert usage
+    _, usage = await run_query(Q, overrides={"MODEL_SUMMARY": "gpt-5"})
+    assert usage
+    # TTL 0 para el dominio del router ("general" en los fakes): no se cachea
+    with override_settings({"ANSWER_CACHE_DOMAIN_TTLS": "general=0"}):
+        q = "Otra pregunta distinta"
+        await run_query(q)
+        _, usage = await run_query(q)
+    assert usage
+
+@pytest.mark.asyncio
+async def test_degraded_answers_are_not_cached(monkeypatch):
+    import app.agents.summary as summary
+    from app.models.openai_llm import LLMUsage
+
+    async def empty(model, messages, **kw):
+        return "", LLMUsage(model=model, input_tokens=1, output_tokens=0, cost_usd=0.0)
+
+    # el modelo no devuelve nada: el resumen usa el texto de relleno
+    monkeypatch.setattr(summary, "astream_llm", None)
+    monkeypatch.setattr(summary, "acall_llm", empty)
+    with override_settings({"SUMMARY_STREAM": "false"}):
+        ans, _ = await run_query(Q)
+        assert ans == summary.NO_ANSWER
+        _, usage = await run_query(Q)
+    assert usage
+
+    # solo hay borrador: se promueve a respuesta, pero no se cachea
+    async def draft_only(self):
+        await self.bb.set("draft_answer", {"final_answer": "borrador", "citations": []})
+        await self._record_usage(LLMUsage(model="m", input_tokens=1, output_tokens=1, cost_usd=0.0))
+
+    monkeypatch.setattr(summary.SummaryAgent, "act", draft_only)
+    q = "Otra pregunta sin respuesta final"
+    assert (await run_query(q))[0] == "borrador"
+    _, usage = await run_query(q)
+    assert usage
@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from app.blackboard import Blackboard
+
+@pytest.mark.asyncio
+async def test_append_is_lossless_under_concurrency():
+    bb = Blackboard()
+
+    async def writer(i):
+        await asyncio.sleep(0)
+        await bb.append("usage_log", i)
+
+    await asyncio.gather(*(writer(i) for i in range(50)))
+    assert sorted(await bb.get("usage_log")) == list(range(50))
+    assert bb.version("usage_log") == 50
+
+@pytest.mark.asyncio
+async def test_versions_update_and_wait_for():
+    bb = Blackboard()
+    assert bb.version("x") == 0
+    assert await bb.set("x", 1) == 1
+    assert await bb.update("x", lambda v: v + 1) == 2 and bb.version("x") == 2
+
+    async def later():
+        await asyncio.sleep(0.01)
+        await bb.set("final_answer", "ok")
+
+    asyncio.create_task(later())
+    assert await bb.wait_for("final_answer", timeout=1.0) == "ok"
+    with pytest.raises(asyncio.TimeoutError):
+        await bb.wait_for("never", timeout=0.01)
+
+@pytest.mark.asyncio
+async def test_subscribe_fires_on_write():
+    bb = Blackboard()
+    seen = []
+    unsub = bb.subscribe("k", lambda key, value, version: seen.append((value, version)))
+    await bb.set("k", "a")
+    unsub()
+    await bb.set("k", "b")
+    assert seen == [("a", 1)]
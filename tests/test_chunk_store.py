@@ -0,0 +1,25 @@
+from app.rag.chunk_store import ChunkStore
+
+def test_chunk_store_roundtrip_and_overlay(tmp_path):
+    path = tmp_path / "x.chunks"
+    st = ChunkStore()
+    st.add(5, "cinco ñ", {"source": "a.md", "page": 2})
+    st.add(1, "uno", {"source": "b.txt"})
+    st.add(3, "tres", {})
+    st.write(path)
+
+    ro = ChunkStore.open(path, st.sources)
+    assert len(ro) == 3 and sorted(ro.ids()) == [1, 3, 5]
+    assert ro.get(5) == ("cinco ñ", {"page": 2, "source": "a.md"})
+    assert ro.get(3) == ("tres", {}) and ro.get(2) is None
+
+    ro.remove(1)
+    ro.add(3, "tres v2", {"source": "b.txt"})
+    ro.add(9, "nueve", {"source": "c.txt"})
+    assert len(ro) == 3 and 1 not in ro and ro.get(3)[0] == "tres v2"
+    ro.write(path)
+
+    again = ChunkStore.open(path, ro.sources)
+    assert sorted(again.ids()) == [3, 5, 9]
+    assert again.get(9) == ("nueve", {"source": "c.txt"})
+    assert again.get(5)[1]["source"] == "a.md"
@@ -0,0 +1,37 @@
+import io
+from app.rag.chunking import iter_chunks, chunk_text, split_into_sentences
+from app.utils.token_budget import count_tokens
+
+PARA = " ".join(f"La frase {i} habla del mercado y de sus riesgos." for i in range(60))
+DOC = "# Intro\n\nEl Sr. Pérez ganó 3.5 millones. Luego se fue.\n\n## Riesgos\n\n" + PARA + "\n\n```\n# no es encabezado\n```\n\nFin."
+
+def test_sentences_keep_abbreviations_and_decimals():
+    assert split_into_sentences("El Sr. Pérez ganó 3.5 millones. Luego se fue. ¿Por qué? Nadie.") == [
+        "El Sr. Pérez ganó 3.5 millones.", "Luego se fue.", "¿Por qué?", "Nadie."]
+
+def test_chunks_respect_token_target_spans_and_overlap():
+    chunks = list(iter_chunks(DOC, target_tokens=80, overlap_tokens=20))
+    assert len(chunks) > 3
+    for c in chunks:
+        assert DOC[c.start:c.end] == c.text
+        assert c.tokens <= 80
+        assert count_tokens(c.text) <= 80 + 5  # separadores entre unidades
+    # cada chunk empieza dentro del anterior (solapamiento) y avanza
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.start < b.start < a.end <= b.end
+
+def test_streaming_matches_whole_text_with_tiny_blocks():
+    whole = list(iter_chunks(DOC, target_tokens=60, mode="sentences"))
+    streamed = list(iter_chunks(io.StringIO(DOC), target_tokens=60, mode="sentences", block_chars=32))
+    assert streamed == whole
+
+def test_markdown_mode_breaks_on_headings_outside_code():
+    chunks = list(iter_chunks(DOC, target_tokens=2000, mode="markdown"))
+    assert [c.section for c in chunks] == ["Intro", "Intro > Riesgos"]
+    assert chunks[1].text.startswith("## Riesgos") and chunks[1].text.endswith("Fin.")
+    assert "# no es encabezado" in chunks[1].text
+
+def test_paragraph_mode_packs_whole_paragraphs():
+    doc = "\n\n".join(f"Párrafo {i}. Tiene dos frases." for i in range(10))
+    for c in chunk_text(doc, target_tokens=20, overlap_tokens=0, mode="paragraphs"):
+        assert c.startswith("Párrafo") and c.endswith("frases.")
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from app.config import settings, override_settings, current_settings
+from app.agents.summary import SummaryAgent
+from app.blackboard import Blackboard
+
+def test_override_settings_resolves_aliases_and_restores():
+    base = settings.model_summary
+    with override_settings({"MODEL_SUMMARY": "gpt-5", "price_in_gpt5": 1.0, "NOT_A_SETTING": 1}):
+        assert settings.model_summary == "gpt-5"
+        assert settings.price_in_gpt5 == 1.0
+        with override_settings({"model_summary": "gpt-4o"}):
+            assert settings.model_summary == "gpt-4o" and settings.price_in_gpt5 == 1.0
+        assert current_settings().model_summary == "gpt-5"
+    assert settings.model_summary == base
+
+@pytest.mark.asyncio
+async def test_overlays_are_isolated_between_concurrent_tasks():
+    async def pick():
+        return SummaryAgent(Blackboard()).choose_model()
+
+    async def run(model):
+        with override_settings({"MODEL_SUMMARY": model}):
+            seen = []
+            for _ in range(3):
+                await asyncio.sleep(0.01)
+                # las tareas hijas heredan el overlay de quien las crea
+                seen.append(await asyncio.create_task(pick()))
+            return seen
+
+    a, b = await asyncio.gather(run("model-a"), run("model-b"))
+    assert a == ["model-a"] * 3 and b == ["model-b"] * 3
+
+def test_overrides_are_validated_and_writes_stay_in_the_overlay():
+    base = settings.scheduler_max_concurrency
+    with override_settings({"SCHEDULER_MAX_CONCURRENCY": "4"}):
+        assert settings.scheduler_max_concurrency == 4
+        settings.model_summary = "tenant-only"
+        assert settings.model_summary == "tenant-only"
+    assert settings.scheduler_max_concurrency == base
+    assert settings.model_summary != "tenant-only"
+    with pytest.raises(ValueError):
+        with override_settings({"SCHEDULER_MAX_CONCURRENCY": "many"}):
+            pass
+
+@pytest.mark.parametrize("key", ["vectorstore_dir", "BASE_DIR", "OPENAI_API_KEY", "SERVER_PORT", "LLAMA_GGUF_PATH"])
+def test_process_wide_settings_cannot_be_overridden(key):
+    before = current_settings()
+    with pytest.raises(ValueError, match="proceso"):
+        with override_settings({"MODEL_SUMMARY": "gpt-5", key: "/tmp/elsewhere"}):
+            pass
+    assert current_settings() is before
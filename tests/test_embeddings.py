@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+import app.models.embeddings as emb
+from app.caching.embeddings_cache import EmbeddingsCache
+from app.models.embeddings import embed_array  # referencia real (conftest parchea el módulo)
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def create(self, model, input):
+        self.batches.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(t)), 1.0]) for i, t in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+def test_per_text_cache_only_embeds_missing(monkeypatch, tmp_path):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(emb, "_client", SimpleNamespace(embeddings=fake))
+    monkeypatch.setattr(emb, "_cache", EmbeddingsCache(tmp_path / "emb.sqlite"))
+    monkeypatch.setattr(emb.settings, "embedding_batch_size", 2)
+
+    first = embed_array(["a", "bb", "a", "ccc"])
+    assert first.dtype.name == "float32" and first.shape == (4, 2)
+    assert first[:, 0].tolist() == [1.0, 2.0, 1.0, 3.0]
+    assert fake.batches == [["a", "bb"], ["ccc"]]  # deduplicado y por lotes
+
+    fake.batches.clear()
+    second = embed_array(["bb", "dddd", "a"])
+    assert fake.batches == [["dddd"]]
+    assert second[:, 0].tolist() == [2.0, 4.0, 1.0]
@@ -6,3 +6,62 @@ async def test_end_to_end_smoke():
     ans, usage = await run_query("Diferencias entre supervisado, no supervisado, semi-supervisado y RL.", image_url=None)
     assert isinstance(ans, str) and len(ans) > 0
     assert isinstance(usage, list)
+
+@pytest.mark.asyncio
+async def test_stream_query_emits_events_and_ttft():
+    from app.main import stream_query
+    events = [ev async for ev in stream_query("Diferencias entre supervisado y no supervisado.")]
+    kinds = [ev["type"] for ev in events]
+    assert kinds[0] == "plan" and kinds[-1] == "done"
+    assert "evidence" in kinds and "delta" in kinds
+    # los deltas son solo el texto de final_answer, no el JSON crudo
+    assert "".join(ev["data"] for ev in events if ev["type"] == "delta") == "respuesta sintetizada"
+    done = events[-1]["data"]
+    assert done["answer"] == "respuesta sintetizada"
+    assert 0 <= done["metrics"]["ttft_s"] <= done["metrics"]["total_s"]
+    assert kinds.index("delta") < kinds.index("answer")
+
+@pytest.mark.asyncio
+async def test_stream_failure_after_deltas_emits_reset_and_records_partial_usage(monkeypatch):
+    import app.agents.summary as summary
+    from app.main import stream_query
+    from app.models.openai_llm import LLMUsage
+
+    class BrokenStream:
+        def __init__(self, model, *a, **k):
+            self.model, self.text, self.usage, self.ttft = model, "", None, 0.0
+
+        async def __aiter__(self):
+            yield '{"final_answer":"respuesta a me'
+            self.text = '{"final_answer":"respuesta a me'
+            self.usage = LLMUsage(model=self.model, input_tokens=10, output_tokens=4, cost_usd=0.0)
+            raise ConnectionError("stream cortado")
+
+    monkeypatch.setattr(summary, "astream_llm", BrokenStream)
+    events = [ev async for ev in stream_query("Diferencias entre supervisado y no supervisado.")]
+    kinds = [ev["type"] for ev in events]
+    assert kinds.index("delta") < kinds.index("reset") < kinds.index("answer")
+    done = events[-1]["data"]
+    assert done["answer"] == "respuesta sintetizada"
+    assert any(line.endswith("|failed") and "out=4" in line for line in done["usage"])
+
+@pytest.mark.asyncio
+async def test_empty_stream_records_usage_before_falling_back(monkeypatch):
+    import app.agents.summary as summary
+    from app.main import stream_query
+    from app.models.openai_llm import LLMUsage
+
+    class EmptyStream:
+        def __init__(self, model, *a, **k):
+            self.model, self.text, self.usage, self.ttft = model, "", None, None
+
+        async def __aiter__(self):
+            self.text = "  \n"
+            self.usage = LLMUsage(model=self.model, input_tokens=10, output_tokens=1, cost_usd=0.0)
+            yield "  \n"
+
+    monkeypatch.setattr(summary, "astream_llm", EmptyStream)
+    events = [ev async for ev in stream_query("Qué es el aprendizaje por refuerzo.")]
+    done = events[-1]["data"]
+    assert done["answer"] == "respuesta sintetizada"
+    assert any(line.endswith("|empty") and "in=10" in line for line in done["usage"])
@@ -0,0 +1,70 @@
+import asyncio
+import time
+import orjson
+import pytest
+from app.config import settings, override_settings
+from app.eval import harness
+from app.utils.rate_limit import RateLimiter
+
+def _dataset(tmp_path, n=6):
+    p = tmp_path / "prompts.jsonl"
+    p.write_text("\n".join(orjson.dumps({"q": f"q{i}", "aspects": ["beta"]}).decode() for i in range(n)), encoding="utf-8")
+    return p
+
+@pytest.fixture
+def fake_query(monkeypatch):
+    calls = []
+
+    async def run_query(q, image_url=None, overrides=None, bypass_cache=False):
+        with override_settings(overrides):
+            calls.append((q, settings.model_summary))
+            model = settings.model_summary
+            await asyncio.sleep(0.05)
+            assert settings.model_summary == model  # el otro brazo, en paralelo, no lo pisa
+            return f"answer by {model}", [f"{model}|in=100|out=50|$0.001000"]
+
+    monkeypatch.setattr(harness, "run_query", run_query)
+    return calls
+
+@pytest.mark.asyncio
+async def test_run_dataset_concurrent_and_streams_jsonl(tmp_path, fake_query):
+    out = tmp_path / "res.jsonl"
+    t0 = time.perf_counter()
+    res = await harness.run_dataset(_dataset(tmp_path), concurrency=6, out=out)
+    assert time.perf_counter() - t0 < 0.25  # 6 × 0.05s en serie serían 0.3s
+    assert res["report"]["n"] == 6
+    assert res["report"]["input_tokens_total"] == 600 and res["report"]["cost_usd_total"] == pytest.approx(0.006)
+    lines = [orjson.loads(l) for l in out.read_bytes().splitlines()]
+    assert len(lines) == 6 and all("latency_s" in r and r["aspect_precision"] == 0.0 for r in lines)
+
+@pytest.mark.asyncio
+async def test_run_ab_interleaves_arms_and_resumes(tmp_path, fake_query):
+    out = tmp_path / "ab.jsonl"
+    a, b = {"MODEL_SUMMARY": "alpha"}, {"MODEL_SUMMARY": "beta"}
+    res = await harness.run_ab(_dataset(tmp_path, 4), a, b, concurrency=3, out=out)
+    assert res["A_results"]["report"]["aspect_precision_avg"] == 0.0
+    assert res["B_results"]["report"]["aspect_precision_avg"] == 1.0
+    # cada prompt se evalúa en ambos brazos antes de pasar al siguiente
+    first_two = {c[0] for c in fake_query[:2]}
+    assert len(first_two) == 1
+    assert settings.model_summary == "gpt-5-mini"
+    assert {c[1] for c in fake_query[:2]} == {"alpha", "beta"}  # A y B solapados
+
+    # checkpoint: una línea fallida se repite, el resto se reutiliza
+    lines = out.read_bytes().splitlines()
+    bad = orjson.loads(lines[0])
+    bad["error"] = "boom"
+    out.write_bytes(b"\n".join([orjson.dumps(bad)] + lines[1:]) + b"\n")
+    fake_query.clear()
+    res2 = await harness.run_ab(_dataset(tmp_path, 4), a, b, concurrency=3, out=out, resume=True)
+    assert len(fake_query) == 1
+    assert res2["B_results"]["report"]["n"] == 4
+
+@pytest.mark.asyncio
+async def test_rate_limiter_paces_requests():
+    lim = RateLimiter(rpm=600)  # 1 cada 0.1s una vez agotado el cubo
+    lim._req = 0.0
+    t0 = time.perf_counter()
+    for _ in range(3):
+        await lim.acquire()
+    assert time.perf_counter() - t0 >= 0.25
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.config import settings, override_settings
+from app.utils.executor import LoopLagMonitor, run_blocking
+
+@pytest.mark.asyncio
+async def test_run_blocking_keeps_event_loop_responsive():
+    async with LoopLagMonitor(interval=0.005, warn_ms=0) as mon:
+        await asyncio.gather(*(run_blocking(time.sleep, 0.2) for _ in range(4)),
+                             run_blocking(time.sleep, 0.2, pool="cpu"))
+    snap = mon.snapshot()
+    assert snap["samples"] > 10
+    assert snap["max_ms"] < 30
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_detects_blocking_call():
+    async with LoopLagMonitor(interval=0.005, warn_ms=50) as mon:
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # bloquea el loop a propósito
+        await asyncio.sleep(0.02)
+    assert mon.max_ms >= 80
+    assert mon.stalls == 1
+
+@pytest.mark.asyncio
+async def test_run_blocking_sees_settings_overlay():
+    with override_settings({"MODEL_ROUTER": "tenant-model"}):
+        inside = await run_blocking(lambda: settings.model_router)
+    assert inside == "tenant-model"
+    assert await run_blocking(lambda: settings.model_router) != "tenant-model"
+
+@pytest.mark.asyncio
+async def test_unknown_pool_fails():
+    assert await run_blocking(lambda: 1, pool="cpu") == 1
+    with pytest.raises(ValueError):
+        await run_blocking(lambda: 1, pool="llm")  # llama.cpp tiene su propio hilo
+
+@pytest.mark.asyncio
+async def test_web_evidence_selection_runs_off_the_loop(monkeypatch):
+    import app.agents.web_search as ws
+    from app.blackboard import Blackboard
+    threads = []
+
+    def slow_select(query, pages, token_budget):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.2)  # HTML → texto + BM25 sobre páginas grandes
+        return [{"source": p["source"], "url": p["url"], "content": "x"} for p in pages]
+
+    async def fetch_many(urls, **kw):
+        return {u: "<p>page</p>" for u in urls}
+
+    monkeypatch.setattr(ws, "_ddg_search", lambda q, n: [{"href": "http://a", "title": "A"}])
+    monkeypatch.setattr(ws, "fetch_many", fetch_many)
+    monkeypatch.setattr(ws, "select_evidence", slow_select)
+    bb = Blackboard()
+    await bb.set("input", "q")
+    async with LoopLagMonitor(interval=0.005) as mon:
+        await ws.WebSearchAgent(bb).act()
+    assert threads and threads[0].startswith("exec-cpu")
+    assert mon.snapshot()["max_ms"] < 50
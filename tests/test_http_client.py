@@ -0,0 +1,56 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from aiohttp import web
+import app.web.http_client as http
+from app.caching.web_cache import WebCache
+
+@pytest_asyncio.fixture
+async def local_server():
+    """Servidor HTTP local que hace de web externa. Devuelve (url base, peticiones por ruta)."""
+    hits = {}
+
+    async def fast(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        return web.Response(text=f"page {request.match_info['n']}")
+
+    async def slow(request):
+        await asyncio.sleep(1.0)
+        return web.Response(text="too late")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/fast/{n}", fast)
+    app.router.add_get("/slow", slow)
+    app.router.add_get("/missing", missing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", hits
+    await http.close_session()
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_fetch_many_deadline_keeps_partial_results(local_server, monkeypatch, tmp_path):
+    local_server, _hits = local_server
+    monkeypatch.setattr(http, "_cache", WebCache(tmp_path / "web.sqlite"))
+    urls = [f"{local_server}/fast/{i}" for i in range(4)] + [f"{local_server}/slow", f"{local_server}/missing"]
+    t0 = time.perf_counter()
+    pages = await http.fetch_many(urls, timeout=5.0, deadline=0.3)
+    assert time.perf_counter() - t0 < 0.9
+    assert pages == {f"{local_server}/fast/{i}": f"page {i}" for i in range(4)}
+
+@pytest.mark.asyncio
+async def test_session_is_shared(local_server, monkeypatch, tmp_path):
+    local_server, hits = local_server
+    monkeypatch.setattr(http, "_cache", WebCache(tmp_path / "web.sqlite"))
+    assert http.get_session() is http.get_session()
+    assert await http.fetch_text(f"{local_server}/fast/1") == "page 1"
+    # segunda vez sale de la caché web: no llega al servidor
+    assert await http.fetch_text(f"{local_server}/fast/1") == "page 1"
+    assert hits == {"/fast/1": 1}
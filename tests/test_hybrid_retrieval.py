@@ -0,0 +1,58 @@
+import pytest
+from app.rag.hybrid import retrieve, rrf
+from app.rag.sparse import BM25Index, tokenize
+from app.rag.vectorstore import SimpleFAISS
+
+DOCS = [
+    "El bono US0378331005 paga un cupón del 3.5% anual.",
+    "La inflación subió en la eurozona durante el trimestre.",
+    "El par EUR/USD cerró plano tras la reunión del BCE.",
+    "AAPL publicó resultados por encima de lo esperado.",
+] + [f"Nota de mercado genérica número {i} sobre renta variable." for i in range(40)]
+
+def test_tokenize_keeps_identifiers_numbers_and_parts():
+    toks = tokenize("El EUR/USD subió 3.5% e Inflación de AAPL")
+    assert {"eur/usd", "eur", "usd", "3.5%", "aapl", "inflacion"} <= set(toks)
+    assert "3" not in toks  # los números no se parten
+
+def test_bm25_ranks_exact_terms_and_supports_remove_and_persistence(tmp_path):
+    idx = BM25Index.build(enumerate(DOCS))
+    assert idx.search("cupón de US0378331005", k=3)[0][0] == 0
+    assert idx.search("aapl", k=1)[0][0] == 3
+    idx.remove(3, DOCS[3])
+    assert idx.search("aapl") == [] and len(idx) == len(DOCS) - 1
+    idx.save(tmp_path / "x.bm25")
+    again = BM25Index.load(tmp_path / "x.bm25")
+    assert again.search("EUR/USD", k=2) == idx.search("EUR/USD", k=2)
+
+def test_rrf_rewards_agreement():
+    fused = rrf([[(1, 0.9), (2, 0.8), (3, 0.7)], [(3, 12.0), (4, 9.0)]])
+    assert fused[0][0] == 3
+    assert [i for i, _ in fused] == [3, 1, 2, 4]
+
+@pytest.mark.asyncio
+async def test_hybrid_finds_identifiers_dense_misses(tmp_path):
+    vs = SimpleFAISS(tmp_path)
+    vs.add_texts(DOCS, [{"source": f"d{i}"} for i in range(len(DOCS))])
+    q = "US0378331005"
+    # embeddings de los tests son hashes: la búsqueda densa no sabe nada del identificador
+    dense = await retrieve(vs, q, candidates=3, mode="dense")
+    hybrid = await retrieve(vs, q, candidates=3, mode="hybrid")
+    assert 0 not in [i for i, _ in dense]
+    assert 0 in [i for i, _ in hybrid]
+    assert vs.fetch(hybrid[:1])[0][1]["source"] in {f"d{i}" for i in range(len(DOCS))}
+
+def test_bm25_persisted_beside_index_and_rebuilt_when_missing(tmp_path):
+    vs = SimpleFAISS(tmp_path)
+    ids = vs.add_texts(DOCS[:4], [{"source": "s"}] * 4)
+    vs.remove_ids(ids[3:])
+    vs.save("default")
+    assert (tmp_path / "default.bm25").exists()
+    loaded = SimpleFAISS(tmp_path)
+    loaded.load("default", mmap=True)
+    assert loaded.search_sparse_ids("EUR/USD", k=1)[0][0] == ids[2]
+    assert loaded.search_sparse_ids("AAPL") == []
+    (tmp_path / "default.bm25").unlink()
+    legacy = SimpleFAISS(tmp_path)
+    legacy.load("default")
+    assert legacy.search_sparse_ids("EUR/USD", k=1)[0][0] == ids[2]
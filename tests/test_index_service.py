@@ -0,0 +1,42 @@
+import os
+from app.rag.index_service import IndexService
+from app.rag.vectorstore import SimpleFAISS
+
+def test_index_service_warm_and_hot_reload(tmp_path):
+    vs = SimpleFAISS(tmp_path)
+    vs.add_texts(["alpha", "beta"], [{"source": "a"}, {"source": "b"}])
+    vs.save("default")
+
+    svc = IndexService(tmp_path, check_interval=0.0)
+    first = svc.get()
+    assert first is not None and len(first.texts) == 2
+    assert svc.get() is first  # sin cambios en disco: misma instancia
+
+    vs.add_texts(["gamma"], [{"source": "c"}])
+    vs.save("default")
+    st = os.stat(tmp_path / "default.json")  # fuerza un mtime distinto aunque el reloj sea grueso
+    os.utime(tmp_path / "default.json", ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    second = svc.get()
+    assert second is not first and len(second.texts) == 3
+    assert second.search("gamma", k=1)[0][0] == "gamma"
+
+def test_index_service_missing(tmp_path):
+    assert IndexService(tmp_path / "none").get() is None
+
+def test_index_service_skips_half_renamed_save(tmp_path):
+    vs = SimpleFAISS(tmp_path)
+    vs.add_texts(["alpha"], [{"source": "a"}])
+    vs.save("default")
+    svc = IndexService(tmp_path, check_interval=0.0)
+    first = svc.get()
+
+    vs.add_texts(["beta"], [{"source": "b"}])
+    vs.save("default")
+    # simula un lector entre el renombrado de .chunks y el del JSON: JSON más antiguo
+    st = os.stat(tmp_path / "default.chunks")
+    os.utime(tmp_path / "default.chunks", ns=(st.st_atime_ns, os.stat(tmp_path / "default.json").st_mtime_ns + 1_000_000))
+    assert svc.get() is first
+    st = os.stat(tmp_path / "default.json")
+    os.utime(tmp_path / "default.json", ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000))
+    second = svc.get()
+    assert second is not first and len(second.texts) == 2
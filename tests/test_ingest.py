@@ -0,0 +1,89 @@
+import pytest
+from app.rag.vectorstore import SimpleFAISS
+from app.rag.ingest import sync_directory
+import app.rag.vectorstore as vsmod
+from app.agents.rag import RAGAgent
+from app.blackboard import Blackboard
+from app.rag.index_service import IndexService
+
+def test_incremental_sync(tmp_path, monkeypatch):
+    embedded = []
+    fake = vsmod.embed_array  # stub determinista del conftest
+
+    def counting(texts, model=None):
+        embedded.extend(texts)
+        return fake(texts, model)
+
+    monkeypatch.setattr(vsmod, "embed_array", counting)
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.txt").write_text("Alpha one. Alpha two.", encoding="utf-8")
+    (corpus / "b.md").write_text("Beta text.", encoding="utf-8")
+    vs = SimpleFAISS(tmp_path / "vs")
+
+    st = sync_directory(vs, corpus)
+    assert st["added"] == 2 and vs.index.ntotal == 2
+
+    embedded.clear()
+    st = sync_directory(vs, corpus)
+    assert st["unchanged"] == 2 and embedded == []
+
+    (corpus / "a.txt").write_text("Alpha changed.", encoding="utf-8")
+    (corpus / "b.md").unlink()
+    (corpus / "c.txt").write_text("Gamma.", encoding="utf-8")
+    st = sync_directory(vs, corpus)
+    assert (st["added"], st["updated"], st["deleted"]) == (1, 1, 1)
+    assert sorted(embedded) == ["Alpha changed.", "Gamma."]
+    assert vs.index.ntotal == 2 and sorted(vs.texts.values()) == ["Alpha changed.", "Gamma."]
+
+    reloaded = SimpleFAISS(tmp_path / "vs")
+    reloaded.load("default")
+    assert reloaded.index.ntotal == 2
+    assert sync_directory(reloaded, corpus)["unchanged"] == 2
+
+@pytest.mark.parametrize("damage", ["delete", "corrupt"])
+def test_sync_rebuilds_when_index_file_is_lost(tmp_path, damage):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.txt").write_text("Alpha one. Alpha two.", encoding="utf-8")
+    sync_directory(SimpleFAISS(tmp_path / "vs"), corpus)
+    faiss_file = tmp_path / "vs" / "default.faiss"
+    if damage == "delete":
+        faiss_file.unlink()
+    else:
+        faiss_file.write_bytes(b"not an index")
+
+    agent = RAGAgent(Blackboard(), corpus_dir=corpus)
+    agent.index_service = IndexService(tmp_path / "vs")
+    st = agent.ingest_directory()
+    assert st["added"] == 1 and st["chunks"] == 1
+    vs = agent.vs
+    assert vs is not None and vs.index.ntotal == 1
+    assert agent.ingest_directory()["unchanged"] == 1
+
+def test_chunks_record_spans_and_sections(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    doc = "# Guía\n\nIntro breve.\n\n## Riesgos\n\nEl riesgo principal es la liquidez."
+    (corpus / "g.md").write_text(doc, encoding="utf-8")
+    vs = SimpleFAISS(tmp_path / "vs")
+    sync_directory(vs, corpus)
+    metas = [vs.store.get(i) for i in vs.texts]
+    assert [m["section"] for _t, m in metas] == ["Guía", "Guía > Riesgos"]
+    for text, m in metas:
+        start, end = map(int, m["span"].split("-"))
+        assert doc[start:end] == text
+
+def test_spans_index_decoded_text_with_crlf(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    raw = "# Guía\r\n\r\nIntro breve.\r\n\r\n## Riesgos\r\n\r\nEl riesgo principal es la liquidez.\r\n".encode("utf-8")
+    (corpus / "g.md").write_bytes(raw)
+    vs = SimpleFAISS(tmp_path / "vs")
+    sync_directory(vs, corpus)
+    metas = [vs.store.get(i) for i in vs.texts]
+    assert [m["section"] for _t, m in metas] == ["Guía", "Guía > Riesgos"]
+    decoded = raw.decode("utf-8")
+    for text, m in metas:
+        start, end = map(int, m["span"].split("-"))
+        assert decoded[start:end] == text
@@ -0,0 +1,107 @@
+import asyncio
+import time
+import pytest
+import app.models.local_llm as local_llm
+from app.models.local_llm import SYSTEM_PROMPT, LlamaEngine, auto_ctx, auto_threads, build_prompt
+from app.utils.executor import LoopLagMonitor
+
+class FakeLlama:
+    """Emite la query palabra a palabra; bloquea su hilo como la inferencia real."""
+    loads = 0
+
+    def __init__(self, model_path, n_ctx, n_threads, **kw):
+        FakeLlama.loads += 1
+        self.n_ctx, self.n_threads = n_ctx, n_threads
+        self.cache = None
+        self.calls = []
+        self.busy = False
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def __call__(self, prompt, max_tokens, temperature, stream=False):
+        self.calls.append(prompt)
+        if not stream:
+            return {"choices": [{"text": "x"}]}
+        return self._stream(prompt[len(SYSTEM_PROMPT):].split()[:max_tokens])
+
+    def _stream(self, words):
+        assert not self.busy, "llamadas concurrentes al modelo"
+        self.busy = True
+        try:
+            for w in words:
+                time.sleep(0.01)
+                yield {"choices": [{"text": w + " "}]}
+        finally:
+            self.busy = False
+
+@pytest.fixture
+def engine(monkeypatch):
+    FakeLlama.loads = 0
+    monkeypatch.setattr(local_llm, "Llama", FakeLlama)
+    monkeypatch.setattr(local_llm, "LlamaRAMCache", lambda capacity_bytes: ("ram", capacity_bytes))
+    eng = LlamaEngine("model.gguf", n_threads=3, prompt_cache_mb=64)
+    yield eng
+    eng.close(timeout=1)
+
+@pytest.mark.asyncio
+async def test_engine_preloads_once_and_warms_system_prefix(engine):
+    assert await engine.ready()
+    assert await engine.generate(build_prompt("hola mundo")) == "hola mundo "
+    assert await engine.generate(build_prompt("otra")) == "otra "
+    llm = engine._llm
+    assert FakeLlama.loads == 1 and llm.n_threads == 3 and llm.cache == ("ram", 64 << 20)
+    assert llm.calls[0] == SYSTEM_PROMPT
+    assert engine.stats()["state"] == "ready" and engine.stats()["served"] == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_queue_on_one_thread_and_stream(engine):
+    await engine.ready()
+
+    async def ask(q):
+        s = engine.stream(build_prompt(q))
+        async for _ in s:
+            pass
+        return s.text, s.ttft
+
+    async with LoopLagMonitor(interval=0.005) as mon:
+        results = await asyncio.gather(*(ask(f"q{i} a b c d e") for i in range(4)))
+    assert [t for t, _ in results] == [f"q{i} a b c d e " for i in range(4)]
+    assert all(ttft is not None for _, ttft in results)
+    assert mon.snapshot()["max_ms"] < 30
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_frees_the_engine(engine):
+    await engine.ready()
+    it = engine.stream(build_prompt(" ".join(f"w{i}" for i in range(200)))).__aiter__()
+    assert await it.__anext__() == "w0 "
+    await it.aclose()
+    t0 = time.perf_counter()
+    assert await engine.generate(build_prompt("siguiente")) == "siguiente "
+    assert time.perf_counter() - t0 < 0.5
+
+@pytest.mark.asyncio
+async def test_engine_unavailable_or_full_fails_fast(monkeypatch):
+    monkeypatch.setattr(local_llm, "Llama", None)
+    eng = LlamaEngine("model.gguf")
+    assert not await eng.ready()
+    with pytest.raises(RuntimeError, match="not available"):
+        await eng.generate("x")
+    eng.close(timeout=1)
+
+    monkeypatch.setattr(local_llm, "Llama", FakeLlama)
+    eng = LlamaEngine("model.gguf", max_queue=1)
+    await eng.ready()
+    running = eng.stream(build_prompt("a b c d e f")).__aiter__()
+    await running.__anext__()  # en el worker
+    waiting = asyncio.create_task(eng.generate(build_prompt("b")))  # ocupa la cola
+    await asyncio.sleep(0)
+    with pytest.raises(RuntimeError, match="queue full"):
+        await eng.generate("x")
+    await running.aclose()
+    assert await waiting == "b "
+    eng.close(timeout=1)
+
+def test_auto_sizing_is_bounded(tmp_path):
+    assert auto_threads() >= 1
+    assert auto_ctx(str(tmp_path / "missing.gguf")) in (2048, 4096, 8192)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from app.blackboard import Blackboard
+from app.caching import semantic_cache
+from app.caching.llm_cache import LLMCache
+from app.models import local_router as lr
+from app.agents import router as router_mod
+from app.agents.router import RouterAgent
+
+def _vec(text):
+    t = text.lower()
+    return np.array([("bolsa" in t) + ("bonos" in t), ("python" in t) + ("código" in t), 0.1], dtype=np.float32)
+
+@pytest.fixture
+def clf(monkeypatch):
+    monkeypatch.setattr(lr, "embed_array", lambda texts, model=None: np.stack([_vec(t) for t in texts]))
+    examples = [(f"bolsa y bonos {i}", "finance") for i in range(3)] + [(f"código python {i}", "code") for i in range(3)]
+    return lr.LocalRouter(examples, min_examples=3).fit()
+
+def test_nearest_centroid_and_fuzzy(clf):
+    assert clf.ready and clf.domains == ["code", "finance"]
+    dom, conf = clf.predict("¿conviene comprar bonos o bolsa?")
+    assert dom == "finance" and conf > 0.9
+    assert clf.predict("código python 1")[0] == "code"  # casi-duplicado léxico
+    dom, conf = clf.predict("receta de tortilla")  # equidistante
+    assert conf < 0.75
+    # una palabra contenida en un ejemplo no es un casi-duplicado (token_set_ratio daría 100)
+    assert clf.predict("y")[1] < 0.75
+
+def test_load_examples_skips_self_labelled(tmp_path):
+    mem = tmp_path / "m.jsonl"
+    mem.write_text('{"q":"a","domain":"finance","route_source":"llm"}\n{"q":"b","domain":"code","route_source":"local"}\n{"q":"c"}\n')
+    ds = tmp_path / "d.jsonl"
+    ds.write_text('{"q":"d","domain":"web"}\n')
+    assert sorted(lr.load_examples(mem, [ds])) == [("a", "finance"), ("d", "web")]
+
+@pytest.mark.asyncio
+async def test_router_uses_local_classifier_and_escalates(monkeypatch, clf, tmp_path):
+    monkeypatch.setattr(semantic_cache, "_caches", {})
+    monkeypatch.setattr(router_mod, "get_local_router", lambda: clf)
+
+    async def route(q):
+        bb = Blackboard()
+        await bb.set("input", q)
+        await bb.set("input_embedding", _vec(q))
+        # caché LLM propia: la del repo puede tener ya la respuesta de otra ejecución
+        await RouterAgent(bb, cache=LLMCache(tmp_path / "llm.sqlite")).act()
+        return await bb.get("router_output"), await bb.get("router_source"), await bb.get("usage_log")
+
+    out, source, usage = await route("¿Qué pasa con los bonos y la bolsa hoy?")
+    assert out["domain"] == "finance" and source == "local" and usage is None
+    out, source, usage = await route("Una receta de tortilla de patatas, por favor")
+    assert source == "llm" and len(usage) == 1
+    monkeypatch.setattr(semantic_cache, "_caches", {})  # mismo vector que la tortilla
+    out, source, usage = await route("y")  # subconjunto de "bolsa y bonos 0": escala igualmente
+    assert source == "llm" and len(usage) == 1
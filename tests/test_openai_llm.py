@@ -0,0 +1,78 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+import app.models.openai_llm as ollm
+from app.models.openai_llm import acall_llm, astream_llm  # referencias reales (conftest parchea el atributo del módulo)
+
+class FakeCompletions:
+    def __init__(self, delay=0.0, reject=None):
+        self.delay = delay
+        self.reject = reject
+        self.calls = []
+
+    async def create(self, **k):
+        self.calls.append(dict(k))
+        if self.reject and self.reject in k:
+            raise ValueError(f"Unsupported parameter: '{self.reject}' is not supported with this model.")
+        await asyncio.sleep(self.delay)
+        msg = SimpleNamespace(content='{"ok":true}', refusal=None)
+        usage = SimpleNamespace(prompt_tokens=3, completion_tokens=2)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=usage)
+
+def _fake_client(monkeypatch, comp):
+    monkeypatch.setattr(ollm, "aclient", SimpleNamespace(chat=SimpleNamespace(completions=comp)))
+
+@pytest.mark.asyncio
+async def test_acall_llm_runs_concurrently(monkeypatch):
+    _fake_client(monkeypatch, FakeCompletions(delay=0.2))
+    msgs = [{"role": "user", "content": "hola"}]
+    t0 = time.perf_counter()
+    outs = await asyncio.gather(*(acall_llm("gpt-5-mini", msgs, json_object=True) for _ in range(4)))
+    elapsed = time.perf_counter() - t0
+    assert all(text == '{"ok":true}' for text, _ in outs)
+    assert elapsed < 0.5  # ~ la llamada más lenta, no la suma (0.8s)
+
+@pytest.mark.asyncio
+async def test_acall_llm_drops_unsupported_temperature(monkeypatch):
+    comp = FakeCompletions(reject="temperature")
+    _fake_client(monkeypatch, comp)
+    text, usage = await acall_llm("gpt-5", [{"role": "user", "content": "x"}], temperature=0.3, max_tokens=10)
+    assert text == '{"ok":true}'
+    assert "temperature" not in comp.calls[-1]
+    assert comp.calls[-1]["max_completion_tokens"] == 10
+    assert usage.model == "gpt-5" and usage.input_tokens == 3 and usage.output_tokens == 2
+
+@pytest.mark.asyncio
+async def test_astream_llm_yields_deltas_and_usage(monkeypatch):
+    class Streaming:
+        async def create(self, **k):
+            assert k["stream"] and k["stream_options"] == {"include_usage": True}
+
+            async def gen():
+                for piece in ("Hola", " ", "mundo"):
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+                yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=7, completion_tokens=3))
+            return gen()
+
+    _fake_client(monkeypatch, Streaming())
+    stream = astream_llm("gpt-5-mini", [{"role": "user", "content": "hola"}])
+    deltas = [d async for d in stream]
+    assert deltas == ["Hola", " ", "mundo"] and stream.text == "Hola mundo"
+    assert stream.ttft is not None and stream.usage.input_tokens == 7 and stream.usage.output_tokens == 3
+
+@pytest.mark.asyncio
+async def test_astream_llm_estimates_usage_when_cut_mid_stream(monkeypatch):
+    class Broken:
+        async def create(self, **k):
+            async def gen():
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Hola mundo"))], usage=None)
+                raise ConnectionError("reset by peer")
+            return gen()
+
+    _fake_client(monkeypatch, Broken())
+    stream = astream_llm("gpt-5-mini", [{"role": "user", "content": "hola"}])
+    with pytest.raises(ConnectionError):
+        async for _ in stream:
+            pass
+    assert stream.text == "Hola mundo" and stream.usage.output_tokens > 0
@@ -0,0 +1,55 @@
+import time
+import numpy as np
+import pytest
+from app.rag.rerank import merge_adjacent, mmr
+import app.rag.vectorstore as vsmod
+from app.rag.vectorstore import SimpleFAISS
+
+def test_mmr_skips_near_duplicates():
+    base = np.array([1.0, 0.0, 0.0])
+    vecs = np.stack([base, base + [0, 0.01, 0], base + [0, 0, 0.01], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    rel = [1.0, 0.99, 0.98, 0.95, 0.0]
+    assert mmr(rel, vecs, k=2) == [0, 3]
+    assert mmr(rel, vecs, k=2, lambda_=1.0) == [0, 1]
+
+def test_mmr_k50_under_a_millisecond():
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((50, 3072)).astype(np.float32)
+    rel = rng.random(50)
+    best = min(_timed(lambda: mmr(rel, vecs, k=5)) for _ in range(20))
+    assert best < 1e-3
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+def test_merge_adjacent_rebuilds_text_from_spans():
+    doc = "Uno dos tres. Cuatro cinco seis. Siete ocho nueve."
+    p = lambda a, b, src="d", score=1.0: (doc[a:b], {"source": src, "span": f"{a}-{b}"}, score)
+    merged = merge_adjacent([p(14, 32, score=0.9), p(0, 19), p(33, len(doc), score=0.5), p(0, 13, src="otro")])
+    assert merged[0][0] == doc and merged[0][1]["span"] == f"0-{len(doc)}"
+    assert merged[0][1]["merged"] == 3 and merged[0][2] == 0.9
+    assert merged[1][1]["source"] == "otro"
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf_flat", "ivf_pq"])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_vectors_are_read_back_from_index(tmp_path, kind, mmap):
+    vs = SimpleFAISS(tmp_path, index_type=kind)
+    ids = vs.add_texts([f"chunk {i}" for i in range(300)], [{"source": "s"}] * 300)
+    vs.remove_ids(ids[:3])
+    if mmap:
+        vs.save("v")
+        vs = SimpleFAISS(tmp_path)
+        vs.load("v", mmap=True)
+    assert vs.index_type == kind
+    base = vsmod.faiss.downcast_index(vs.index)
+    if kind.startswith("ivf"):  # el mapa de IDs ya existe: leer no modifica el índice compartido
+        assert base.direct_map.type == vsmod.faiss.DirectMap.Hashtable
+    got = vs.vectors([ids[10], ids[5]])
+    want = vs._prep(vsmod.embed_array(["chunk 10", "chunk 5"]))
+    if kind == "ivf_pq":  # PQ solo guarda una aproximación
+        assert np.all(np.sum(got * want, axis=1) > 0.8)
+    else:
+        assert np.allclose(got, want, atol=1e-5)
+    assert vs.vectors([ids[0]]) is None
@@ -16,7 +16,102 @@ async def test_scheduler_parallel_cancel():
         await asyncio.sleep(0.05)
         await bb.set("final_answer", "ok")
 
-    plan = [[slow, finalizer]]
+    plan = [[slow, finalizer], [slow]]
+    t0 = asyncio.get_running_loop().time()
     await sched.run(plan)
     fa = await bb.get("final_answer")
     assert fa == "ok"
+    # el paso lento se cancela en cuanto aparece final_answer, y la capa siguiente no corre
+    assert await bb.get("x") is None
+    assert asyncio.get_running_loop().time() - t0 < 0.15
+
+@pytest.mark.asyncio
+async def test_scheduler_records_usage_of_cancelled_llm_calls(monkeypatch):
+    from types import SimpleNamespace
+    import app.models.openai_llm as ollm
+
+    class Hanging:
+        async def create(self, **k):
+            await asyncio.sleep(10)
+
+    monkeypatch.setattr(ollm, "aclient", SimpleNamespace(chat=SimpleNamespace(completions=Hanging())))
+    bb = Blackboard()
+    sched = Scheduler(bb, stop_key="done")
+
+    async def llm_step():
+        await ollm._acomplete({"model": "gpt-5-mini", "messages": [{"role": "user", "content": "x" * 400}]},
+                              json_object=False, max_tokens=None)
+
+    async def finisher():
+        await asyncio.sleep(0.02)
+        await bb.set("done", True)
+
+    await sched.run([[llm_step, finisher]])
+    usage = await bb.get("usage_log")
+    assert len(usage) == 1 and usage[0].startswith("gpt-5-mini|in=") and usage[0].endswith("|cancelled")
+    assert "|in=0|" not in usage[0]
+
+@pytest.mark.asyncio
+async def test_scheduler_dag_starts_steps_when_requires_done():
+    from app.scheduler import DagStep
+    bb = Blackboard()
+    sched = Scheduler(bb)
+    finished = []
+
+    def agent(name, delay):
+        async def fn():
+            await asyncio.sleep(delay)
+            finished.append(name)
+        return fn
+
+    dag = {
+        "web": DagStep([agent("web", 0.2)]),
+        "rag": DagStep([agent("rag", 0.01)]),
+        "analyze_rag": DagStep([agent("analyze_rag", 0.01)], requires=["rag"]),
+        "draft": DagStep([agent("draft", 0.01)], requires=["web", "analyze_rag"]),
+    }
+    await sched.run_dag(dag)
+    # analyze_rag no espera a la búsqueda web lenta
+    assert finished.index("analyze_rag") < finished.index("web")
+    assert finished[-1] == "draft"
+
+@pytest.mark.asyncio
+async def test_scheduler_dag_cycle_detected():
+    from app.scheduler import DagStep, CycleError
+    bb = Blackboard()
+    ran = []
+
+    async def fn():
+        ran.append(1)
+
+    dag = {"a": DagStep([fn], requires=["b"]), "b": DagStep([fn], requires=["a"])}
+    with pytest.raises(CycleError):
+        await Scheduler(bb).run_dag(dag)
+    assert ran == []
+
+@pytest.mark.asyncio
+async def test_scheduler_max_concurrency():
+    bb = Blackboard()
+    sched = Scheduler(bb, max_concurrency=2)
+    active = 0
+    peak = 0
+
+    async def step():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+
+    await sched.run([[step] * 5])
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_scheduler_stop_key_accepts_arrays_and_ignores_blank_text():
+    import numpy as np
+    bb = Blackboard()
+    sched = Scheduler(bb, stop_key="input_embedding")
+    await bb.set("input_embedding", "   ")
+    assert not sched.cancel_event.is_set()
+    await bb.set("input_embedding", np.ones(3, dtype=np.float32))
+    assert sched.cancel_event.is_set()
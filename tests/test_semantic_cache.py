@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from app.blackboard import Blackboard
+from app.caching import semantic_cache
+from app.caching.semantic_cache import SemanticCache
+from app.agents.planner import PlannerAgent
+from app.config import override_settings
+
+def test_exact_similarity_ttl_and_lru():
+    now = [0.0]
+    c = SemanticCache(max_entries=2, ttl=10, threshold=0.9, clock=lambda: now[0])
+    c.put("a", "plan-a", np.array([1.0, 0.0]), scope="general")
+    assert c.get("a", scope="general") == ("plan-a", 1.0)
+    # vecino cercano en el mismo scope; otro scope no casa
+    val, sim = c.get("x", np.array([0.99, 0.05]), scope="general")
+    assert val == "plan-a" and sim > 0.9
+    assert c.get("x", np.array([0.99, 0.05]), scope="finance") is None
+    assert c.get("x", np.array([0.0, 1.0]), scope="general") is None
+    # LRU: "a" es el más reciente, se expulsa "b"
+    c.put("b", "plan-b", np.array([0.0, 1.0]))
+    c.get("a", scope="general")
+    c.put("c", "plan-c", np.array([0.5, 0.5]))
+    assert c.get("b") is None and len(c) == 2
+    now[0] = 11
+    assert c.get("a", scope="general") is None
+
+@pytest.mark.asyncio
+async def test_planner_reuses_cached_plan_until_agent_list_changes(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_caches", {})
+
+    async def plan(agents=None):
+        bb = Blackboard()
+        await bb.set("input", "Compara   modelos locales vs GPT-5")
+        await bb.set("router_output", {"domain": "general"})
+        await PlannerAgent(bb, agents=agents).act()
+        return await bb.get("usage_log") or []
+
+    assert len(await plan()) == 1
+    assert await plan() == []  # acierto: sin llamada al LLM
+    assert len(await plan(agents=["rag", "summary"])) == 1  # otra lista de agentes: otro scope
+    assert await plan() == []  # ...sin vaciar la caché
+
+@pytest.mark.asyncio
+async def test_planner_cache_is_scoped_by_model_across_alternating_arms(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_caches", {})
+
+    async def plan(model):
+        bb = Blackboard()
+        await bb.set("input", "Compara modelos locales vs GPT-5")
+        await bb.set("router_output", {"domain": "general"})
+        with override_settings({"MODEL_PLANNER": model}):
+            await PlannerAgent(bb).act()
+        return [line.split("|")[0] for line in await bb.get("usage_log") or []]
+
+    assert await plan("gpt-5") == ["gpt-5"]
+    assert await plan("gpt-5-mini") == ["gpt-5-mini"]  # no recibe el plan de gpt-5
+    assert await plan("gpt-5") == [] and await plan("gpt-5-mini") == []  # ambos siguen en caché
@@ -0,0 +1,81 @@
+import asyncio
+import orjson
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from app import server as srv
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    calls = []
+
+    async def stream_query(query, image_url=None, overrides=None, bypass_cache=False):
+        calls.append(query)
+        yield {"type": "plan", "data": {"steps": []}, "t": 0.0}
+        await asyncio.sleep(0.1 if query != "slow" else 5)
+        yield {"type": "delta", "data": "hola", "t": 0.1}
+        yield {"type": "done", "data": {"answer": f"re: {query}", "usage": [], "metrics": {"ttft_s": 0.1}}, "t": 0.1}
+
+    monkeypatch.setattr(srv, "stream_query", stream_query)
+    return calls
+
+@pytest_asyncio.fixture
+async def client():
+    app = srv.QueryServer(max_concurrency=2, max_queue=1, deadline=1.0).app()
+    app.on_startup.clear()
+    async with TestClient(TestServer(app)) as c:
+        yield c
+
+@pytest.mark.asyncio
+async def test_json_endpoint_coalesces_identical_queries(client, fake_stream):
+    rs = await asyncio.gather(*(client.post("/query", json={"q": "igual"}) for _ in range(5)))
+    bodies = [await r.json() for r in rs]
+    assert all(r.status == 200 for r in rs)
+    assert all(b["answer"] == "re: igual" for b in bodies)
+    assert fake_stream == ["igual"]
+
+@pytest.mark.asyncio
+async def test_sse_stream_and_backpressure_and_deadline(client, fake_stream):
+    r = await client.get("/query/stream", params={"q": "hola"})
+    text = await r.text()
+    assert r.headers["Content-Type"].startswith("text/event-stream")
+    events = [l for l in text.split("\n") if l.startswith("event: ")]
+    assert events == ["event: plan", "event: delta", "event: done"]
+    assert orjson.loads(text.split("data: ")[-1])["data"]["answer"] == "re: hola"
+
+    # 2 en ejecución + 1 en cola llenan el servidor; la 4ª distinta recibe 503
+    slow = [asyncio.create_task(client.post("/query", json={"q": q, "deadline": 0.3})) for q in ("slow", "a", "b")]
+    await asyncio.sleep(0.02)
+    busy = await client.post("/query", json={"q": "c"})
+    assert busy.status == 503 and busy.headers["Retry-After"] == "1"
+    statuses = [(await t).status for t in slow]
+    assert statuses[0] == 504 and statuses[1:] == [200, 200]
+
+@pytest.mark.asyncio
+async def test_rejoin_after_abandoned_flight_keeps_coalescing(fake_stream):
+    server = srv.QueryServer(max_concurrency=2, max_queue=1, deadline=1.0)
+    params = {"q": "slow"}
+    first = server._join(params)
+    await asyncio.sleep(0.01)  # en ejecución
+    server._leave(first)  # sin clientes: se cancela, su finally aún no ha corrido
+    second = server._join(params)
+    await asyncio.gather(first.task, return_exceptions=True)
+    third = server._join(params)
+    assert third is second and server.flights == {second.key: second}
+    assert fake_stream == ["slow", "slow"]
+    server._leave(second)
+    server._leave(third)
+    await asyncio.gather(second.task, return_exceptions=True)
+
+@pytest.mark.asyncio
+async def test_overrides_are_limited_to_per_query_options(client, fake_stream):
+    ok = await client.post("/query", json={"q": "a", "overrides": {"MODEL_SUMMARY": "gpt-5", "answer_cache": "false"}})
+    assert ok.status == 200
+    for overrides in ({"VECTORSTORE_DIR": "/tmp/x"}, {"OPENAI_API_KEY": "k"}, {"NOT_A_SETTING": 1}, ["MODEL_SUMMARY"]):
+        r = await client.post("/query", json={"q": "b", "overrides": overrides})
+        assert r.status == 400
+    r = await client.get("/query/stream", params={"q": "b", "overrides": '{"base_dir": "/"}'})
+    assert r.status == 400 and "base_dir" in await r.text()
+    r = await client.post("/query", json={"q": "b", "overrides": {"PRICE_IN_GPT5": "cheap"}})
+    assert r.status == 400 and "invalid overrides" in await r.text()
+    assert fake_stream == ["a"]
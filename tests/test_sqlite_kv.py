@@ -0,0 +1,53 @@
+import sqlite3
+import pytest
+from app.caching.sqlite_kv import SQLiteKV
+
+def test_instances_share_pool_and_group_commit(tmp_path):
+    path = tmp_path / "kv.sqlite"
+    a, b = SQLiteKV(path), SQLiteKV(path)
+    assert a.pool is b.pool
+    a.set("k", {"x": 1})
+    # visible antes del commit (buffer compartido)
+    assert b.get("k")[0] == {"x": 1}
+    a.flush()
+    rows = sqlite3.connect(str(path)).execute("SELECT count(*) FROM kv").fetchone()[0]
+    assert rows == 1
+    with a.pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_ttl_expiry_and_delete(tmp_path):
+    kv = SQLiteKV(tmp_path / "kv.sqlite")
+    kv.set("old", 1, ttl=-1)
+    kv.flush()
+    assert kv.get("old") is None
+    kv.set("k", 2)
+    kv.delete("k")
+    assert kv.get("k") is None
+
+@pytest.mark.asyncio
+async def test_async_api(tmp_path):
+    kv = SQLiteKV(tmp_path / "kv.sqlite")
+    await kv.aset("k", [1, 2])
+    kv.flush()
+    assert (await kv.aget("k"))[0] == [1, 2]
+
+def test_failed_flush_keeps_batch_without_clobbering_newer_writes(tmp_path, monkeypatch):
+    from contextlib import contextmanager
+    kv = SQLiteKV(tmp_path / "kv.sqlite")
+    kv.set("a", 1)
+    kv.set("b", 1)
+    real = kv.pool.connection
+
+    @contextmanager
+    def locked():
+        kv.set("a", 2)  # reescrita mientras el lote está en commit
+        raise sqlite3.OperationalError("database is locked")
+        yield
+
+    monkeypatch.setattr(kv.pool, "connection", locked)
+    kv.flush()
+    monkeypatch.setattr(kv.pool, "connection", real)
+    kv.flush()
+    assert kv.get("a")[0] == 2 and kv.get("b")[0] == 1
+    keys = {k for (k,) in sqlite3.connect(str(tmp_path / "kv.sqlite")).execute("SELECT k FROM kv")}
+    assert keys == {"a", "b"}
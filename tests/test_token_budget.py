@@ -0,0 +1,22 @@
+from app.utils.token_budget import count_tokens, count_message_tokens, enforce_token_budget, fit_sections
+
+def test_fit_sections_fair_share_and_budget():
+    small, big1, big2 = "a " * 10, "b " * 4000, "c " * 2000
+    out = fit_sections([("small", small), ("big1", big1), ("big2", big2)], budget=600)
+    assert out["small"] == small  # cabe en su parte: entera
+    assert sum(count_tokens(v) for v in out.values()) <= 600 + 20  # + marcas de recorte
+    assert abs(count_tokens(out["big1"]) - count_tokens(out["big2"])) <= 5
+
+def test_enforce_token_budget_drops_old_then_truncates():
+    msgs = [{"role": "system", "content": "sys"}] + [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "x " * 500} for i in range(6)
+    ] + [{"role": "user", "content": "pregunta final " * 800}]
+    out = enforce_token_budget(msgs, model="gpt-5-mini", reserve=100, budget=1000)
+    assert out[0]["content"] == "sys"
+    assert out[-1]["content"].startswith("pregunta final")
+    assert len(out) == 2
+    assert count_message_tokens(out, "gpt-5-mini") <= 1000
+
+def test_enforce_token_budget_untouched_when_fits():
+    msgs = [{"role": "user", "content": "hola"}]
+    assert enforce_token_budget(msgs, model="gpt-5", budget=1000) is msgs
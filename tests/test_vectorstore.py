@@ -0,0 +1,29 @@
+import pytest
+from app.rag.vectorstore import SimpleFAISS
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf_flat", "ivf_pq"])
+def test_index_types_search_and_remove(tmp_path, kind):
+    vs = SimpleFAISS(tmp_path, index_type=kind)
+    texts = [f"chunk {i}" for i in range(300)]
+    ids = vs.add_texts(texts, [{"source": "s"}] * len(texts))
+    text, _meta, score = vs.search("chunk 7", k=5)[0]
+    assert text == "chunk 7"
+    assert score == pytest.approx(1.0, abs=1e-3)  # normalizado: similitud coseno
+
+    vs.remove_ids(ids[:10])
+    assert vs.index.ntotal == 290
+    assert all(t != "chunk 7" for t, _m, _d in vs.search("chunk 7", k=5))
+
+    vs.save("t")
+    again = SimpleFAISS(tmp_path)
+    again.load("t")
+    assert again.index_type == kind and again.search("chunk 42", k=1)[0][0] == "chunk 42"
+
+def test_downgraded_index_records_effective_type(tmp_path):
+    vs = SimpleFAISS(tmp_path, index_type="ivf_pq")
+    vs.add_texts([f"chunk {i}" for i in range(20)], [{"source": "s"}] * 20)  # pocos para IVF/PQ
+    assert vs.index_type == "flat"
+    vs.save("t")
+    again = SimpleFAISS(tmp_path, index_type="ivf_pq")
+    again.load("t")
+    assert again.index_type == "flat"
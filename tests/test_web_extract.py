@@ -0,0 +1,30 @@
+from app.web.extract import html_to_text, select_evidence, split_passages
+
+PAGE = """<html><head><style>.x{color:red}</style><script>var a=1;</script></head>
+<body><nav>Home | About | Login</nav>
+<article><h1>Yield curve</h1>
+<p>An inverted yield curve happens when short-term rates exceed long-term rates. """ + "Filler sentence about bonds. " * 10 + """</p>
+<p>Historically an inverted yield curve has preceded recessions in the United States. """ + "More context on macro cycles. " * 10 + """</p>
+<p>Cookie policy and newsletter signup details that are not relevant at all to anything here. """ + "Lorem ipsum dolor sit amet. " * 10 + """</p>
+</article><footer>© 2024 Site</footer></body></html>"""
+
+def test_html_to_text_drops_markup_and_chrome():
+    text = html_to_text(PAGE)
+    assert "inverted yield curve" in text
+    for junk in ("color:red", "var a", "Login", "© 2024", "<p>"):
+        assert junk not in text
+
+def test_select_evidence_keeps_relevant_passages_within_budget():
+    pages = [{"source": "s", "url": "http://x", "html": PAGE}]
+    out = select_evidence("inverted yield curve recessions", pages, token_budget=100)
+    assert len(out) == 1 and out[0]["url"] == "http://x"
+    content = out[0]["content"]
+    assert "preceded recessions" in content
+    assert "Cookie policy" not in content
+    assert "happens when short-term" not in content  # no cabe en el presupuesto
+
+def test_split_passages_keeps_the_tail_of_long_sentences():
+    sentence = " ".join(f"palabra{i}" for i in range(300)) + " final"  # ~2.7k caracteres sin punto
+    parts = split_passages(sentence, max_chars=700)
+    assert all(len(p) <= 700 for p in parts)
+    assert " ".join(parts).split() == sentence.split()